@@ -1,12 +1,9 @@
-import json
+import asyncio
 import logging
-import os
-import pathlib
-import time
 from contextlib import asynccontextmanager
 
 from cryptography.fernet import Fernet
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from starlette.responses import RedirectResponse
@@ -14,9 +11,22 @@ from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR, HTTP_403_FORBIDDEN,
 
 from app.config import Settings, get_settings
 from app.libs.constants import ResponseStatusCodeEnum, get_response_message
-from app.libs.ctrl.db.mongodb import initialize_database
-from app.libs.custom import cus_print
+from app.libs.ctrl.db.mongodb import initialize_database, load_database_models, check_models_fully
+from app.libs.ctrl.db.redis import initialize_redis_pool, close_redis_pool
+from app.libs.ctrl.storage import initialize_object_store, close_object_store
+from app.libs.custom import cus_print, compile_templates
+from app.libs.http_with_retry import close_http_clients, warm_up_http_clients
+from app.libs.identity import listen_identity_invalidation
+from app.libs.image_variants import shutdown_image_executor
+from app.libs.log_sink import PartitionedRotatingFileHandler, default_log_dir
+from app.libs.metrics import MetricsMiddleware, flush_metrics_periodically, remove_metrics_snapshot
+from app.libs.request_log import (
+    JsonFormatter, RequestLogSampler, RequestLogMiddleware, start_request_log_listener, stop_request_log_listener
+)
 from app.libs.sso import SSOProviderEnum
+from app.libs.sso.azure import GRAPH_ME_URL, listen_user_profile_invalidation
+from app.libs.startup import FirstRequestMiddleware, startup
+from app.libs.tracing import TracingMiddleware, shutdown_tracing
 from app.response import ResponseModel
 
 __all__ = (
@@ -27,14 +37,6 @@ __all__ = (
 )
 
 
-class JsonFormatter(logging.Formatter):
-    def format(self, record):
-        # 如果传入的是 dict，会自动 dump 成 JSON 字符串
-        if isinstance(record.msg, dict):
-            record.msg = json.dumps(record.msg, ensure_ascii=False)
-        return super().format(record)
-
-
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     """
@@ -47,54 +49,68 @@ async def lifespan(_: FastAPI):
     if not get_settings().ENCRYPT_KEY:
         cus_print(f'Encrypt Key: {Fernet.generate_key().decode("utf-8")}, Please save it in config file', 'p')
     print('Load Core Application...')
-    client = await initialize_database()
+    # 数据库、Redis 与对象存储相互独立, 并发初始化; 任一失败时启动失败
+    client, *_ = await startup.run_concurrently(
+        ('mongo', initialize_database), ('redis', initialize_redis_pool), ('object_store', initialize_object_store)
+    )
+    startup.defer('http_clients', lambda: warm_up_http_clients(GRAPH_ME_URL))
+    startup.defer('templates', lambda: asyncio.to_thread(compile_templates))
+    startup.start_deferred()
+    profile_invalidation_task = asyncio.create_task(listen_user_profile_invalidation())
+    identity_invalidation_task = asyncio.create_task(listen_identity_invalidation())
+    metrics_flush_task = asyncio.create_task(flush_metrics_periodically())
+    # 全量校验与集合大小成正比, 不阻塞启动
+    full_check_task = (
+        asyncio.create_task(check_models_fully(load_database_models())) if get_settings().MONGODB_FULL_CHECK else None
+    )
+    startup.mark_ready()
     print("Startup complete")
     yield
+    startup.mark_stopping()
+    profile_invalidation_task.cancel()
+    identity_invalidation_task.cancel()
+    metrics_flush_task.cancel()
+    if full_check_task:
+        full_check_task.cancel()
+    remove_metrics_snapshot()
     if client:
         client.close()
+    await close_redis_pool()
+    await close_http_clients()
+    shutdown_image_executor()
+    await close_object_store()
+    stop_request_log_listener()
+    shutdown_tracing()
     print("Shutdown complete")
 
 
 def register_middlewares(app: FastAPI, logger: logging.Logger = None):
-    @app.middleware("http")
-    async def log_request_time(request: Request, call_next):
-        start_time = time.time()
-        # 请求信息
-        request_body = await request.body()
-        request_headers = dict(request.headers)
-
-        # 执行请求
-        response: Response = await call_next(request)
-        if request.url.path == '/status':
-            return response
-
-        # 构造日志内容
-        log_data = {
-            "path": request.url.path, "method": request.method,
-            "query_params": dict(request.query_params),
-            "request_body": request_body.decode("utf-8", errors="ignore"),
-            "request_headers": request_headers,
-            "status_code": response.status_code,
-            "process_time_ms": (time.time() - start_time) * 1000,
-        }
-        logger.info(log_data)
-        return response
+    app.add_middleware(RequestLogMiddleware, logger=logger, sampler=RequestLogSampler(
+        get_settings().REQUEST_LOG_SAMPLE_RATE, get_settings().REQUEST_LOG_PATH_SAMPLE_RATES
+    ))
+    app.add_middleware(TracingMiddleware)
+    app.add_middleware(FirstRequestMiddleware)
+    # 最后添加的中间件位于最外层, 延迟统计覆盖日志等其他中间件的耗时
+    app.add_middleware(MetricsMiddleware)
 
 
 def initial_logger(logger: logging.Logger) -> logging.Logger:
     logger.setLevel(logging.INFO)
 
-    # 创建日志目录
-    log_dir = f'{pathlib.Path(__file__).resolve().parent}/statics/logs'
-    os.makedirs(log_dir, exist_ok=True)
-
-    log_file_path = os.path.join(log_dir, 'api-requests.log')
-    handler = logging.FileHandler(log_file_path, mode='a', encoding='utf-8')
+    # 每个 worker 写入独立的分区文件, 按大小与时间轮转, 轮转分段在后台压缩
+    handler = PartitionedRotatingFileHandler(
+        log_dir=get_settings().REQUEST_LOG_DIR or default_log_dir(), name='api-requests',
+        max_bytes=get_settings().REQUEST_LOG_MAX_BYTES,
+        rotate_interval=get_settings().REQUEST_LOG_ROTATE_INTERVAL,
+        backup_count=get_settings().REQUEST_LOG_BACKUP_COUNT,
+        compression=get_settings().REQUEST_LOG_COMPRESSION
+    )
 
     formatter = JsonFormatter('%(message)s')  # 只打印 JSON 内容
     handler.setFormatter(formatter)
 
-    logger.addHandler(handler)
+    # 请求处理只把日志放入内存队列, 文件写入在 QueueListener 的后台线程中进行
+    start_request_log_listener(logger, handler)
     logger.propagate = False  # 不传给上层的 uvicorn logger
 
     return logger
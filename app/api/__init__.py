@@ -1,12 +1,16 @@
 from typing import Annotated
 
 from fastapi import Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.status import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
 
 from app.config import Settings, get_settings
 from app.libs.constants import ResponseStatusCodeEnum, get_response_message, CustomApiRouter
+from app.libs.ctrl.db import get_redis_pool_metrics
+from app.libs.metrics import collect_all_workers
+from app.libs.startup import startup
 from app.libs.sso.azure import get_user_profile
-from app.models.account import UserProfile
-from app.models.common import UserModel
+from app.models.account import UserProfile, user_by_email
 from app.response import ResponseModel
 from app.response.root import StatusResponseData
 
@@ -22,9 +26,10 @@ async def check_runtime_status(
         settings: Annotated[Settings, Depends(get_settings)],
         user_profile: Annotated[UserProfile, Depends(get_user_profile)]
 ):
-    user_instance = await UserModel.find_one(UserModel.email == user_profile.altEmail)
+    user_instance = await user_by_email.get(user_profile.altEmail)
     data = StatusResponseData(
-        name=settings.APP_NAME, sever=True, database=user_instance is not None, redis=True, kafka=True
+        name=settings.APP_NAME, sever=True, database=user_instance is not None, redis=True, kafka=True,
+        redisPool=get_redis_pool_metrics()
     )
     return ResponseModel(
         category=get_settings().APP_NO,
@@ -32,3 +37,14 @@ async def check_runtime_status(
         message=get_response_message(ResponseStatusCodeEnum.OPERATING_SUCCESSFULLY),
         data=data
     )
+
+
+@router.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+async def export_metrics():
+    return PlainTextResponse(await collect_all_workers(), media_type='text/plain; version=0.0.4')
+
+
+@router.get('/ready', include_in_schema=False, description='就绪探针, 关键启动步骤完成前与关闭开始后返回 503')
+async def check_readiness():
+    # 只读取进程内状态, 不访问数据库, 可以高频探测
+    return JSONResponse(startup.report, status_code=HTTP_200_OK if startup.ready else HTTP_503_SERVICE_UNAVAILABLE)
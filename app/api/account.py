@@ -8,7 +8,7 @@ from app.libs.constants import CustomApiRouter
 from app.libs.sso.azure import get_user_profile, generate_sso_login_url
 from app.models.account import UserProfile
 from app.response import ResponseModel
-from app.response import create_response
+from app.response import create_response, create_ndjson_stream_response, BaseCursorPaginationResponseDataType
 from app.response.account import UserInfoListQueryResponseDataItem
 from app.view_models.account import *
 
@@ -62,10 +62,28 @@ async def get_user_info(
 
 
 @router.get(
-    '/users', response_model=ResponseModel[list[UserInfoListQueryResponseDataItem]], description='Get user info list'
+    '/users', response_model=ResponseModel[BaseCursorPaginationResponseDataType[UserInfoListQueryResponseDataItem]],
+    description='Get user info list of the same affiliation, paginated by cursor'
 )
-async def get_user_info_list(request: Request):
-    return await create_response(UserInfoListQueryViewModel, request)
+async def get_user_info_list(
+        request: Request,
+        user_profile: Annotated[UserProfile, Depends(get_user_profile)],
+        cursor: str = Query(None, description='nextCursor returned by the previous page, omit for the first page'),
+        page_size: int = Query(50, alias='pageSize', ge=1, le=500, description='Number of items per page'),
+):
+    return await create_response(UserInfoListQueryViewModel, request, user_profile, cursor, page_size)
+
+
+@router.get(
+    '/users/stream', description='Stream all users of the same affiliation as NDJSON, one user per line'
+)
+async def stream_user_info_list(
+        request: Request,
+        user_profile: Annotated[UserProfile, Depends(get_user_profile)]
+):
+    return await create_response(
+        UserInfoListStreamViewModel, request, user_profile, response_handler=create_ndjson_stream_response
+    )
 
 
 @router.get('/v-code')
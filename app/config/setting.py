@@ -21,11 +21,46 @@ class Settings(BaseSettings):
     ENCRYPT_KEY: str | None
     FRONTEND_DOMAIN: str
 
+    REQUEST_LOG_QUEUE_SIZE: int = 10000
+    REQUEST_LOG_BODY_MAX_BYTES: int = 2048
+    REQUEST_LOG_HEADERS: str = 'user-agent,content-type,content-length,referer,x-forwarded-for,x-request-id'
+    REQUEST_LOG_SAMPLE_RATE: float = 1.0
+    REQUEST_LOG_PATH_SAMPLE_RATES: str | None = '/status=0,/metrics=0,/ready=0'
+    REQUEST_LOG_DIR: str | None = None
+    REQUEST_LOG_MAX_BYTES: int = 100 * 1024 * 1024
+    REQUEST_LOG_ROTATE_INTERVAL: int = 60 * 60 * 24
+    REQUEST_LOG_BACKUP_COUNT: int = 30
+    REQUEST_LOG_COMPRESSION: str = 'gzip'
+
+    METRICS_DIR: str | None = None
+    METRICS_FLUSH_INTERVAL: int = 5
+
+    TRACING_EXPORTER: str = 'none'
+    TRACING_SERVER_TIMING: bool = False
+
+    STARTUP_DEFER_WARMUPS: bool = False
+
+    HTTP_CLIENT_TIMEOUT: float = 10
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_CLIENT_KEEPALIVE_EXPIRY: float = 30
+    HTTP_CLIENT_HTTP2: bool = False
+    HTTP_RETRY_BACKOFF_BASE: float = 0.2
+    HTTP_RETRY_BACKOFF_MAX: float = 5
+    HTTP_RETRY_BUDGET_RATIO: float = 0.2
+    HTTP_RETRY_BUDGET_MAX: float = 10
+    HTTP_BREAKER_FAILURE_THRESHOLD: int = 5
+    HTTP_BREAKER_RESET_TIMEOUT: float = 30
+
     REDIS_HOST: str
     REDIS_PORT: int
     REDIS_CLUSTER_NODE: str | None
     REDIS_USERNAME: str = 'default'
     REDIS_PASSWORD: str
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5
+    REDIS_SOCKET_TIMEOUT: float = 5
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
 
     MONGODB_USERNAME: str
     MONGODB_PASSWORD: str
@@ -33,6 +68,16 @@ class Settings(BaseSettings):
     MONGODB_DB: str
     MONGODB_PORT: int
     MONGODB_AUTHENTICATION_SOURCE: str
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 0
+    MONGODB_MAX_IDLE_TIME_MS: int = 0
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 0
+    MONGODB_COMPRESSORS: str = ''
+    MONGODB_READ_PREFERENCE: str = 'primary'
+    MONGODB_STARTUP_PROBE_TIMEOUT: float = 10
+    MONGODB_FULL_CHECK: bool = False
+    MONGODB_QUERY_PLAN_CHECK: bool = False
+    MONGODB_BULK_BATCH_SIZE: int = 1000
 
     MYSQL_USERNAME: str
     MYSQL_PASSWORD: str
@@ -52,6 +97,18 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str
     SMTP_PORT: int
 
+    SIGNED_URL_CACHE_SIZE: int = 4096
+    SIGNED_URL_SAFETY_MARGIN: int = 30
+
+    OBJECT_STORAGE_BACKEND: str = 'azure'
+    LOCAL_STORAGE_ROOT: str | None = None
+    LOCAL_STORAGE_URL_PREFIX: str = '/statics/objects'
+    UPLOAD_CONTENT_ADDRESSED: bool = False
+    IMAGE_VARIANT_WIDTHS: str = ''
+    IMAGE_VARIANT_FORMATS: str = 'webp'
+    IMAGE_VARIANT_QUALITY: int = 80
+    IMAGE_VARIANT_WORKERS: int = 2
+
     ALI_OSS_ACCESS_KEY: str | None = None
     ALI_OSS_ACCESS_SECRET: str | None = None
     ALI_OSS_REGION: str | None = None
@@ -60,12 +117,21 @@ class Settings(BaseSettings):
     AZURE_BLOB_ACCOUNT_NAME: str | None = None
     AZURE_BLOB_ACCESS_TOKEN: str | None = None
     AZURE_BLOB_CONTAINER_NAME: str | None = None
+    AZURE_BLOB_BLOCK_SIZE: int = 4 * 1024 * 1024
+    AZURE_BLOB_UPLOAD_CONCURRENCY: int = 4
 
     SSO_AZURE_CLIENT_ID: str
     SSO_AZURE_CLIENT_SECRET: str
     SSO_AZURE_CALLBACK_PATH: str
     SSO_AZURE_REDIRECT_URI: AnyHttpUrl
     SSO_AZURE_BASE_URL: AnyHttpUrl
+    SSO_PROFILE_LOCAL_CACHE_SIZE: int = 1024
+    SSO_PROFILE_LOCAL_CACHE_TTL: int = 60
+    SSO_PROFILE_FETCH_LOCK_LEASE_MS: int = 3000
+
+    IDENTITY_LOCAL_CACHE_SIZE: int = 4096
+    IDENTITY_LOCAL_CACHE_TTL: int = 5
+    IDENTITY_REDIS_CACHE_TTL: int = 60
 
     class Config:
         env_file = f'{pathlib.Path(__file__).resolve().parent.parent.parent}/.env'
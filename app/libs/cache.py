@@ -0,0 +1,156 @@
+"""
+进程内缓存工具
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, TypeVar
+
+__all__ = (
+    'LocalTTLCache',
+    'SingleFlight',
+    'SignedUrlCache',
+)
+
+V = TypeVar('V')
+
+
+class LocalTTLCache(Generic[V]):
+    """
+    进程内 LRU + TTL 缓存\n
+    条目数达到 max_size 时淘汰最久未使用的条目, 过期条目在读取时惰性删除\n
+    仅供单个事件循环内使用, 不做线程同步
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, count: bool = True) -> V | None:
+        if (item := self._data.get(key)) is None:
+            self.misses += count
+            return None
+        expire_at, value = item
+        if expire_at < time.monotonic():
+            del self._data[key]
+            self.misses += count
+            return None
+        self._data.move_to_end(key)
+        self.hits += count
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: float = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> V | None:
+        item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self):
+        self._data.clear()
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class SingleFlight(Generic[V]):
+    """
+    同一个 key 的并发调用合并为一次执行\n
+    func 在独立的任务中执行, 所有调用者 (包括发起者) 等待同一个结果 (或同一个异常);
+    任一调用者被取消 (例如客户端断开) 只影响它自己, 不会中断其他调用者共享的执行
+    """
+
+    def __init__(self):
+        self.fresh = 0
+        self.coalesced = 0
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[V]]) -> V:
+        if (task := self._calls.get(key)) is not None:
+            self.coalesced += 1
+        else:
+            self.fresh += 1
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda t: self._done(key, t))
+        # shield 保证某个等待者被取消时不会连带取消共享的任务
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待者都已取消时异常不会被读取, 这里标记为已读取, 避免 "exception was never retrieved" 告警
+        if not task.cancelled():
+            task.exception()
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            'in_flight': len(self._calls),
+            'fresh': self.fresh,
+            'coalesced': self.coalesced,
+        }
+
+
+class SignedUrlCache:
+    """
+    签名 URL 缓存, 以 (provider, object, permission, expires) 为 key, 不同有效期的签名互不复用
+
+    签名函数接收过期时间戳并返回 URL, 缓存的 URL 在距过期不足 safety_margin 秒时失效重新签名,
+    有效期不超过 safety_margin 的签名不缓存
+    """
+
+    def __init__(self, max_size: int = 4096, safety_margin: float = 30):
+        self.safety_margin = safety_margin
+        self._cache: LocalTTLCache[str] = LocalTTLCache(max_size=max_size)
+
+    def get_or_sign(
+            self, provider: str, object_name: str, permission: str, expires: int, sign: Callable[[int], str],
+            now: float = None
+    ) -> str:
+        key = (provider, object_name, permission, expires)
+        if (url := self._cache.get(key)) is not None:
+            return url
+        expire_at = int(now or time.time()) + expires
+        url = sign(expire_at)
+        if expires > self.safety_margin:
+            self._cache.set(key, url, ttl=expires - self.safety_margin)
+        return url
+
+    def sign_many(
+            self, provider: str, object_names: Iterable[str], permission: str, expires: int,
+            sign: Callable[[str, int], str]
+    ) -> list[str]:
+        """批量签名, 同一批次共用一个时间基准, 只对未命中缓存的对象计算签名"""
+        now = time.time()
+        return [
+            self.get_or_sign(provider, name, permission, expires, lambda expire_at: sign(name, expire_at), now)
+            for name in object_names
+        ]
+
+    def invalidate(self, provider: str, object_name: str, permission: str, expires: int):
+        self._cache.pop((provider, object_name, permission, expires))
+
+    @property
+    def metrics(self) -> dict:
+        return self._cache.metrics
@@ -2,13 +2,39 @@ import abc
 import socket
 import uuid
 
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.libs.cache import SignedUrlCache
 from app.libs.ctrl import BaseDataProcess
+from app.libs.metrics import registry
 
 __all__ = (
     'BaseCloudProviderController',
+    'CloudObjectStat',
+    'signed_url_cache',
     'AzureBlobController',
     'AzureBlobUploadResult',
+    'get_blob_container_client',
+    'initialize_blob_storage',
+    'close_blob_storage',
+    'blob_access_url_prefix',
+    'generate_blob_access_url',
+)
+
+
+# Azure SAS 与 OSS 预签名 URL 共用, 列表接口中反复出现的同一对象不必重复签名
+signed_url_cache = SignedUrlCache(
+    max_size=get_settings().SIGNED_URL_CACHE_SIZE, safety_margin=get_settings().SIGNED_URL_SAFETY_MARGIN
 )
+registry.register_collector('signed_url_cache', lambda: signed_url_cache.metrics)
+
+
+class CloudObjectStat(BaseModel):
+    """对象存储中单个对象的元信息, 用于在读取内容前确定长度与 Range"""
+    size: int
+    content_type: str | None = None
+    etag: str | None = None
 
 
 class BaseCloudProviderController(BaseDataProcess):
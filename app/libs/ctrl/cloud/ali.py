@@ -1,7 +1,8 @@
 import abc
 import base64
 import math
-from typing import List
+from typing import AsyncIterable, AsyncIterator, List
+from xml.etree import ElementTree
 
 import alibabacloud_alb20200616.models as alb_models
 from Tea.exceptions import TeaException
@@ -19,12 +20,12 @@ from alibabacloud_sts20150401.client import Client as StsClient
 from alibabacloud_tea_openapi.models import Config
 from alibabacloud_tea_util.models import RuntimeOptions
 from aliyunsdkcore.acs_exception.exceptions import ClientException
-from oss2 import Bucket, Auth, CaseInsensitiveDict, models as oss_models
-from oss2.exceptions import NoSuchKey
-from starlette.concurrency import run_in_threadpool
+from httpx import HTTPStatusError
+from oss2 import Bucket, Auth
 
 from app.config import get_settings
-from app.libs.ctrl.cloud import BaseCloudProviderController
+from app.libs.ctrl.cloud import BaseCloudProviderController, CloudObjectStat, signed_url_cache
+from app.libs.ctrl.cloud.oss import AsyncOssBucket, OssGetObjectResult, OssPutObjectResult
 from app.models import SupportImageMIMEType, SupportDataMIMEType
 
 # 使用环境变量中获取的RAM用户的访问密钥配置访问凭证。
@@ -32,6 +33,8 @@ __all__ = (
     'AliCloudOssBucketController',
 )
 
+OSS_STREAM_CHUNK_SIZE = 256 * 1024
+
 from app.models.events import EventModel, DomainModeEnum
 
 
@@ -400,6 +403,12 @@ class AliCloudSTSController(BaseAliCloudProviderController, StsClient):
             return -1
 
 
+async def _enumerate_async(items: AsyncIterable, start: int = 0) -> AsyncIterator[tuple[int, object]]:
+    async for item in items:
+        yield start, item
+        start += 1
+
+
 class AliCloudOssBucketController(BaseAliCloudProviderController, Bucket):
 
     def __init__(self, result: list | dict = None):
@@ -408,6 +417,11 @@ class AliCloudOssBucketController(BaseAliCloudProviderController, Bucket):
             region_id=get_settings().ALI_OSS_REGION, result=result
         )
         self.bucket_name = get_settings().ALI_OSS_BUCKET_NAME
+        # 对象读写与签名走原生异步客户端, 创建时不产生网络请求, 不需要先 login;
+        # oss2 的同步接口仅保留给其他低频操作, 在 login 中初始化
+        self.async_bucket = AsyncOssBucket(
+            self._access_key, self._access_secret, self.bucket_name, f'oss-{self._region_id}.aliyuncs.com'
+        )
 
     @property
     def access_url_prefix(self) -> str:
@@ -423,28 +437,83 @@ class AliCloudOssBucketController(BaseAliCloudProviderController, Bucket):
             endpoint=f'oss-{self._region_id}.aliyuncs.com', region=self._region_id
         )
 
-    async def get_bucket_info_async(self) -> oss_models.GetBucketInfoResult:
-        result: oss_models.GetBucketInfoResult = await run_in_threadpool(self.get_bucket_info)
-        return result if result.status == 200 else None
+    async def get_bucket_info_async(self) -> dict | None:
+        return await self.async_bucket.get_bucket_info()
 
-    async def put_object_with_public_read_async(self, file_path: str, body: bytes) -> oss_models.PutObjectResult:
+    async def put_object_with_public_read_async(self, file_path: str, body: bytes) -> OssPutObjectResult | None:
         return await self.put_object_async(file_path, body, headers={'x-oss-object-acl': 'public-read'})
 
-    async def put_object_async(self, file_path: str, body: bytes, headers: dict = None) -> oss_models.PutObjectResult:
-        request_headers = CaseInsensitiveDict()
-        request_headers.setdefault('Content-Disposition', 'inline')
-        if headers:
-            request_headers.update(headers)
-        result = await run_in_threadpool(self.put_object, key=file_path, data=body, headers=request_headers)
-        return result if result.status == 200 else None
-
-    async def get_object_async(self, file_path: str, headers: dict = None) -> oss_models.GetObjectResult:
-        request_headers = CaseInsensitiveDict()
-        request_headers.setdefault('response-content-disposition', 'inline')
-        if headers:
-            request_headers |= headers
-        result = await run_in_threadpool(self.get_object, key=file_path, headers=request_headers)
-        return result if result.status == 200 else None
+    async def put_object_async(self, file_path: str, body: bytes, headers: dict = None) -> OssPutObjectResult | None:
+        request_headers = {'Content-Disposition': 'inline'} | (headers or {})
+        result = await self.async_bucket.put_object(file_path, body, headers=request_headers)
+        return OssPutObjectResult(result) if result.status_code == 200 else None
+
+    async def put_object_multipart_async(
+            self, file_path: str, parts: AsyncIterable[bytes], headers: dict = None
+    ) -> OssPutObjectResult | None:
+        """
+        分片上传, 内存中只保留当前分片; 任一分片失败时中止上传, 不留下未合并的分片\n
+        :param parts: 按顺序产出的分片, 除最后一片外不小于 100 KiB
+        """
+        request_headers = {'Content-Disposition': 'inline'} | (headers or {})
+        upload_id = await self.async_bucket.initiate_multipart_upload(file_path, headers=request_headers)
+        try:
+            etags = [
+                await self.async_bucket.upload_part(file_path, upload_id, number, part)
+                async for number, part in _enumerate_async(parts, start=1)
+            ]
+            # 禁止覆盖等条件在合并时再次校验
+            result = await self.async_bucket.complete_multipart_upload(
+                file_path, upload_id, etags,
+                headers={k: v for k, v in request_headers.items() if k.lower().startswith('x-oss-forbid')}
+            )
+        except BaseException:
+            await self.async_bucket.abort_multipart_upload(file_path, upload_id)
+            raise
+        if result.status_code != 200:
+            await self.async_bucket.abort_multipart_upload(file_path, upload_id)
+            return None
+        put_result = OssPutObjectResult(result)
+        # 合并结果的 ETag 在响应体中
+        put_result.etag = put_result.etag or (ElementTree.fromstring(result.content).findtext('ETag') or '').strip('"')
+        return put_result
+
+    async def get_object_async(self, file_path: str, headers: dict = None) -> OssGetObjectResult | None:
+        result = await self.async_bucket.get_object(
+            file_path, headers=headers, params={'response-content-disposition': 'inline'}
+        )
+        return OssGetObjectResult(result) if result.status_code == 200 else None
+
+    async def get_object_stat_async(self, file_path: str) -> CloudObjectStat | None:
+        """获取对象的长度与类型, 对象不存在时返回 None"""
+        result = await self.async_bucket.head_object(file_path)
+        if result.status_code != 200:
+            return None
+        return CloudObjectStat(
+            size=int(result.headers.get('content-length', 0)), content_type=result.headers.get('content-type'),
+            etag=result.headers.get('etag')
+        )
+
+    async def iter_object_async(
+            self, file_path: str, offset: int = 0, length: int = None, chunk_size: int = OSS_STREAM_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """按块流式读取对象, 可指定起始位置与长度"""
+        if length == 0:
+            return
+        async for chunk in self.async_bucket.iter_object(file_path, offset, length, chunk_size):
+            yield chunk
+
+    async def iter_object_with_base64_async(
+            self, file_path: str, chunk_size: int = OSS_STREAM_CHUNK_SIZE
+    ) -> AsyncIterator[str]:
+        """流式输出对象内容的 Base64 编码, 分块长度对齐到 3 字节, 拼接结果与整体编码一致"""
+        remainder = b''
+        async for chunk in self.iter_object_async(file_path, chunk_size=chunk_size):
+            chunk = remainder + chunk
+            aligned = len(chunk) - len(chunk) % 3
+            remainder = chunk[aligned:]
+            yield base64.b64encode(chunk[:aligned]).decode('utf-8')
+        yield base64.b64encode(remainder).decode('utf-8')
 
     async def get_object_with_base64_async(
             self, file_path: str, file_type: (SupportImageMIMEType | SupportDataMIMEType)
@@ -455,19 +524,42 @@ class AliCloudOssBucketController(BaseAliCloudProviderController, Bucket):
             avatar_type = SupportImageMIMEType.check_value_exists(file_type.value)
             if all([not avatar_type]):
                 return ''
-            result: oss_models.GetObjectResult = await run_in_threadpool(self.get_object, key=file_path)
-            file_object = result.stream.read()
-            # 将PDF字节内容编码为Base64字符串
-            pdf_base64 = base64.b64encode(file_object)
-            # 将字节对象转换为字符串（如果需要）
-            pdf_base64_str = pdf_base64.decode('utf-8')
-            return f'data:{file_type.value};base64,{pdf_base64_str}'
-        except NoSuchKey:
+            # 边读边编码, 不再同时持有完整的原始内容与编码结果
+            content = ''.join([chunk async for chunk in self.iter_object_with_base64_async(file_path)])
+            return f'data:{file_type.value};base64,{content}'
+        except HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
             return f'data:{file_type.value};base64,'
 
+    async def delete_object_async(self, file_path: str) -> bool:
+        result = await self.async_bucket.delete_object(file_path)
+        return result.status_code == 204
+
+    async def iter_object_keys_async(self, prefix: str = '') -> AsyncIterator[str]:
+        """逐页列举以 prefix 开头的对象名"""
+        marker = ''
+        while marker is not None:
+            keys, marker = await self.async_bucket.list_objects(prefix, marker)
+            for key in keys:
+                yield key
+
+    def generate_object_access_url(self, file_path: str, expire: int = 60) -> str:
+        return signed_url_cache.get_or_sign(
+            'ali_oss', file_path, 'GET', expire,
+            lambda expire_at: self.async_bucket.sign_url('GET', file_path, expire, expire_at=expire_at)
+        )
+
     async def generate_object_access_url_async(self, file_path: str, expire: int = 60):
-        signed_url = await run_in_threadpool(self.sign_url, method='GET', key=file_path, expires=expire)
-        return signed_url
+        # 签名为纯本地计算, 保留 async 接口以兼容已有调用
+        return self.generate_object_access_url(file_path, expire)
+
+    async def generate_object_access_urls_async(self, file_paths: list[str], expire: int = 60) -> list[str]:
+        """列表接口批量生成预签名 URL"""
+        return signed_url_cache.sign_many(
+            'ali_oss', file_paths, 'GET', expire,
+            lambda file_path, expire_at: self.async_bucket.sign_url('GET', file_path, expire, expire_at=expire_at)
+        )
 
 
 class AliCloudALBController(BaseAliCloudProviderController, AlbClient):
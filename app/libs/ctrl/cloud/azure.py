@@ -1,26 +1,128 @@
 import abc
-from datetime import datetime, timedelta
-from typing import Union
+import asyncio
+import base64
+import hashlib
+import inspect
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Union
 
-from azure.core.exceptions import AzureError
-from azure.storage.blob import BlobSasPermissions, generate_blob_sas
+from azure.core import MatchConditions
+from azure.core.exceptions import AzureError, ResourceNotFoundError
+from azure.storage.blob import BlobBlock, BlobSasPermissions, ContentSettings, generate_blob_sas
 from azure.storage.blob.aio import BlobServiceClient, ContainerClient
 from pydantic import BaseModel
 
 from app.config import get_settings  # 假设有一个 settings 文件
-from app.libs.ctrl.cloud import BaseCloudProviderController
+from app.libs.ctrl.cloud import BaseCloudProviderController, CloudObjectStat, signed_url_cache
+from app.libs.tracing import traced
 
 __all__ = (
     'AzureBlobController',
     'AzureBlobUploadResult',
+    'get_blob_container_client',
+    'initialize_blob_storage',
+    'close_blob_storage',
+    'blob_access_url_prefix',
+    'generate_blob_access_url',
 )
 
+SAS_URL_EXPIRES = 60 * 60  # 1 小时有效
+
+_blob_service_client: BlobServiceClient | None = None
+_container_client: ContainerClient | None = None
+
 
 class AzureBlobUploadResult(BaseModel):
     etag: str
     content_md5: str
 
 
+def get_blob_container_client() -> ContainerClient:
+    """
+    获取进程内共享的容器客户端, 首次调用时创建, 不产生网络请求
+
+    所有上传、删除复用同一个 BlobServiceClient 的连接池
+    """
+    global _blob_service_client, _container_client
+    if _container_client is None:
+        _blob_service_client = BlobServiceClient(
+            f'https://{get_settings().AZURE_BLOB_ACCOUNT_NAME}.blob.core.windows.net',
+            credential=get_settings().AZURE_BLOB_ACCESS_TOKEN
+        )
+        _container_client = _blob_service_client.get_container_client(get_settings().AZURE_BLOB_CONTAINER_NAME)
+    return _container_client
+
+
+@traced('azure_blob.connect')
+async def initialize_blob_storage():
+    """由 lifespan 在启动时调用一次, 检查容器是否可访问; 未配置 Azure Blob 时跳过"""
+    if not get_settings().AZURE_BLOB_ACCOUNT_NAME or not get_settings().AZURE_BLOB_CONTAINER_NAME:
+        print('Azure Blob storage is not configured, skipped')
+        return
+    try:
+        await get_blob_container_client().get_container_properties()
+        print(f'Connected to container: {get_settings().AZURE_BLOB_CONTAINER_NAME}')
+    except AzureError as e:
+        raise ConnectionError(f'Failed to connect to Azure Blob container: {e}')
+
+
+async def close_blob_storage():
+    global _blob_service_client, _container_client
+    if _blob_service_client is not None:
+        await _blob_service_client.close()
+    _blob_service_client = _container_client = None
+
+
+async def iter_blocks(source: AsyncIterable[bytes] | BinaryIO, block_size: int) -> AsyncIterator[bytes]:
+    """
+    把异步字节迭代器或文件对象 (read 可以是同步或异步方法, 例如 UploadFile) 重新切分为固定大小的块
+
+    除最后一块外每块都恰好为 block_size; 文件对象的 read 在 EOF 之前也可能返回不足的数据 (socket、管道等),
+    这里持续读取直到凑满一块或读到 EOF
+    """
+    if hasattr(source, 'read'):
+        eof = False
+        while not eof:
+            block = bytearray()
+            while len(block) < block_size:
+                chunk = source.read(block_size - len(block))
+                if inspect.isawaitable(chunk):
+                    chunk = await chunk
+                if not chunk:
+                    eof = True
+                    break
+                block.extend(chunk)
+            if block:
+                yield bytes(block)
+        return
+    buffer = bytearray()
+    async for chunk in source:
+        buffer.extend(chunk)
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _chain_blocks(head: tuple[bytes, ...], rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    for block in head:
+        yield block
+    async for block in rest:
+        yield block
+
+
+def blob_access_url_prefix() -> str:
+    """返回 Blob 容器的访问前缀 URL。"""
+    account_name, container_name = get_settings().AZURE_BLOB_ACCOUNT_NAME, get_settings().AZURE_BLOB_CONTAINER_NAME
+    return f'https://{account_name}.blob.core.windows.net/{container_name}'
+
+
+def generate_blob_access_url(blob_name: str) -> str:
+    """纯字符串拼接, 不需要连接 Azure"""
+    return f'{blob_access_url_prefix()}/{blob_name}'
+
+
 class BaseAzureProviderController(BaseCloudProviderController):
     def __init__(self, result: list | dict):
         """
@@ -41,39 +143,30 @@ class BaseAzureProviderController(BaseCloudProviderController):
         pass
 
 
-class AzureBlobController(BaseAzureProviderController, BlobServiceClient):
+class AzureBlobController(BaseAzureProviderController):
     def __init__(self, result: Union[list, dict] = None):
         # 初始化基类
         BaseAzureProviderController.__init__(self, result=result)
-        self.container_client: ContainerClient = None
+        # 复用进程内共享的容器客户端, 容器可用性已在启动时检查过
+        self.container_client: ContainerClient = get_blob_container_client()
 
     @property
     def access_url_prefix(self) -> str:
         """返回 Blob 容器的访问前缀 URL。"""
-        return f'https://{self.account_name}.blob.core.windows.net/{self.container_name}'
+        return blob_access_url_prefix()
 
     async def __aenter__(self):
-        await self.login()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.container_client.close()
-        await self.close()
+        # 共享客户端由 lifespan 关闭, 这里不做任何处理
+        return False
 
     async def login(self):
-        """登录并初始化容器客户端。"""
-        try:
-            # 检查容器是否存在
-            # 调用 BlobServiceClient 初始化
-            BlobServiceClient.__init__(
-                self, f'https://{self.account_name}.blob.core.windows.net', credential=self.access_token
-            )
-            self.container_client = self.get_container_client(self.container_name)
-            await self.container_client.get_container_properties()
-            print(f'Connected to container: {self.container_name}')
-        except AzureError as e:
-            raise ConnectionError(f'Failed to connect to Azure Blob container: {e}')
+        """共享客户端在 initialize_blob_storage 中完成检查, 无需每次登录"""
+        pass
 
+    @traced('azure_blob.upload')
     async def upload_file(self, file_path: str, data: bytes | str, overwrite: bool = True) -> AzureBlobUploadResult:
         """
         上传 Blob 文件到指定容器的多级路径下。
@@ -92,6 +185,75 @@ class AzureBlobController(BaseAzureProviderController, BlobServiceClient):
         except AzureError as e:
             raise RuntimeError(f'Failed to upload blob "{file_path}": {e}')
 
+    @traced('azure_blob.upload_stream')
+    async def upload_stream(
+            self, file_path: str, source: AsyncIterable[bytes] | BinaryIO, overwrite: bool = True,
+            content_type: str = None
+    ) -> AzureBlobUploadResult:
+        """
+        流式分块上传, 内存占用只与块大小和并发数有关, 与文件大小无关
+
+        按 AZURE_BLOB_BLOCK_SIZE 切块, 最多 AZURE_BLOB_UPLOAD_CONCURRENCY 个块并行 stage_block, 全部完成后提交块列表;
+        只有一个块时直接 upload_blob, 省去一次提交请求
+
+        :param file_path: 包含路径结构的 Blob 名称
+        :param source: 异步字节迭代器, 或同步/异步 read 的文件对象
+        :param overwrite: 是否覆盖已存在的 Blob
+        :param content_type: Blob 的 Content-Type
+        :return: content_md5 为整个文件 MD5 的 base64 编码
+        """
+        block_size = get_settings().AZURE_BLOB_BLOCK_SIZE
+        semaphore = asyncio.Semaphore(get_settings().AZURE_BLOB_UPLOAD_CONCURRENCY)
+        blob_client = self.container_client.get_blob_client(file_path)
+        md5 = hashlib.md5()
+        block_ids: list[str] = []
+        tasks: list[asyncio.Task] = []
+
+        async def stage(block_id: str, block: bytes):
+            try:
+                await blob_client.stage_block(block_id, block, length=len(block))
+            finally:
+                semaphore.release()
+
+        try:
+            blocks = iter_blocks(source, block_size)
+            first_block = await anext(blocks, b'')
+            # 以能否读到第二块判断是否已到 EOF, 不根据第一块的长度推断
+            second_block = await anext(blocks, None)
+            if second_block is None:
+                md5.update(first_block)
+                upload_result = await blob_client.upload_blob(
+                    first_block, overwrite=overwrite,
+                    content_settings=ContentSettings(content_type=content_type, content_md5=md5.digest())
+                )
+            else:
+                async for block in _chain_blocks((first_block, second_block), blocks):
+                    md5.update(block)
+                    # 先拿到并发名额再读取下一块, 同时在内存中的块数量受并发数限制
+                    await semaphore.acquire()
+                    block_id = base64.b64encode(f'{len(block_ids):08d}'.encode()).decode()
+                    block_ids.append(block_id)
+                    tasks.append(asyncio.create_task(stage(block_id, block)))
+                    # 尽早暴露已失败的分块, 不必等全部读完
+                    if failed := next((t for t in tasks if t.done() and t.exception()), None):
+                        raise failed.exception()
+                await asyncio.gather(*tasks)
+                upload_result = await blob_client.commit_block_list(
+                    [BlobBlock(block_id) for block_id in block_ids],
+                    content_settings=ContentSettings(content_type=content_type, content_md5=md5.digest()),
+                    **({} if overwrite else {'etag': '*', 'match_condition': MatchConditions.IfMissing})
+                )
+            return AzureBlobUploadResult(
+                etag=upload_result.get('etag', ''),
+                content_md5=base64.b64encode(md5.digest()).decode()
+            )
+        except AzureError as e:
+            raise RuntimeError(f'Failed to upload blob "{file_path}": {e}')
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @traced('azure_blob.delete')
     async def delete_file(self, file_path: str) -> bool:
         """
         上传 Blob 文件到指定容器的多级路径下。
@@ -107,16 +269,51 @@ class AzureBlobController(BaseAzureProviderController, BlobServiceClient):
         finally:
             return True
 
-    def generate_access_url(self, blob_name) -> str:
-        return f'{self.access_url_prefix}/{blob_name}'
+    @traced('azure_blob.stat')
+    async def get_file_stat(self, file_path: str) -> CloudObjectStat | None:
+        """获取 Blob 的长度与类型, Blob 不存在时返回 None"""
+        try:
+            properties = await self.container_client.get_blob_client(file_path).get_blob_properties()
+        except ResourceNotFoundError:
+            return None
+        return CloudObjectStat(
+            size=properties.size, content_type=properties.content_settings.content_type, etag=properties.etag
+        )
+
+    async def iter_file(self, file_path: str, offset: int = 0, length: int = None) -> AsyncIterator[bytes]:
+        """按块流式读取 Blob, 可指定起始位置与长度, 同一时刻只在内存中保留一个分块"""
+        if length == 0:
+            return
+        downloader = await self.container_client.get_blob_client(file_path).download_blob(offset=offset, length=length)
+        async for chunk in downloader.chunks():
+            yield chunk
+
+    @traced('azure_blob.read')
+    async def read_file(self, file_path: str) -> bytes:
+        downloader = await self.container_client.get_blob_client(file_path).download_blob()
+        return await downloader.readall()
+
+    @staticmethod
+    def generate_access_url(blob_name) -> str:
+        return generate_blob_access_url(blob_name)
+
+    def generate_sas_url(self, blob_name, expires: int = SAS_URL_EXPIRES) -> str:
+        """生成只读 SAS URL, 在距过期不足安全余量之前复用缓存中的 URL"""
+        return signed_url_cache.get_or_sign(
+            'azure', blob_name, 'r', expires, lambda expire_at: self.sign_sas_url(blob_name, expire_at)
+        )
+
+    def generate_sas_urls(self, blob_names: list[str], expires: int = SAS_URL_EXPIRES) -> list[str]:
+        """列表接口批量生成 SAS URL"""
+        return signed_url_cache.sign_many('azure', blob_names, 'r', expires, self.sign_sas_url)
 
-    def generate_sas_url(self, blob_name) -> str:
+    def sign_sas_url(self, blob_name: str, expire_at: int) -> str:
         sas_token = generate_blob_sas(
             account_name=self.account_name,
             account_key=self.access_token,
             container_name=self.container_name,
             blob_name=blob_name,
             permission=BlobSasPermissions(read=True),
-            expiry=datetime.now() + timedelta(hours=1)  # 1 小时有效
+            expiry=datetime.fromtimestamp(expire_at, tz=timezone.utc)
         )
         return f'{self.access_url_prefix}/{blob_name}?{sas_token}'
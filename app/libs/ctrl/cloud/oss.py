@@ -0,0 +1,216 @@
+"""
+阿里云 OSS 原生异步客户端: 本地完成 V1 (HMAC-SHA1) 签名, 请求走 http_with_retry 中按 host 共享的 httpx 连接池\n
+不再经过 run_in_threadpool, 并发上传不会占满 Starlette 的线程池
+"""
+import base64
+import hashlib
+import hmac
+import mimetypes
+import time
+from email.utils import formatdate
+from typing import AsyncIterator
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+from httpx import AsyncClient, Response
+
+from app.libs.http_with_retry import get_http_client
+from app.libs.tracing import span
+
+__all__ = (
+    'AsyncOssBucket',
+    'OssRequestResult',
+    'OssPutObjectResult',
+    'OssGetObjectResult',
+)
+
+# 参与 V1 签名的子资源, 与 oss2.auth.ProviderAuth 保持一致 (只保留本项目会用到的部分)
+OSS_SUBRESOURCE_KEYS = frozenset({
+    'acl', 'bucketInfo', 'stat', 'objectMeta', 'x-oss-process', 'versionId', 'uploads', 'uploadId', 'partNumber',
+    'response-content-type', 'response-content-language', 'response-cache-control',
+    'response-content-encoding', 'response-expires', 'response-content-disposition',
+})
+
+
+class OssRequestResult:
+    """与 oss2.models.RequestResult 保持相同的常用属性, 原有调用方读取 status / resp / request_id 不受影响"""
+
+    def __init__(self, resp: Response):
+        self.resp = resp
+        self.status = resp.status_code
+        self.headers = resp.headers
+        self.request_id = resp.headers.get('x-oss-request-id', '')
+        self.versionid = resp.headers.get('x-oss-version-id')
+
+
+class OssPutObjectResult(OssRequestResult):
+    def __init__(self, resp: Response):
+        super().__init__(resp)
+        self.etag = resp.headers.get('etag', '').strip('"')
+        self.crc = int(crc) if (crc := resp.headers.get('x-oss-hash-crc64ecma')) else None
+
+
+class OssGetObjectResult(OssRequestResult):
+    def __init__(self, resp: Response):
+        super().__init__(resp)
+        self.content_length = int(length) if (length := resp.headers.get('content-length')) else None
+        self.content_range = resp.headers.get('content-range')
+        self.content_type = resp.headers.get('content-type')
+        self.etag = resp.headers.get('etag', '').strip('"')
+        self.last_modified = resp.headers.get('last-modified')
+
+    def read(self, amt: int = None) -> bytes:
+        """响应体已完整读取, amt 只为兼容 oss2 的签名"""
+        return self.resp.content
+
+
+class AsyncOssBucket:
+    """
+    单个 Bucket 的异步访问入口, 实例本身只保存凭证与地址, 创建成本可以忽略\n
+    sign_url 为纯本地计算, 不产生网络请求也不切换线程
+    """
+
+    def __init__(self, access_key: str, access_secret: str, bucket_name: str, endpoint: str, base_url: str = None):
+        self.access_key = access_key
+        self.access_secret = access_secret
+        self.bucket_name = bucket_name
+        self.base_url = (base_url or f'https://{bucket_name}.{endpoint}').rstrip('/')
+
+    @property
+    def client(self) -> AsyncClient:
+        return get_http_client(self.base_url)
+
+    def object_url(self, key: str) -> str:
+        return f'{self.base_url}/{quote(key, safe="/")}'
+
+    def _signature(self, string_to_sign: str) -> str:
+        digest = hmac.new(self.access_secret.encode(), string_to_sign.encode(), hashlib.sha1).digest()
+        return base64.b64encode(digest).decode()
+
+    def _canonical_resource(self, key: str, params: dict | None) -> str:
+        subresources = sorted((k, v) for k, v in (params or {}).items() if k in OSS_SUBRESOURCE_KEYS)
+        query = '&'.join(f'{k}={v}' if v else k for k, v in subresources)
+        return f'/{self.bucket_name}/{key}' + (f'?{query}' if query else '')
+
+    def _string_to_sign(self, method: str, key: str, headers: dict, date: str, params: dict | None) -> str:
+        lower_headers = {k.lower(): str(v) for k, v in headers.items()}
+        oss_headers = ''.join(f'{k}:{v}\n' for k, v in sorted(lower_headers.items()) if k.startswith('x-oss-'))
+        return '\n'.join([
+            method, lower_headers.get('content-md5', ''), lower_headers.get('content-type', ''), date,
+            oss_headers + self._canonical_resource(key, params)
+        ])
+
+    def sign_headers(self, method: str, key: str, headers: dict = None, params: dict = None) -> dict:
+        """返回附带 Date 与 Authorization 的请求头"""
+        headers = dict(headers or {})
+        headers['Date'] = formatdate(usegmt=True)
+        signature = self._signature(self._string_to_sign(method, key, headers, headers['Date'], params))
+        headers['Authorization'] = f'OSS {self.access_key}:{signature}'
+        return headers
+
+    def sign_url(self, method: str, key: str, expires: int, params: dict = None, expire_at: int = None) -> str:
+        """
+        生成预签名 URL\n
+        :param expires: 有效期 (秒)
+        :param expire_at: 指定过期的 Unix 时间戳, 优先于 expires
+        """
+        expire_at = expire_at or int(time.time()) + expires
+        signature = self._signature(self._string_to_sign(method, key, {}, str(expire_at), params))
+        query = {**(params or {}), 'OSSAccessKeyId': self.access_key, 'Expires': str(expire_at), 'Signature': signature}
+        return self.object_url(key) + '?' + '&'.join(
+            f'{quote(k, safe="")}={quote(v, safe="")}' if v else quote(k, safe='') for k, v in query.items()
+        )
+
+    async def request(
+            self, method: str, key: str = '', headers: dict = None, params: dict = None, content: bytes = None
+    ) -> Response:
+        with span('oss', method=method):
+            return await self.client.request(
+                method, self.object_url(key), params=params, content=content,
+                headers=self.sign_headers(method, key, headers, params)
+            )
+
+    async def put_object(self, key: str, data: bytes, headers: dict = None) -> Response:
+        headers = dict(headers or {})
+        # 与 oss2 一致, 未指定时按扩展名推断, 图片与 PDF 在浏览器中可直接预览
+        headers.setdefault('Content-Type', mimetypes.guess_type(key)[0] or 'application/octet-stream')
+        return await self.request('PUT', key, headers=headers, content=data)
+
+    async def initiate_multipart_upload(self, key: str, headers: dict = None) -> str:
+        """创建分片上传, 返回 UploadId; Content-Type 等对象属性在这里指定"""
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', mimetypes.guess_type(key)[0] or 'application/octet-stream')
+        # 与 get_bucket_info 相同, 无值的子资源直接拼在 URL 上
+        with span('oss', method='POST'):
+            response = await self.client.post(
+                f'{self.object_url(key)}?uploads', headers=self.sign_headers('POST', key, headers, {'uploads': ''})
+            )
+        response.raise_for_status()
+        return ElementTree.fromstring(response.content).findtext('UploadId')
+
+    async def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """上传一个分片 (除最后一片外不小于 100 KiB), 返回该分片的 ETag"""
+        headers = {'Content-MD5': base64.b64encode(hashlib.md5(data).digest()).decode()}
+        response = await self.request(
+            'PUT', key, headers=headers, params={'partNumber': str(part_number), 'uploadId': upload_id}, content=data
+        )
+        response.raise_for_status()
+        return response.headers['etag']
+
+    async def complete_multipart_upload(
+            self, key: str, upload_id: str, etags: list[str], headers: dict = None
+    ) -> Response:
+        """按分片编号顺序 (从 1 开始) 合并分片"""
+        parts = ''.join(
+            f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+            for number, etag in enumerate(etags, start=1)
+        )
+        body = f'<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>'.encode()
+        return await self.request('POST', key, headers=headers, params={'uploadId': upload_id}, content=body)
+
+    async def abort_multipart_upload(self, key: str, upload_id: str) -> Response:
+        return await self.request('DELETE', key, params={'uploadId': upload_id})
+
+    async def head_object(self, key: str) -> Response:
+        return await self.request('HEAD', key)
+
+    async def get_object(self, key: str, headers: dict = None, params: dict = None) -> Response:
+        return await self.request('GET', key, headers=headers, params=params)
+
+    async def iter_object(
+            self, key: str, offset: int = 0, length: int = None, chunk_size: int = 256 * 1024
+    ) -> AsyncIterator[bytes]:
+        """流式读取对象, 可指定起始位置与长度; 响应状态码异常时抛出 httpx.HTTPStatusError"""
+        headers = {'Range': f'bytes={offset}-{offset + length - 1 if length else ""}', 'x-oss-range-behavior': 'standard'}
+        with span('oss', method='GET'):
+            async with self.client.stream(
+                    'GET', self.object_url(key), headers=self.sign_headers('GET', key, headers)
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    yield chunk
+
+    async def delete_object(self, key: str) -> Response:
+        return await self.request('DELETE', key)
+
+    async def list_objects(
+            self, prefix: str = '', marker: str = '', max_keys: int = 1000
+    ) -> tuple[list[str], str | None]:
+        """列举一页对象, 返回本页的 Key 与下一页的 marker, 没有下一页时 marker 为 None"""
+        response = await self.request('GET', params={'prefix': prefix, 'marker': marker, 'max-keys': str(max_keys)})
+        response.raise_for_status()
+        result = ElementTree.fromstring(response.content)
+        keys = [node.findtext('Key') for node in result.iter('Contents')]
+        if result.findtext('IsTruncated') != 'true':
+            return keys, None
+        return keys, result.findtext('NextMarker') or keys[-1]
+
+    async def get_bucket_info(self) -> dict | None:
+        """返回 BucketInfo 中 Bucket 节点的一级字段"""
+        response = await self.client.get(
+            f'{self.base_url}/?bucketInfo', headers=self.sign_headers('GET', '', params={'bucketInfo': ''})
+        )
+        if response.status_code != 200:
+            return None
+        bucket = ElementTree.fromstring(response.content).find('Bucket')
+        return {child.tag: child.text for child in bucket} if bucket is not None else {}
@@ -1,5 +1,9 @@
 __all__ = (
     'RedisCacheController',
+    'get_redis_pool',
+    'initialize_redis_pool',
+    'close_redis_pool',
+    'get_redis_pool_metrics',
 )
 
 from .redis import *
@@ -0,0 +1,90 @@
+"""
+批量写入: 基于无序 bulk_write 按批次提交, 单条失败不影响同一批次的其他操作\n
+由 BaseDatabaseModel.bulk_update_fields / bulk_upsert / bulk_insert 使用, 每个输入条目对应一个写操作,
+错误中的 index 即该条目在输入中的位置
+"""
+from typing import Iterable, Iterator, Sequence
+
+from cryptography.fernet import Fernet
+from pydantic import BaseModel, Field
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import BulkWriteError
+
+from app.config import get_settings
+from app.libs.custom import update_dict_value_recursively
+
+__all__ = (
+    'BulkItemError',
+    'BulkWriteSummary',
+    'iter_batches',
+    'encrypt_values',
+    'execute_bulk_batch',
+)
+
+
+class BulkItemError(BaseModel):
+    index: int | None = Field(..., description='条目在输入中的位置, 写关注错误不对应具体条目时为 None')
+    code: int | None = Field(None, description='MongoDB 错误码, 例如 11000 表示唯一索引冲突')
+    message: str = Field('', description='错误信息')
+
+
+class BulkWriteSummary(BaseModel):
+    inserted: int = 0
+    matched: int = 0
+    modified: int = 0
+    upserted: int = 0
+    errors: list[BulkItemError] = Field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def merge(self, result: dict, offset: int):
+        """累加一个批次的 bulk_api_result (或 BulkWriteError.details), 错误下标换算为在输入中的位置"""
+        self.inserted += result.get('nInserted', 0)
+        self.matched += result.get('nMatched', 0)
+        self.modified += result.get('nModified', 0)
+        self.upserted += result.get('nUpserted', 0)
+        self.errors += [
+            BulkItemError(index=offset + error['index'], code=error.get('code'), message=error.get('errmsg', ''))
+            for error in result.get('writeErrors', [])
+        ]
+        self.errors += [
+            BulkItemError(index=None, code=error.get('code'), message=error.get('errmsg', ''))
+            for error in result.get('writeConcernErrors', [])
+        ]
+
+
+def iter_batches(items: Sequence, batch_size: int = None) -> Iterator[tuple[int, Sequence]]:
+    batch_size = batch_size or get_settings().MONGODB_BULK_BATCH_SIZE
+    for offset in range(0, len(items), batch_size):
+        yield offset, items[offset:offset + batch_size]
+
+
+def encrypt_values(values: dict, fields: Iterable[str], cipher: Fernet) -> dict:
+    """
+    就地加密 values 中属于 fields 的值, 支持 'a.b' 形式的扁平 key 与嵌套 dict\n
+    与 decrypt_model_data 的判断一致, 以 gAAAA 开头的值视为已加密, 不重复加密
+    """
+
+    def encrypt(value):
+        if isinstance(value, str) and value and not value.startswith('gAAAA'):
+            return cipher.encrypt(value.encode('utf-8')).decode('utf-8')
+        return value
+
+    for field in fields:
+        if field in values:
+            values[field] = encrypt(values[field])
+        else:
+            update_dict_value_recursively(values, field, func=encrypt)
+    return values
+
+
+async def execute_bulk_batch(collection: AsyncCollection, operations: list, offset: int, summary: BulkWriteSummary):
+    if not operations:
+        return
+    try:
+        result = (await collection.bulk_write(operations, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        result = e.details
+    summary.merge(result, offset)
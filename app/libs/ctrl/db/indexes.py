@@ -0,0 +1,147 @@
+"""
+声明式索引: 模型在 __query_indexes__ 中声明服务查询的复合索引, 在 __query_shapes__ 中登记热点查询的形状\n
+默认在启动后于后台创建索引, 不阻塞就绪; 开启 MONGODB_QUERY_PLAN_CHECK 时 (dev/test) 同步建索引, 并对登记的查询执行 explain,
+出现 COLLSCAN 时启动失败\n
+python -m app.libs.ctrl.db.indexes report  输出各索引的使用次数 ($indexStats) 与每个查询形状命中的索引
+"""
+import argparse
+import asyncio
+import time
+from typing import Iterator
+
+from beanie import Document
+from pydantic import BaseModel, Field
+from pymongo.errors import PyMongoError
+
+from app.config import get_settings
+from app.libs.custom import cus_print
+
+__all__ = (
+    'QueryShape',
+    'QueryPlanError',
+    'ensure_query_indexes',
+    'explain_query_shapes',
+    'verify_query_shapes',
+    'report_index_usage',
+    'prepare_query_indexes',
+)
+
+_index_build_task: asyncio.Task | None = None
+
+
+class QueryShape(BaseModel):
+    """只用于 explain 的示例查询, 字段与运算符需与真实查询一致, 取值任意"""
+    filter: dict = Field(default_factory=dict)
+    sort: list[tuple[str, int]] | None = None
+
+
+class QueryPlanError(RuntimeError):
+    pass
+
+
+def iter_plan_stages(plan: dict | list) -> Iterator[dict]:
+    """递归遍历 explain 结果中的所有 stage, 兼容 inputStage / inputStages / queryPlan 等嵌套方式"""
+    if isinstance(plan, list):
+        for item in plan:
+            yield from iter_plan_stages(item)
+    elif isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan
+        for value in plan.values():
+            if isinstance(value, (dict, list)):
+                yield from iter_plan_stages(value)
+
+
+async def ensure_query_indexes(models: list[type[Document]]):
+    """创建 __query_indexes__ 中声明的索引, 已存在的索引不会重复创建; 失败只记录日志"""
+    for model in models:
+        if not (indexes := getattr(model, '__query_indexes__', None)):
+            continue
+        start = time.perf_counter()
+        try:
+            names = await model.get_pymongo_collection().create_indexes(indexes)
+        except PyMongoError as e:
+            cus_print(f'Failed to create indexes for {model.__name__}: {e}', 'w')
+            continue
+        print(f'{model.__name__} indexes ready in {(time.perf_counter() - start) * 1000:.0f}ms: {", ".join(names)}')
+
+
+async def explain_query_shapes(models: list[type[Document]]) -> list[dict]:
+    """对每个登记的查询形状执行 explain, 返回 model / shape / stages / indexes"""
+    results = []
+    for model in models:
+        for name, shape in getattr(model, '__query_shapes__', {}).items():
+            cursor = model.get_pymongo_collection().find(shape.filter).limit(1)
+            if shape.sort:
+                cursor = cursor.sort(shape.sort)
+            stages = list(iter_plan_stages((await cursor.explain())['queryPlanner']['winningPlan']))
+            results.append({
+                'model': model.__name__, 'shape': name, 'stages': [stage['stage'] for stage in stages],
+                'indexes': [stage['indexName'] for stage in stages if 'indexName' in stage],
+            })
+    return results
+
+
+async def verify_query_shapes(models: list[type[Document]]):
+    """任一查询形状的执行计划包含 COLLSCAN 时抛出 QueryPlanError"""
+    plans = await explain_query_shapes(models)
+    if failures := [f'{plan["model"]}.{plan["shape"]}' for plan in plans if 'COLLSCAN' in plan['stages']]:
+        raise QueryPlanError(f'Queries fall back to COLLSCAN: {", ".join(failures)}')
+    print(f'Query plans verified: {len(plans)} shapes use indexes')
+
+
+async def report_index_usage(models: list[type[Document]]) -> list[dict]:
+    """$indexStats 统计自 mongod 启动 (或索引创建) 以来每个索引被使用的次数, 副本集中每个成员分别统计"""
+    rows = []
+    for model in models:
+        collection = model.get_pymongo_collection()
+        async for stat in await collection.aggregate([{'$indexStats': {}}]):
+            rows.append({
+                'collection': collection.name, 'index': stat['name'], 'key': dict(stat['key']),
+                'ops': stat['accesses']['ops'], 'since': stat['accesses']['since'].isoformat(), 'host': stat['host'],
+            })
+    return rows
+
+
+async def prepare_query_indexes(models: list[type[Document]]):
+    """由 initialize_database 在 init_beanie 之后调用"""
+    global _index_build_task
+    if get_settings().MONGODB_QUERY_PLAN_CHECK:
+        await ensure_query_indexes(models)
+        await verify_query_shapes(models)
+        return
+    # 生产环境的集合可能很大, 建索引放到后台, 不拖慢就绪
+    _index_build_task = asyncio.create_task(ensure_query_indexes(models))
+
+
+async def main(command: str):
+    from beanie import init_beanie
+    from app.libs.ctrl.db.mongodb import create_mongo_client, load_database_models
+
+    mongo_client = create_mongo_client()
+    models = load_database_models()
+    await init_beanie(
+        database=getattr(mongo_client, get_settings().MONGODB_DB), document_models=models, skip_indexes=True
+    )
+    try:
+        if command == 'ensure':
+            await ensure_query_indexes(models)
+        elif command == 'verify':
+            await verify_query_shapes(models)
+        else:
+            for row in await report_index_usage(models):
+                print(f'{row["collection"]:<16} {row["index"]:<40} ops={row["ops"]:<10} since={row["since"]}')
+            for plan in await explain_query_shapes(models):
+                shape = f'{plan["model"]}.{plan["shape"]}'
+                print(f'{shape:<56} {" > ".join(plan["stages"])} ({", ".join(plan["indexes"])})')
+    finally:
+        await mongo_client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage and inspect declarative query indexes')
+    parser.add_argument(
+        'command', nargs='?', default='report', choices=('report', 'verify', 'ensure'),
+        help='report: index usage and query plans, verify: fail on COLLSCAN, ensure: create declared indexes'
+    )
+    asyncio.run(main(parser.parse_args().command))
@@ -1,21 +1,44 @@
+import asyncio
 from datetime import datetime
 from inspect import isclass
-from typing import Any, ClassVar, Iterable
+from typing import Any, AsyncIterator, ClassVar, Iterable, Mapping, Sequence
 
-from beanie import Document, Update, after_event
+from beanie import Delete, Document, PydanticObjectId, Replace, Save, SaveChanges, Update, after_event
 from beanie import init_beanie
 from beanie.odm.operators.update.general import Set as _Set
+from beanie.odm.utils.dump import get_dict
+from beanie.odm.utils.encoder import Encoder
+from cryptography.fernet import Fernet
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import Field, model_validator
-from pymongo import AsyncMongoClient
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from pymongo import AsyncMongoClient, IndexModel, InsertOne, UpdateOne, monitoring
 
 from app.config import get_settings
-from app.libs.custom import encrypt, decrypt, update_dict_value_recursively
+from app.libs.ctrl.db.bulk import (
+    BulkItemError, BulkWriteSummary, iter_batches, encrypt_values, execute_bulk_batch
+)
+from app.libs.ctrl.db.indexes import QueryShape, prepare_query_indexes
+from app.libs.custom import encrypt, decrypt, update_dict_value_recursively, cus_print
+from app.libs.identity import identity_fields, invalidate_identity, invalidate_identity_values
+from app.libs.metrics import registry
+from app.libs.tracing import Span, start_span
 
 __all__ = (
     'Set',
     'BaseDatabaseModel',
+    'ProjectionView',
+    'BulkItemError',
+    'BulkWriteSummary',
+    'MongoCommandTracer',
+    'MongoPoolMonitor',
+    'mongo_pool_monitor',
+    'create_mongo_client',
     'initialize_database',
+    'load_database_models',
+    'probe_models',
+    'check_models_fully',
+    'warm_up_connection_pool',
+    'get_mongo_pool_metrics',
 )
 
 
@@ -27,6 +50,10 @@ class Set(_Set):
 class BaseDatabaseModel(Document):
     # 子类只需在此列出需要加密的字段名
     __encrypted_fields__: ClassVar[Iterable[str]] = []
+    # 服务查询的复合索引, 启动后在后台创建; 唯一约束等必须在写入前存在的索引仍放在 Settings.indexes / Indexed 中
+    __query_indexes__: ClassVar[list[IndexModel]] = []
+    # 热点查询的形状, MONGODB_QUERY_PLAN_CHECK 开启时逐个 explain, 不允许出现 COLLSCAN
+    __query_shapes__: ClassVar[dict[str, QueryShape]] = {}
 
     createdAt: datetime = Field(default_factory=datetime.now)
     updatedAt: datetime = Field(default_factory=datetime.now)
@@ -45,6 +72,11 @@ class BaseDatabaseModel(Document):
     async def refresh_update_at(self):
         self.updatedAt = datetime.now()
 
+    @after_event(Update, Replace, Save, SaveChanges, Delete)
+    async def invalidate_identity_cache(self):
+        # 按查询条件批量更新 (find().update()) 不经过文档事件, 需要自行调用 invalidate_identity
+        await invalidate_identity(self)
+
     async def update_fields(self, encrypt_fields: dict = None, **kwargs):
         if encrypt_fields and isinstance(encrypt_fields, dict):
             kwargs.update({key: encrypt(val, get_settings().ENCRYPT_KEY) for key, val in encrypt_fields.items()})
@@ -52,6 +84,135 @@ class BaseDatabaseModel(Document):
         kwargs.update(updatedAt=datetime.now())
         return await self.set(kwargs)
 
+    @classmethod
+    async def find_page(
+            cls, *filters, after: str = None, limit: int = 50, projection_model: type[BaseModel] = None
+    ) -> tuple[list, str | None]:
+        """
+        按 _id 做 keyset 分页, 每一页都是一次走索引的范围查询, 耗时与翻到第几页无关\n
+        过滤条件中的等值字段应与 _id 组成复合索引, 例如 [('affiliation', 1), ('_id', 1)]\n
+        :param after: 上一页返回的游标, 即上一页最后一条文档的 _id
+        :param projection_model: 只读取该模型声明的字段, 模型需要包含 id (alias 为 _id)
+        :return: 当前页与下一页的游标, 没有下一页时游标为 None
+        """
+        if after is not None:
+            filters = (*filters, {'_id': {'$gt': PydanticObjectId(after)}})
+        # 多取一条用于判断是否还有下一页, 不需要 count
+        items = await cls.find(*filters, projection_model=projection_model).sort('+_id').limit(limit + 1).to_list()
+        if len(items) <= limit:
+            return items, None
+        return items[:limit], str(items[limit - 1].id)
+
+    @classmethod
+    async def iter_pages(
+            cls, *filters, batch_size: int = 500, projection_model: type[BaseModel] = None
+    ) -> AsyncIterator:
+        """逐页遍历全部匹配的文档, 每页是一次独立的短查询, 不占用长时间存活的服务端游标"""
+        cursor = None
+        while True:
+            items, cursor = await cls.find_page(
+                *filters, after=cursor, limit=batch_size, projection_model=projection_model
+            )
+            for item in items:
+                yield item
+            if cursor is None:
+                return
+
+    @classmethod
+    async def bulk_update_fields(
+            cls, updates: Sequence[tuple[Any, dict]], batch_size: int = None
+    ) -> BulkWriteSummary:
+        """
+        批量更新字段, 每个条目为 (文档 id 或查询条件, 需要 $set 的字段), 查询条件只更新第一条匹配的文档
+
+        与 update_fields 一致自动写入 updatedAt, __encrypted_fields__ 中的字段每批创建一次密钥后加密
+
+        以无序 bulk_write 按批提交, 单条失败记录在返回的 errors 中, 不影响其他条目
+        """
+        summary = BulkWriteSummary()
+        cipher = cls.bulk_cipher()
+        for offset, batch in iter_batches(updates, batch_size):
+            filters = [cls.bulk_filter(target) for target, _ in batch]
+            operations = [
+                UpdateOne(query, Set(cls.bulk_encode(values, cipher)).query)
+                for query, (_, values) in zip(filters, batch)
+            ]
+            await cls.write_bulk_batch(filters, operations, [values for _, values in batch], offset, summary)
+        return summary
+
+    @classmethod
+    async def bulk_upsert(
+            cls, documents: Sequence['BaseDatabaseModel'], key: Sequence[str] = ('_id',), batch_size: int = None
+    ) -> BulkWriteSummary:
+        """
+        按 key 中的字段匹配, 存在则整体覆盖 (保留原有的 _id 与 createdAt), 不存在则插入
+
+        没有 id 的文档在提交前分配 id; key 不能包含加密字段, 同一明文每次加密的结果都不同
+        """
+        if unknown := set(key) & {field.split('.')[0] for field in cls.__encrypted_fields__}:
+            raise ValueError(f'Encrypted fields cannot be used as upsert key: {sorted(unknown)}')
+        summary = BulkWriteSummary()
+        cipher = cls.bulk_cipher()
+        for offset, batch in iter_batches(documents, batch_size):
+            filters, operations = [], []
+            for document in batch:
+                document.id = document.id or PydanticObjectId()
+                body = cls.bulk_encode(get_dict(document, to_db=True), cipher)
+                filters.append(query := {field: body[field] for field in key})
+                on_insert = {'_id': body.pop('_id'), 'createdAt': body.pop('createdAt')}
+                operations.append(UpdateOne(query, Set(body).query | {'$setOnInsert': on_insert}, upsert=True))
+            values = [document.model_dump() for document in batch]
+            await cls.write_bulk_batch(filters, operations, values, offset, summary)
+        return summary
+
+    @classmethod
+    async def bulk_insert(
+            cls, documents: Sequence['BaseDatabaseModel'], batch_size: int = None
+    ) -> BulkWriteSummary:
+        """批量插入, 没有 id 的文档在提交前分配 id; 唯一索引冲突等错误按条目记录在返回的 errors 中"""
+        summary = BulkWriteSummary()
+        cipher = cls.bulk_cipher()
+        collection = cls.get_pymongo_collection()
+        for offset, batch in iter_batches(documents, batch_size):
+            operations = []
+            for document in batch:
+                document.id = document.id or PydanticObjectId()
+                operations.append(InsertOne(cls.bulk_encode(get_dict(document, to_db=True), cipher)))
+            # 身份缓存不缓存查询不到的结果, 新插入的文档无需失效
+            await execute_bulk_batch(collection, operations, offset, summary)
+        return summary
+
+    @classmethod
+    def bulk_cipher(cls) -> Fernet | None:
+        return Fernet(get_settings().ENCRYPT_KEY) if cls.__encrypted_fields__ else None
+
+    @classmethod
+    def bulk_encode(cls, values: dict, cipher: Fernet | None) -> dict:
+        values = Encoder(to_db=True).encode(dict(values))
+        return encrypt_values(values, cls.__encrypted_fields__, cipher) if cipher else values
+
+    @staticmethod
+    def bulk_filter(target) -> dict:
+        if isinstance(target, Mapping):
+            return Encoder(to_db=True).encode(dict(target))
+        return {'_id': PydanticObjectId(target)}
+
+    @classmethod
+    async def write_bulk_batch(
+            cls, filters: list[dict], operations: list, values: list[dict], offset: int, summary: BulkWriteSummary
+    ):
+        """
+        批量写入不经过文档事件钩子, 由这里失效身份缓存
+
+        身份字段可能被本批修改, 写入前读出旧值, 写入后旧值与新值对应的缓存一并失效
+        """
+        collection = cls.get_pymongo_collection()
+        if not (fields := identity_fields(cls)):
+            return await execute_bulk_batch(collection, operations, offset, summary)
+        previous = await collection.find({'$or': filters}, {field: 1 for field in fields}).to_list()
+        await execute_bulk_batch(collection, operations, offset, summary)
+        await invalidate_identity_values(cls, [*previous, *values])
+
     async def get_encrypted_fields(self, encrypted_field: str) -> Any | None:
         if not getattr(self, encrypted_field):
             return None
@@ -59,18 +220,221 @@ class BaseDatabaseModel(Document):
 
     @model_validator(mode='before')
     def decrypt_model_data(cls, values: dict) -> str:
-        for field in cls.__encrypted_fields__:
-            update_dict_value_recursively(
-                values, field,
-                func=lambda x: decrypt(x, get_settings().ENCRYPT_KEY) if x and x.startswith('gAAAA') else None
-            )
-        return values
+        return decrypt_fields(values, cls.__encrypted_fields__)
+
+
+class ProjectionView(BaseModel):
+    """
+    声明式的投影视图, 只声明读取需要的字段, 查询时自动作为 Mongo projection\n
+    服务端只返回这些字段, 客户端也只解码与校验这些字段; 字段名在定义时与 __model__ 核对, 拼写错误在导入时就会报出\n
+    class UserSummary(ProjectionView):\n
+        __model__ = UserModel\n
+        email: str
+    """
+    __model__: ClassVar[type[BaseDatabaseModel]] = None
+    __encrypted_fields__: ClassVar[Iterable[str]] = []
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: PydanticObjectId | None = Field(None, alias='_id')
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs):
+        super().__pydantic_init_subclass__(**kwargs)
+        if cls.__model__ is None:
+            return
+        if unknown := set(cls.model_fields) - set(cls.__model__.model_fields):
+            raise TypeError(f'{cls.__name__} declares fields not in {cls.__model__.__name__}: {sorted(unknown)}')
+        # 加密字段按顶层字段名过滤, 只解密视图中包含的字段
+        cls.__encrypted_fields__ = [
+            field for field in cls.__model__.__encrypted_fields__ if field.split('.')[0] in cls.model_fields
+        ]
+
+    @classmethod
+    def find(cls, *filters, **kwargs):
+        return cls.__model__.find(*filters, projection_model=cls, **kwargs)
+
+    @classmethod
+    def find_one(cls, *filters, **kwargs):
+        return cls.__model__.find_one(*filters, projection_model=cls, **kwargs)
+
+    @classmethod
+    async def find_page(cls, *filters, after: str = None, limit: int = 50) -> tuple[list, str | None]:
+        return await cls.__model__.find_page(*filters, after=after, limit=limit, projection_model=cls)
+
+    @model_validator(mode='before')
+    def decrypt_model_data(cls, values: dict) -> dict:
+        return decrypt_fields(values, cls.__encrypted_fields__)
+
+
+def decrypt_fields(values: dict, fields: Iterable[str]) -> dict:
+    for field in fields:
+        update_dict_value_recursively(
+            values, field,
+            func=lambda x: decrypt(x, get_settings().ENCRYPT_KEY) if x and x.startswith('gAAAA') else None
+        )
+    return values
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """把 Beanie 发出的每条 Mongo 命令记录为 span, 开始与结束事件通过 request_id 关联"""
+
+    def __init__(self):
+        self._spans: dict[tuple, Span] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if (command_span := start_span(
+                'mongo', command=event.command_name, collection=event.command.get(event.command_name)
+        )) is not None:
+            self._spans[(event.connection_id, event.request_id)] = command_span
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        if (command_span := self._spans.pop((event.connection_id, event.request_id), None)) is not None:
+            command_span.end()
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        if (command_span := self._spans.pop((event.connection_id, event.request_id), None)) is not None:
+            command_span.error = str(event.failure)
+            command_span.end()
+
+
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    统计连接池的借出等待耗时与连接数, 与 Redis 连接池使用相同的指标名称\n
+    事件在事件循环线程内同步触发, 这里只做计数
+    """
 
+    def __init__(self):
+        self.total_connections = 0
+        self.in_use_connections = 0
+        self.wait_count = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_failures = 0
+        self.pool_cleared_count = 0
 
-async def test_models_class(module):
-    for model in module:
-        await model.find().to_list()
-        print(f'{model.__name__} test passed')
+    def _record_wait(self, duration: float | None):
+        wait_ms = (duration or 0.0) * 1000
+        self.wait_count += 1
+        self.wait_total_ms += wait_ms
+        self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent):
+        self.in_use_connections += 1
+        self._record_wait(event.duration)
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent):
+        self.wait_failures += 1
+        self._record_wait(event.duration)
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent):
+        self.in_use_connections -= 1
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent):
+        self.total_connections += 1
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent):
+        self.total_connections -= 1
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent):
+        self.pool_cleared_count += 1
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent):
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent):
+        pass
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent):
+        pass
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent):
+        pass
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent):
+        pass
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            'max_connections': get_settings().MONGODB_MAX_POOL_SIZE,
+            'total_connections': self.total_connections,
+            'in_use_connections': self.in_use_connections,
+            'idle_connections': self.total_connections - self.in_use_connections,
+            'wait_count': self.wait_count,
+            'wait_total_ms': self.wait_total_ms,
+            'wait_max_ms': self.wait_max_ms,
+            'wait_avg_ms': self.wait_total_ms / self.wait_count if self.wait_count else 0.0,
+            'wait_failures': self.wait_failures,
+            'pool_cleared': self.pool_cleared_count,
+        }
+
+
+mongo_pool_monitor = MongoPoolMonitor()
+
+
+def get_mongo_pool_metrics() -> dict:
+    return mongo_pool_monitor.metrics
+
+
+registry.register_collector('mongo_pool', get_mongo_pool_metrics)
+
+
+async def warm_up_connection_pool(mongo_client: AsyncMongoClient, size: int, timeout: float):
+    """
+    等待连接池在对外服务之前建立 size 个连接, 避免首批请求承担握手与认证的耗时\n
+    连接由 pymongo 按 minPoolSize 在后台补足 (同时建立的连接数受 maxConnecting 限制), 这里只负责触发与等待;
+    超过 timeout 秒仍未补足时不阻塞启动, 记录实际建立的连接数
+    """
+    if size <= 0:
+        return
+    await mongo_client.admin.command('ping')
+    try:
+        async with asyncio.timeout(timeout):
+            while mongo_pool_monitor.total_connections < size:
+                await asyncio.sleep(0.05)
+    except TimeoutError:
+        cus_print(
+            f'Mongo pool warm-up timed out after {timeout}s: {mongo_pool_monitor.total_connections}/{size} connections',
+            'w'
+        )
+        return
+    print(f'Mongo pool warmed up: {mongo_pool_monitor.total_connections} connections')
+
+
+async def probe_models(mongo_client: AsyncMongoClient, models: list[type[BaseDatabaseModel]], timeout: float):
+    """
+    启动时的轻量检查: ping, 列出索引, 每个模型最多读取并校验一条文档\n
+    耗时与集合大小无关, 超过 timeout 秒视为数据库不可用
+    """
+
+    async def probe(model: type[BaseDatabaseModel]):
+        await model.get_pymongo_collection().index_information()
+        await model.find_one()
+        print(f'{model.__name__} probe passed')
+
+    try:
+        async with asyncio.timeout(timeout):
+            await mongo_client.admin.command('ping')
+            await asyncio.gather(*(probe(model) for model in models))
+    except TimeoutError:
+        raise ConnectionError(f'Database probe timed out after {timeout}s')
+
+
+async def check_models_fully(models: list[type[BaseDatabaseModel]]):
+    """
+    逐条读取并校验全部文档, 由 lifespan 在启动完成后放到后台执行\n
+    通过游标分批遍历, 内存占用与集合大小无关; 校验失败只记录日志
+    """
+    for model in models:
+        count = 0
+        try:
+            async for _ in model.find():
+                count += 1
+        except Exception as e:
+            cus_print(f'{model.__name__} full check failed after {count} documents: {e}', 'w')
+            continue
+        print(f'{model.__name__} full check passed: {count} documents')
 
 
 def load_models_class(module):
@@ -83,27 +447,47 @@ def load_models_class(module):
     return class_list
 
 
-async def initialize_database() -> AsyncIOMotorClient:
+def load_database_models() -> list[type[BaseDatabaseModel]]:
     import app.models.account as user_models
+    import app.models.events as event_models
 
-    mongo_client = AsyncMongoClient(
+    return [
+        *load_models_class(user_models),
+        *load_models_class(event_models),
+    ]
+
+
+def create_mongo_client() -> AsyncMongoClient:
+    return AsyncMongoClient(
         host=get_settings().MONGODB_URI,
         port=get_settings().MONGODB_PORT,
         username=get_settings().MONGODB_USERNAME,
         password=get_settings().MONGODB_PASSWORD,
         authSource=get_settings().MONGODB_AUTHENTICATION_SOURCE,
-        # 全局连接池参数可在此配置
-        # maxPoolSize=100,
-        # minPoolSize=5,
+        event_listeners=[MongoCommandTracer(), mongo_pool_monitor],
+        maxPoolSize=get_settings().MONGODB_MAX_POOL_SIZE,
+        minPoolSize=get_settings().MONGODB_MIN_POOL_SIZE,
+        # 0 表示不限制
+        maxIdleTimeMS=get_settings().MONGODB_MAX_IDLE_TIME_MS or None,
+        waitQueueTimeoutMS=get_settings().MONGODB_WAIT_QUEUE_TIMEOUT_MS or None,
+        # 未安装 zstandard / python-snappy 时 pymongo 给出警告并忽略对应算法
+        compressors=[name.strip() for name in get_settings().MONGODB_COMPRESSORS.split(',') if name.strip()],
+        readPreference=get_settings().MONGODB_READ_PREFERENCE,
     )
-    model_classes = [
-        *load_models_class(user_models),
-    ]
+
+
+async def initialize_database() -> AsyncIOMotorClient:
+    mongo_client = create_mongo_client()
+    await warm_up_connection_pool(
+        mongo_client, get_settings().MONGODB_MIN_POOL_SIZE, get_settings().MONGODB_STARTUP_PROBE_TIMEOUT
+    )
+    model_classes = load_database_models()
     await init_beanie(
         database=getattr(mongo_client, get_settings().MONGODB_DB),
         document_models=model_classes
     )
-    print('Database Test...')
-    await test_models_class(model_classes)
+    await prepare_query_indexes(model_classes)
+    print('Database Probe...')
+    await probe_models(mongo_client, model_classes, get_settings().MONGODB_STARTUP_PROBE_TIMEOUT)
     print('Database Init Complete', end='\n\n')
     return mongo_client
@@ -1,23 +1,116 @@
+import time
+
 from redis.asyncio.client import Redis
+from redis.asyncio.connection import BlockingConnectionPool
 
 from app.config import get_settings
+from app.libs.metrics import registry
+from app.libs.tracing import span
 
 __all__ = (
     'RedisCacheController',
+    'MeteredConnectionPool',
+    'get_redis_pool',
+    'initialize_redis_pool',
+    'close_redis_pool',
+    'get_redis_pool_metrics',
 )
 
+_connection_pool: 'MeteredConnectionPool | None' = None
 
-class RedisCacheController(Redis):
-    def __init__(self):
-        super().__init__(
-            host=get_settings().REDIS_HOST, port=get_settings().REDIS_PORT, ssl=False,
+
+class MeteredConnectionPool(BlockingConnectionPool):
+    """
+    进程内共享的有界连接池, 连接用尽时阻塞等待而不是新建连接\n
+    额外记录借用连接的等待耗时, 用于观察连接池是否饱和
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_failures = 0
+
+    async def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        except Exception:
+            self.wait_failures += 1
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - start) * 1000
+            self.wait_count += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            'max_connections': self.max_connections,
+            'in_use_connections': len(self._in_use_connections),
+            'idle_connections': len(self._available_connections),
+            'wait_count': self.wait_count,
+            'wait_total_ms': self.wait_total_ms,
+            'wait_max_ms': self.wait_max_ms,
+            'wait_avg_ms': self.wait_total_ms / self.wait_count if self.wait_count else 0.0,
+            'wait_failures': self.wait_failures,
+        }
+
+
+def get_redis_pool() -> MeteredConnectionPool:
+    """获取进程内共享的 Redis 连接池, 未经 lifespan 初始化时按需创建"""
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = MeteredConnectionPool(
+            host=get_settings().REDIS_HOST, port=get_settings().REDIS_PORT,
             username=get_settings().REDIS_USERNAME, password=get_settings().REDIS_PASSWORD,
-            encoding="utf-8", decode_responses=True
+            max_connections=get_settings().REDIS_MAX_CONNECTIONS,
+            timeout=get_settings().REDIS_POOL_TIMEOUT,
+            health_check_interval=get_settings().REDIS_HEALTH_CHECK_INTERVAL,
+            socket_timeout=get_settings().REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=get_settings().REDIS_SOCKET_TIMEOUT,
+            encoding='utf-8', decode_responses=True
         )
+    return _connection_pool
+
+
+async def initialize_redis_pool() -> MeteredConnectionPool:
+    """创建共享连接池并执行一次 PING, 保证服务对外之前 Redis 可用"""
+    pool = get_redis_pool()
+    async with RedisCacheController() as cache:
+        await cache.ping()
+    print(f'Redis pool ready, max connections: {pool.max_connections}')
+    return pool
+
+
+async def close_redis_pool():
+    global _connection_pool
+    if _connection_pool is not None:
+        await _connection_pool.disconnect()
+        _connection_pool = None
+
+
+def get_redis_pool_metrics() -> dict:
+    return _connection_pool.metrics if _connection_pool is not None else {}
+
+
+registry.register_collector('redis_pool', get_redis_pool_metrics)
+
+
+class RedisCacheController(Redis):
+    def __init__(self):
+        # 所有实例共享同一个连接池, 实例本身只是轻量的命令入口, 关闭实例不会断开池内连接
+        super().__init__(connection_pool=get_redis_pool())
 
     async def __aenter__(self):
         return self
 
+    async def execute_command(self, *args, **options):
+        with span('redis', command=str(args[0]) if args else None):
+            return await super().execute_command(*args, **options)
+
     async def check_email_v_code(self, email: str, v_code: str) -> bool:
         v_code_from_redis = await self.get(f'{email}-verification-code')
         return v_code == v_code_from_redis
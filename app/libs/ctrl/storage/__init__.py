@@ -0,0 +1,161 @@
+"""
+对象存储抽象: 业务代码只依赖 ObjectStore 接口, 具体后端由 OBJECT_STORAGE_BACKEND 选择\n
+azure / ali_oss 对接云存储, local 与 memory 不需要云账号, 用于本地开发、测试与离线压测
+"""
+import abc
+from typing import AsyncIterable, AsyncIterator, BinaryIO
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from app.config import get_settings
+from app.libs.ctrl.cloud import CloudObjectStat
+from app.libs.ctrl.cloud.azure import iter_blocks
+from app.response import create_range_stream_response
+
+__all__ = (
+    'ObjectSource',
+    'ObjectPutResult',
+    'ObjectStore',
+    'iter_source',
+    'get_object_store',
+    'set_object_store',
+    'create_object_store',
+    'initialize_object_store',
+    'close_object_store',
+    'MemoryObjectStore',
+    'LocalObjectStore',
+    'AzureObjectStore',
+    'AliOssObjectStore',
+)
+
+# 字节串, 异步字节迭代器, 或同步/异步 read 的文件对象 (例如 UploadFile)
+ObjectSource = bytes | AsyncIterable[bytes] | BinaryIO
+
+_object_store: 'ObjectStore | None' = None
+
+
+class ObjectPutResult(BaseModel):
+    etag: str
+    content_md5: str
+
+
+async def iter_source(source: ObjectSource, chunk_size: int) -> AsyncIterator[bytes]:
+    """把任意 ObjectSource 切分为不超过 chunk_size 的块"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        for start in range(0, len(source), chunk_size):
+            yield bytes(source[start:start + chunk_size])
+        return
+    async for chunk in iter_blocks(source, chunk_size):
+        yield chunk
+
+
+class ObjectStore(abc.ABC):
+    """
+    统一的异步对象存储接口\n
+    对象不存在时 get / stat 返回 None, stream 由具体后端抛出异常; overwrite=False 且对象已存在时 put 抛出 RuntimeError
+    """
+    name: str
+
+    async def initialize(self):
+        """由 lifespan 在启动时调用, 检查后端是否可用"""
+        pass
+
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    async def put(
+            self, key: str, source: ObjectSource, content_type: str = None, overwrite: bool = True
+    ) -> ObjectPutResult:
+        pass
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        pass
+
+    @abc.abstractmethod
+    async def stat(self, key: str) -> CloudObjectStat | None:
+        pass
+
+    @abc.abstractmethod
+    def stream(self, key: str, offset: int = 0, length: int = None) -> AsyncIterator[bytes]:
+        """按块读取对象, 可指定起始位置与长度, 用于 Range 请求"""
+        pass
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def list_keys(self, prefix: str = '') -> AsyncIterator[str]:
+        """列举以 prefix 开头的对象名"""
+        pass
+
+    @abc.abstractmethod
+    def access_url(self, key: str) -> str:
+        """不带签名的访问地址, 纯字符串拼接"""
+        pass
+
+    @abc.abstractmethod
+    def sign_url(self, key: str, expires: int = 3600) -> str:
+        """带有效期的只读访问地址"""
+        pass
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    async def stream_response(self, key: str, range_header: str = None, filename: str = None) -> Response:
+        """把对象以流的形式透传给客户端, 支持 Range 请求, 对象不存在时返回 404"""
+        if not (stat := await self.stat(key)):
+            return Response(status_code=404)
+        return create_range_stream_response(
+            lambda offset, length: self.stream(key, offset, length), stat.size, range_header,
+            media_type=stat.content_type, etag=stat.etag, filename=filename
+        )
+
+
+from .memory import *
+from .local import *
+from .azure import *
+from .ali import *
+
+
+def create_object_store(backend: str = None) -> ObjectStore:
+    match backend or get_settings().OBJECT_STORAGE_BACKEND:
+        case 'memory':
+            return MemoryObjectStore()
+        case 'local':
+            return LocalObjectStore(get_settings().LOCAL_STORAGE_ROOT, get_settings().LOCAL_STORAGE_URL_PREFIX)
+        case 'ali_oss':
+            return AliOssObjectStore()
+        case _:
+            return AzureObjectStore()
+
+
+def get_object_store() -> ObjectStore:
+    """获取进程内共享的对象存储, 首次调用时按配置创建"""
+    global _object_store
+    if _object_store is None:
+        _object_store = create_object_store()
+    return _object_store
+
+
+def set_object_store(store: ObjectStore | None):
+    """替换进程内共享的对象存储, 供测试与压测脚本注入 memory / local 后端"""
+    global _object_store
+    _object_store = store
+
+
+async def initialize_object_store() -> ObjectStore:
+    store = get_object_store()
+    await store.initialize()
+    print(f'Object storage backend: {store.name}')
+    return store
+
+
+async def close_object_store():
+    global _object_store
+    if _object_store is not None:
+        await _object_store.close()
+        _object_store = None
@@ -0,0 +1,82 @@
+import base64
+import hashlib
+from typing import AsyncIterator
+
+from app.libs.ctrl.cloud import AliCloudOssBucketController, CloudObjectStat
+from app.libs.ctrl.storage import ObjectStore, ObjectPutResult, ObjectSource, iter_source
+
+__all__ = (
+    'AliOssObjectStore',
+)
+
+OSS_PUT_CHUNK_SIZE = 1024 * 1024
+
+
+class AliOssObjectStore(ObjectStore):
+    """
+    基于 AliCloudOssBucketController 的原生异步接口\n
+    不超过 OSS_PUT_CHUNK_SIZE 的内容一次 PutObject (带 Content-MD5), 更大的内容按该大小分片上传,
+    内存中只保留当前分片
+    """
+    name = 'ali_oss'
+
+    def __init__(self):
+        self.controller = AliCloudOssBucketController()
+
+    async def initialize(self):
+        await self.controller.login()
+        if await self.controller.get_bucket_info_async() is None:
+            raise ConnectionError(f'Failed to connect to Ali OSS bucket: {self.controller.bucket_name}')
+        print(f'Connected to bucket: {self.controller.bucket_name}')
+
+    async def put(
+            self, key: str, source: ObjectSource, content_type: str = None, overwrite: bool = True
+    ) -> ObjectPutResult:
+        headers = {'Content-Type': content_type} if content_type else {}
+        if not overwrite:
+            headers['x-oss-forbid-overwrite'] = 'true'
+        parts = iter_source(source, OSS_PUT_CHUNK_SIZE)
+        first_part = await anext(parts, b'')
+        # 读不到第二个分片说明内容不超过一个分片, 直接 PutObject
+        if (second_part := await anext(parts, None)) is None:
+            content_md5 = base64.b64encode(hashlib.md5(first_part).digest()).decode()
+            headers['Content-MD5'] = content_md5
+            result = await self.controller.put_object_async(key, first_part, headers=headers)
+        else:
+            md5 = hashlib.md5()
+
+            async def hashed_parts() -> AsyncIterator[bytes]:
+                for part in (first_part, second_part):
+                    md5.update(part)
+                    yield part
+                async for part in parts:
+                    md5.update(part)
+                    yield part
+
+            result = await self.controller.put_object_multipart_async(key, hashed_parts(), headers=headers)
+            content_md5 = base64.b64encode(md5.digest()).decode()
+        if result is None:
+            raise RuntimeError(f'Failed to upload OSS object "{key}"')
+        return ObjectPutResult(etag=result.etag, content_md5=content_md5)
+
+    async def get(self, key: str) -> bytes | None:
+        result = await self.controller.get_object_async(key)
+        return result.read() if result is not None else None
+
+    async def stat(self, key: str) -> CloudObjectStat | None:
+        return await self.controller.get_object_stat_async(key)
+
+    def stream(self, key: str, offset: int = 0, length: int = None) -> AsyncIterator[bytes]:
+        return self.controller.iter_object_async(key, offset, length)
+
+    async def delete(self, key: str) -> bool:
+        return await self.controller.delete_object_async(key)
+
+    def list_keys(self, prefix: str = '') -> AsyncIterator[str]:
+        return self.controller.iter_object_keys_async(prefix)
+
+    def access_url(self, key: str) -> str:
+        return f'{self.controller.access_url_prefix}{key.lstrip("/")}'
+
+    def sign_url(self, key: str, expires: int = 3600) -> str:
+        return self.controller.generate_object_access_url(key, expires)
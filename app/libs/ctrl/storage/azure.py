@@ -0,0 +1,63 @@
+import io
+from typing import AsyncIterator
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from app.libs.ctrl.cloud import (
+    AzureBlobController, CloudObjectStat, initialize_blob_storage, close_blob_storage, generate_blob_access_url,
+    get_blob_container_client
+)
+from app.libs.ctrl.storage import ObjectStore, ObjectPutResult, ObjectSource
+
+__all__ = (
+    'AzureObjectStore',
+)
+
+
+class AzureObjectStore(ObjectStore):
+    """基于 AzureBlobController, 共享容器客户端由 initialize_blob_storage / close_blob_storage 管理"""
+    name = 'azure'
+
+    @property
+    def controller(self) -> AzureBlobController:
+        # 控制器只是共享容器客户端的轻量包装, 每次创建的成本可以忽略
+        return AzureBlobController()
+
+    async def initialize(self):
+        await initialize_blob_storage()
+
+    async def close(self):
+        await close_blob_storage()
+
+    async def put(
+            self, key: str, source: ObjectSource, content_type: str = None, overwrite: bool = True
+    ) -> ObjectPutResult:
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        result = await self.controller.upload_stream(key, source, overwrite, content_type)
+        return ObjectPutResult(etag=result.etag, content_md5=result.content_md5)
+
+    async def get(self, key: str) -> bytes | None:
+        try:
+            return await self.controller.read_file(key)
+        except ResourceNotFoundError:
+            return None
+
+    async def stat(self, key: str) -> CloudObjectStat | None:
+        return await self.controller.get_file_stat(key)
+
+    def stream(self, key: str, offset: int = 0, length: int = None) -> AsyncIterator[bytes]:
+        return self.controller.iter_file(key, offset, length)
+
+    async def delete(self, key: str) -> bool:
+        return await self.controller.delete_file(key)
+
+    async def list_keys(self, prefix: str = '') -> AsyncIterator[str]:
+        async for name in get_blob_container_client().list_blob_names(name_starts_with=prefix or None):
+            yield name
+
+    def access_url(self, key: str) -> str:
+        return generate_blob_access_url(key)
+
+    def sign_url(self, key: str, expires: int = 3600) -> str:
+        return self.controller.generate_sas_url(key, expires)
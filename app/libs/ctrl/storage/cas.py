@@ -0,0 +1,76 @@
+"""
+内容寻址上传: 对象路径由内容的 SHA-256 决定, 相同内容只上传一次\n
+Redis 中记录已上传的路径, 命中时不再访问对象存储; Redis 被清空时退化为一次 stat
+"""
+import asyncio
+import base64
+import hashlib
+from typing import BinaryIO
+
+from redis.asyncio import Redis
+from starlette.datastructures import UploadFile
+
+from app.libs.ctrl.storage import ObjectStore, ObjectPutResult
+from app.libs.metrics import registry
+
+__all__ = (
+    'CONTENT_ADDRESSED_DIR',
+    'hash_file',
+    'content_addressed_path',
+    'is_content_addressed_path',
+    'put_content_addressed',
+)
+
+CONTENT_ADDRESSED_DIR = 'cas'
+CONTENT_DIGEST_INDEX_PREFIX = 'storage:digest:'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+content_addressed_uploads_total = registry.counter(
+    'content_addressed_uploads_total', 'Content addressed uploads by outcome (index_hit, store_hit, uploaded)',
+    ['outcome']
+)
+
+
+def hash_file(file: BinaryIO) -> tuple[str, str]:
+    """从当前位置读到末尾, 返回 SHA-256 (hex) 与 MD5 (base64), 读完后回到原位置"""
+    position = file.tell()
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    while chunk := file.read(HASH_CHUNK_SIZE):
+        sha256.update(chunk)
+        md5.update(chunk)
+    file.seek(position)
+    return sha256.hexdigest(), base64.b64encode(md5.digest()).decode()
+
+
+def content_addressed_path(root: str, digest: str, extension: str) -> str:
+    # 按摘要前两位分目录, 避免单个目录下对象过多
+    return f'{root}/{CONTENT_ADDRESSED_DIR}/{digest[:2]}/{digest}.{extension}'
+
+
+def is_content_addressed_path(file_path: str) -> bool:
+    return f'/{CONTENT_ADDRESSED_DIR}/' in f'/{file_path.lstrip("/")}'
+
+
+async def put_content_addressed(
+        store: ObjectStore, cache: Redis, root: str, file: UploadFile, extension: str, content_type: str = None
+) -> tuple[str, ObjectPutResult]:
+    """
+    先在线程中计算摘要, 摘要对应的对象不存在时才上传\n
+    :param file: Starlette 已经把请求体完整落到其中; 上传时传入 UploadFile 本身, 读取在线程中进行, 不阻塞事件循环
+    :return: 内容寻址路径与上传结果, 跳过上传时 etag 来自索引或已存在的对象
+    """
+    digest, content_md5 = await asyncio.to_thread(hash_file, file.file)
+    file_path = content_addressed_path(root, digest, extension)
+    index_key = f'{CONTENT_DIGEST_INDEX_PREFIX}{store.name}:{file_path}'
+    if (etag := await cache.get(index_key)) is not None:
+        content_addressed_uploads_total.inc('index_hit')
+        return file_path, ObjectPutResult(etag=etag, content_md5=content_md5)
+    if (stat := await store.stat(file_path)) is not None:
+        content_addressed_uploads_total.inc('store_hit')
+        etag = stat.etag or ''
+    else:
+        content_addressed_uploads_total.inc('uploaded')
+        await file.seek(0)
+        etag = (await store.put(file_path, file, content_type)).etag
+    await cache.set(index_key, etag)
+    return file_path, ObjectPutResult(etag=etag, content_md5=content_md5)
@@ -0,0 +1,217 @@
+"""
+本地磁盘后端: 默认写到 statics/objects, 由 main.py 挂载的 /statics 直接对外提供访问\n
+写入先落到临时文件再 rename, 读者不会看到写了一半的对象; 文件操作全部放到线程中执行, 不阻塞事件循环
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import mimetypes
+import mmap
+import os
+import pathlib
+import sys
+import uuid
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, BinaryIO
+
+from starlette.responses import FileResponse, Response
+
+from app.libs.ctrl.cloud import CloudObjectStat
+from app.libs.ctrl.storage import ObjectStore, ObjectPutResult, ObjectSource, iter_source
+
+__all__ = (
+    'LocalObjectStore',
+    'default_local_storage_root',
+)
+
+LOCAL_STORAGE_CHUNK_SIZE = 1024 * 1024
+TEMP_FILE_SUFFIX = '.uploading'
+
+
+def default_local_storage_root() -> str:
+    return f'{pathlib.Path(__file__).resolve().parents[4]}/statics/objects'
+
+
+def _real_file(source: ObjectSource) -> BinaryIO | None:
+    """返回背后是磁盘文件的文件对象, 可以用 sendfile 复制; 仍在内存中的 SpooledTemporaryFile 等返回 None"""
+    file = getattr(source, 'file', source)
+    if isinstance(file, SpooledTemporaryFile):
+        # 直接调用 fileno() 会把内存中的内容先写到磁盘
+        file = file._file if file._rolled else None
+    if not isinstance(file, io.IOBase):
+        return None
+    try:
+        file.fileno()
+    except (OSError, io.UnsupportedOperation):
+        return None
+    return file
+
+
+def _copy_file(source: BinaryIO, target: BinaryIO) -> int:
+    """从 source 当前位置复制到末尾; Linux 下使用 sendfile 在内核中完成, 数据不经过用户态"""
+    offset = source.tell()
+    size = os.fstat(source.fileno()).st_size - offset
+    if sys.platform != 'linux':
+        target.write(source.read())
+        return size
+    sent = 0
+    while sent < size:
+        sent += os.sendfile(target.fileno(), source.fileno(), offset + sent, size - sent)
+    source.seek(offset + size)
+    return size
+
+
+def _file_md5(file: BinaryIO) -> bytes:
+    """通过 mmap 计算整个文件的 MD5, 不把文件内容读入 Python 的缓冲区"""
+    if os.fstat(file.fileno()).st_size == 0:
+        return hashlib.md5().digest()
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return hashlib.md5(mapped).digest()
+
+
+def _write_chunk(file: BinaryIO, md5, chunk: bytes):
+    file.write(chunk)
+    md5.update(chunk)
+
+
+class LocalObjectStore(ObjectStore):
+    name = 'local'
+
+    def __init__(self, root: str = None, url_prefix: str = '/statics/objects'):
+        self.root = os.path.realpath(root or default_local_storage_root())
+        self.url_prefix = url_prefix.rstrip('/')
+
+    async def initialize(self):
+        await asyncio.to_thread(os.makedirs, self.root, exist_ok=True)
+
+    def path_of(self, key: str) -> str:
+        """对象名映射为 root 下的路径, 拒绝通过 .. 跳出 root"""
+        path = os.path.realpath(os.path.join(self.root, key.lstrip('/')))
+        if os.path.commonpath((self.root, path)) != self.root:
+            raise ValueError(f'Illegal object key: {key}')
+        return path
+
+    @staticmethod
+    def _etag(stat_result: os.stat_result) -> str:
+        return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+    async def put(
+            self, key: str, source: ObjectSource, content_type: str = None, overwrite: bool = True
+    ) -> ObjectPutResult:
+        path = self.path_of(key)
+        temp_path = f'{path}.{uuid.uuid4().hex}{TEMP_FILE_SUFFIX}'
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        try:
+            digest = await self._write_temp_file(temp_path, source)
+            await asyncio.to_thread(self._commit, temp_path, path, overwrite)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return ObjectPutResult(
+            etag=self._etag(await asyncio.to_thread(os.stat, path)), content_md5=base64.b64encode(digest).decode()
+        )
+
+    async def _write_temp_file(self, temp_path: str, source: ObjectSource) -> bytes:
+        file = await asyncio.to_thread(open, temp_path, 'w+b')
+        try:
+            if (real_file := _real_file(source)) is not None:
+                return await asyncio.to_thread(self._copy_and_hash, real_file, file)
+            md5 = hashlib.md5()
+            async for chunk in iter_source(source, LOCAL_STORAGE_CHUNK_SIZE):
+                await asyncio.to_thread(_write_chunk, file, md5, chunk)
+            return md5.digest()
+        finally:
+            await asyncio.to_thread(file.close)
+
+    @staticmethod
+    def _copy_and_hash(source: BinaryIO, target: BinaryIO) -> bytes:
+        _copy_file(source, target)
+        target.flush()
+        return _file_md5(target)
+
+    @staticmethod
+    def _commit(temp_path: str, path: str, overwrite: bool):
+        if overwrite:
+            os.replace(temp_path, path)
+            return
+        # link 在目标已存在时失败, 保证不覆盖的检查与写入是原子的
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            raise RuntimeError(f'Object "{path}" already exists')
+
+    async def get(self, key: str) -> bytes | None:
+        try:
+            return await asyncio.to_thread(pathlib.Path(self.path_of(key)).read_bytes)
+        except FileNotFoundError:
+            return None
+
+    async def stat(self, key: str) -> CloudObjectStat | None:
+        try:
+            stat_result = await asyncio.to_thread(os.stat, self.path_of(key))
+        except FileNotFoundError:
+            return None
+        return CloudObjectStat(
+            size=stat_result.st_size, content_type=mimetypes.guess_type(key)[0], etag=self._etag(stat_result)
+        )
+
+    async def stream(self, key: str, offset: int = 0, length: int = None) -> AsyncIterator[bytes]:
+        """mmap 映射整个文件, 每次在线程中切出一块, Range 读取不需要 seek 与额外的缓冲区"""
+        file = await asyncio.to_thread(open, self.path_of(key), 'rb')
+        try:
+            size = os.fstat(file.fileno()).st_size
+            end = size if length is None else min(size, offset + length)
+            if end <= offset:
+                return
+            mapped = await asyncio.to_thread(mmap.mmap, file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for start in range(offset, end, LOCAL_STORAGE_CHUNK_SIZE):
+                    stop = min(start + LOCAL_STORAGE_CHUNK_SIZE, end)
+                    yield await asyncio.to_thread(mapped.__getitem__, slice(start, stop))
+            finally:
+                mapped.close()
+        finally:
+            file.close()
+
+    async def delete(self, key: str) -> bool:
+        try:
+            await asyncio.to_thread(os.remove, self.path_of(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def list_keys(self, prefix: str = '') -> AsyncIterator[str]:
+        for key in await asyncio.to_thread(self._list_keys, prefix.lstrip('/')):
+            yield key
+
+    def _list_keys(self, prefix: str) -> list[str]:
+        keys = []
+        for dir_path, _, filenames in os.walk(self.path_of(os.path.dirname(prefix))):
+            for filename in filenames:
+                key = os.path.relpath(os.path.join(dir_path, filename), self.root).replace(os.sep, '/')
+                if key.startswith(prefix) and not filename.endswith(TEMP_FILE_SUFFIX):
+                    keys.append(key)
+        return sorted(keys)
+
+    def access_url(self, key: str) -> str:
+        return f'{self.url_prefix}/{key.lstrip("/")}'
+
+    def sign_url(self, key: str, expires: int = 3600) -> str:
+        """本地文件经由 /statics 公开访问, 没有签名"""
+        return self.access_url(key)
+
+    async def stream_response(self, key: str, range_header: str = None, filename: str = None) -> Response:
+        """
+        交给 FileResponse 发送, Range 由 Starlette 根据请求头处理\n
+        服务器支持 http.response.pathsend 扩展时文件内容由服务器直接 sendfile, 不经过应用
+        """
+        path = self.path_of(key)
+        try:
+            stat_result = await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            return Response(status_code=404)
+        return FileResponse(
+            path, stat_result=stat_result, media_type=mimetypes.guess_type(key)[0], filename=filename,
+            content_disposition_type='inline'
+        )
@@ -0,0 +1,65 @@
+import base64
+import hashlib
+from typing import AsyncIterator
+
+from app.libs.ctrl.cloud import CloudObjectStat
+from app.libs.ctrl.storage import ObjectStore, ObjectPutResult, ObjectSource, iter_source
+
+__all__ = (
+    'MemoryObjectStore',
+)
+
+MEMORY_STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class MemoryObjectStore(ObjectStore):
+    """进程内字典实现, 不做任何 IO, 重启即丢失; 只用于测试与压测"""
+    name = 'memory'
+
+    def __init__(self, url_prefix: str = 'memory://objects'):
+        self.url_prefix = url_prefix.rstrip('/')
+        self.objects: dict[str, tuple[bytes, str | None, str]] = {}
+
+    async def put(
+            self, key: str, source: ObjectSource, content_type: str = None, overwrite: bool = True
+    ) -> ObjectPutResult:
+        if not overwrite and key in self.objects:
+            raise RuntimeError(f'Object "{key}" already exists')
+        if isinstance(source, bytes):
+            data = source
+        else:
+            data = b''.join([chunk async for chunk in iter_source(source, MEMORY_STREAM_CHUNK_SIZE)])
+        digest = hashlib.md5(data).digest()
+        etag = f'"{digest.hex()}"'
+        self.objects[key] = (data, content_type, etag)
+        return ObjectPutResult(etag=etag, content_md5=base64.b64encode(digest).decode())
+
+    async def get(self, key: str) -> bytes | None:
+        data, *_ = self.objects.get(key, (None,))
+        return data
+
+    async def stat(self, key: str) -> CloudObjectStat | None:
+        if (item := self.objects.get(key)) is None:
+            return None
+        data, content_type, etag = item
+        return CloudObjectStat(size=len(data), content_type=content_type, etag=etag)
+
+    async def stream(self, key: str, offset: int = 0, length: int = None) -> AsyncIterator[bytes]:
+        if (item := self.objects.get(key)) is None:
+            raise FileNotFoundError(key)
+        view = memoryview(item[0])[offset:None if length is None else offset + length]
+        for start in range(0, len(view), MEMORY_STREAM_CHUNK_SIZE):
+            yield bytes(view[start:start + MEMORY_STREAM_CHUNK_SIZE])
+
+    async def delete(self, key: str) -> bool:
+        return self.objects.pop(key, None) is not None
+
+    async def list_keys(self, prefix: str = '') -> AsyncIterator[str]:
+        for key in sorted(k for k in self.objects if k.startswith(prefix)):
+            yield key
+
+    def access_url(self, key: str) -> str:
+        return f'{self.url_prefix}/{key.lstrip("/")}'
+
+    def sign_url(self, key: str, expires: int = 3600) -> str:
+        return self.access_url(key)
@@ -7,6 +7,7 @@ import os
 import pathlib
 from contextlib import contextmanager, asynccontextmanager
 from datetime import datetime, timedelta
+from functools import lru_cache
 from socket import socket, AF_INET, SOCK_DGRAM
 from typing import Any
 
@@ -38,6 +39,8 @@ __all__ = (
     'traverse_list_ordinal_possibility',
     'serialize',
     'deserialize',
+    'get_template_environment',
+    'compile_templates',
     'render_template',
     'get_dict_value_recursively',
     'update_dict_value_recursively',
@@ -276,11 +279,23 @@ def deserialize(obj_str: str) -> dict:
     return json.loads(obj_str)
 
 
+@lru_cache
+def get_template_environment() -> Environment:
+    """进程内共享的模板环境, 编译后的模板缓存在其中, 不必每次渲染都重新读取与编译"""
+    return Environment(loader=FileSystemLoader(f'{pathlib.Path(__file__).resolve().parent.parent}/templates'))
+
+
+def compile_templates() -> int:
+    """预先编译全部模板, 返回模板数量"""
+    env = get_template_environment()
+    for name in env.list_templates():
+        env.get_template(name)
+    return len(env.list_templates())
+
+
 def render_template(template_name: str, **render_data: dict) -> str:
-    # Create an Environment object that specifies how the template will be loaded as a file system
-    env = Environment(loader=FileSystemLoader(f'{pathlib.Path(__file__).resolve().parent.parent}/templates'))
     # Load a template file, the contents of which is an HTML page with some placeholders
-    template = env.get_template(template_name)
+    template = get_template_environment().get_template(template_name)
     # Call the template's render method, pass in the data, and get the final document.
     return template.render({'data': render_data})
 
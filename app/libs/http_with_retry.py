@@ -1,13 +1,48 @@
+import random
+import time
 from asyncio import sleep
 from enum import Enum
+from urllib.parse import urlsplit
 
-from httpx import AsyncClient, TimeoutException, ConnectError, HTTPStatusError, RequestError
+from httpx import AsyncClient, Limits, Timeout, TimeoutException, ConnectError, HTTPStatusError, RequestError
+
+from app.config import get_settings
+from app.libs.metrics import registry
+from app.libs.tracing import span
+
+try:
+    import h2  # noqa: F401  HTTP/2 为可选依赖
+except ImportError:
+    h2 = None
 
 __all__ = (
+    'RequestMethodEnum',
+    'RetryBudget',
+    'CircuitBreaker',
+    'get_http_client',
+    'warm_up_http_clients',
+    'close_http_clients',
     'request_get_with_retry',
     'request_post_with_retry',
     'request_put_with_retry',
     'request_delete_with_retry',
+    'request_with_retry',
+)
+
+# 这些状态码通常是上游暂时不可用, 值得重试; 其余 4xx/5xx 直接返回失败
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+http_client_requests_total = registry.counter(
+    'http_client_requests_total', 'Outbound HTTP calls by upstream host and outcome', ['host', 'outcome']
+)
+http_client_retries_total = registry.counter(
+    'http_client_retries_total', 'Outbound HTTP retry attempts by upstream host', ['host']
+)
+http_client_retries_denied_total = registry.counter(
+    'http_client_retries_denied_total', 'Retries skipped because the host retry budget was exhausted', ['host']
+)
+http_client_breaker_state = registry.gauge(
+    'http_client_breaker_state', 'Circuit breaker state by upstream host (0 closed, 1 half-open, 2 open)', ['host']
 )
 
 
@@ -18,42 +53,181 @@ class RequestMethodEnum(Enum):
     DELETE = 'DELETE'
 
 
+class RetryBudget:
+    """
+    按上游 host 统计的重试预算\n
+    每个请求存入 ratio 个令牌, 每次重试消耗 1 个, 令牌不足时不再重试, 避免上游故障时重试流量成倍放大
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后熔断, reset_timeout 秒内直接失败\n
+    到期后进入半开状态放行一个探测请求, 成功则恢复, 失败则重新熔断
+    """
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        # 半开状态下探测请求迟迟没有结果时, 同样在 reset_timeout 后再放行一个
+        if self.state != self.CLOSED and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.opened_at = time.monotonic()
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class _UpstreamHost:
+    def __init__(self, host: str):
+        settings = get_settings()
+        http2 = settings.HTTP_CLIENT_HTTP2 and h2 is not None
+        if settings.HTTP_CLIENT_HTTP2 and not http2:
+            print(f'h2 is not installed, {host} falls back to HTTP/1.1')
+        self.client = AsyncClient(
+            http2=http2,
+            timeout=Timeout(settings.HTTP_CLIENT_TIMEOUT),
+            limits=Limits(
+                max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY
+            )
+        )
+        self.budget = RetryBudget(settings.HTTP_RETRY_BUDGET_RATIO, settings.HTTP_RETRY_BUDGET_MAX)
+        self.breaker = CircuitBreaker(settings.HTTP_BREAKER_FAILURE_THRESHOLD, settings.HTTP_BREAKER_RESET_TIMEOUT)
+
+
+_upstreams: dict[str, _UpstreamHost] = {}
+
+
+def _get_upstream(url) -> tuple[str, _UpstreamHost]:
+    parts = urlsplit(str(url))
+    host = f'{parts.scheme}://{parts.netloc}'
+    if (upstream := _upstreams.get(host)) is None:
+        upstream = _upstreams[host] = _UpstreamHost(host)
+    return host, upstream
+
+
+def get_http_client(url) -> AsyncClient:
+    """获取 url 所属 host 的共享客户端, 连接池与 TLS 会话在同一 host 的请求之间复用"""
+    return _get_upstream(url)[1].client
+
+
+async def warm_up_http_clients(*urls):
+    """提前创建这些 host 的共享客户端, 把加载证书、创建 SSLContext 的耗时从第一个请求中移走"""
+    for url in urls:
+        if url:
+            get_http_client(url)
+
+
+async def close_http_clients():
+    """由 lifespan 在关闭时调用"""
+    upstreams = list(_upstreams.values())
+    _upstreams.clear()
+    for upstream in upstreams:
+        await upstream.client.aclose()
+
+
+def backoff_delay(attempt: int) -> float:
+    """指数退避 + 全抖动: 在 [0, min(max, base * 2^attempt)] 内随机等待, 避免多个客户端同时重试"""
+    settings = get_settings()
+    return random.uniform(0, min(settings.HTTP_RETRY_BACKOFF_MAX, settings.HTTP_RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
 async def request_get_with_retry(url, headers=None, params=None, retries=3):
-    await request_with_retry(url, RequestMethodEnum.GET, headers, params, retries)
+    return await request_with_retry(url, RequestMethodEnum.GET, headers, params, retries)
 
 
 async def request_post_with_retry(url, headers=None, params=None, retries=3):
-    await request_with_retry(url, RequestMethodEnum.POST, headers, params, retries)
+    return await request_with_retry(url, RequestMethodEnum.POST, headers, params, retries)
 
 
 async def request_put_with_retry(url, headers=None, params=None, retries=3):
-    await request_with_retry(url, RequestMethodEnum.PUT, headers, params, retries)
+    return await request_with_retry(url, RequestMethodEnum.PUT, headers, params, retries)
 
 
 async def request_delete_with_retry(url, headers=None, params=None, retries=3):
-    await request_with_retry(url, RequestMethodEnum.DELETE, headers, params, retries)
+    return await request_with_retry(url, RequestMethodEnum.DELETE, headers, params, retries)
 
 
 async def request_with_retry(url, method: RequestMethodEnum, headers=None, params=None, retries=3):
-    """封装 GET 请求，支持异步 & 重试"""
-    async with AsyncClient() as client:
+    """封装 HTTP 请求，复用 host 级共享连接池，支持退避重试、重试预算与熔断"""
+    host, upstream = _get_upstream(url)
+    upstream.budget.deposit()
+    with span('http.client', method=method.value, host=urlsplit(str(url)).netloc) as request_span:
         for attempt in range(retries):
+            if attempt:
+                if not upstream.budget.withdraw():
+                    http_client_retries_denied_total.inc(host)
+                    print(f"⚠️ [警告] {host} 重试预算已耗尽，放弃重试")
+                    break
+                http_client_retries_total.inc(host)
+                await sleep(backoff_delay(attempt))
+            if not upstream.breaker.allow():
+                http_client_requests_total.inc(host, 'short_circuited')
+                print(f"⚠️ [警告] {host} 已熔断，直接返回失败")
+                return None
+            if request_span:
+                request_span.set_attribute('attempts', attempt + 1)
             try:
-                response = await client.request(method.value, url, headers=headers, params=params, timeout=10)
+                response = await upstream.client.request(method.value, url, headers=headers, params=params)
+                # 5xx 视为上游故障计入熔断, 4xx 是调用方的问题, 不影响熔断状态
+                if response.status_code >= 500:
+                    upstream.breaker.record_failure()
+                else:
+                    upstream.breaker.record_success()
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    print(f"⚠️ [警告] 上游暂时不可用: {response.status_code}，重试 {attempt + 1}/{retries}...")
+                    continue
                 # 如果 HTTP 状态码 >= 400，抛出异常
-                return response.raise_for_status().json()  # 返回解析后的 JSON 数据
+                result = response.raise_for_status().json()  # 返回解析后的 JSON 数据
+                http_client_requests_total.inc(host, 'success')
+                return result
             except TimeoutException:
+                upstream.breaker.record_failure()
                 print(f"⚠️ [警告] 请求超时，重试 {attempt + 1}/{retries}...")
             except ConnectError:
+                upstream.breaker.record_failure()
                 print(f"⚠️ [警告] 连接失败，检查网络或 API 地址...")
             except HTTPStatusError as e:
                 print(f"⚠️ [错误] HTTP 请求失败: {e.response.status_code} - {e.response.text}")
-                break  # 如果是 HTTP 4xx 或 5xx 错误，不要重试
+                break  # 其余 HTTP 4xx 或 5xx 错误，不要重试
             except RequestError as e:
                 print(f"⚠️ [错误] 发生请求异常: {str(e)}")
                 break
             except ValueError:
                 print("⚠️ [错误] 无法解析 JSON 响应数据")
                 break
-            await sleep(2)  # 失败后等待 2 秒
+            finally:
+                http_client_breaker_state.set(host, value=upstream.breaker.state)
+    http_client_requests_total.inc(host, 'failure')
     return None  # 失败返回 None
@@ -0,0 +1,179 @@
+"""
+身份缓存: 按 ssoUid / email 等唯一字段缓存用户文档, 避免同一页面的多个接口各自查询一次 Mongo\n
+第一层为进程内短 TTL 缓存, 第二层为 Redis; 同一身份的并发查询通过 SingleFlight 合并为一次\n
+文档更新、替换或删除时由 BaseDatabaseModel 的事件钩子调用 invalidate_identity, 并广播给其他 worker\n
+失效时递增每个 key 的代数, 与失效并发的查询读到的旧文档不会回填到 Redis 或进程内缓存
+"""
+import asyncio
+from typing import Generic, Iterable, TypeVar
+
+from beanie import Document
+from redis.exceptions import RedisError
+
+from app.config import get_settings
+from app.libs.cache import LocalTTLCache, SingleFlight
+from app.libs.ctrl.db.redis import RedisCacheController
+from app.libs.metrics import registry
+
+__all__ = (
+    'IdentityCache',
+    'identity_fields',
+    'invalidate_identity',
+    'invalidate_identity_values',
+    'listen_identity_invalidation',
+)
+
+IDENTITY_CACHE_KEY_PREFIX = 'identity:'
+IDENTITY_INVALIDATION_CHANNEL = 'identity:invalidate'
+# 每个 key 的失效代数, 远长于一次查询的耗时即可
+IDENTITY_GENERATION_TTL = 24 * 60 * 60
+# 只有查询开始前读到的代数仍未改变时才写入, 查询期间被失效的旧文档不会写回 Redis
+IDENTITY_FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+D = TypeVar('D', bound=Document)
+
+identity_local_cache: LocalTTLCache[Document] = LocalTTLCache(
+    max_size=get_settings().IDENTITY_LOCAL_CACHE_SIZE, ttl=get_settings().IDENTITY_LOCAL_CACHE_TTL
+)
+identity_single_flight: SingleFlight[Document | None] = SingleFlight()
+# 所有 IdentityCache 实例, 文档变更时按模型类型找到需要失效的 key
+identity_caches: list['IdentityCache'] = []
+identity_metrics = {'mongo_loads': 0, 'redis_hits': 0, 'stale_fills_skipped': 0}
+# 本进程收到的失效次数, 查询期间有失效发生时结果不写入进程内缓存
+identity_local_generation = 0
+
+
+class IdentityCache(Generic[D]):
+    """
+    以 model 的唯一字段 field 为 key 的两级缓存, 不缓存查询不到的结果\n
+    含 __encrypted_fields__ 的模型只使用进程内缓存, 解密后的内容不写入 Redis\n
+    返回的是缓存文档的副本, 调用方修改 (例如 update_fields) 不会影响其他请求拿到的实例
+    """
+
+    def __init__(self, model: type[D], field: str):
+        self.model = model
+        self.field = field
+        self.use_redis = not getattr(model, '__encrypted_fields__', None)
+        identity_caches.append(self)
+
+    def key_of(self, value) -> str:
+        return f'{IDENTITY_CACHE_KEY_PREFIX}{self.model.__name__}:{self.field}:{value}'
+
+    async def get(self, value) -> D | None:
+        if value is None:
+            return None
+        key = self.key_of(value)
+        if (document := identity_local_cache.get(key)) is None:
+            document = await identity_single_flight.do(key, lambda: self.fetch(key, value))
+        return document.model_copy() if document is not None else None
+
+    async def fetch(self, key: str, value) -> D | None:
+        """查询期间本进程收到过失效广播时, 结果只返回给本次调用, 不写入进程内缓存"""
+        generation = identity_local_generation
+        document = await self.load(key, value)
+        if document is not None and generation == identity_local_generation:
+            identity_local_cache.set(key, document)
+        return document
+
+    async def load(self, key: str, value) -> D | None:
+        if not self.use_redis:
+            identity_metrics['mongo_loads'] += 1
+            return await self.model.find_one({self.field: value})
+        async with RedisCacheController() as cache:
+            if (cached := await cache.get(key)) is not None:
+                identity_metrics['redis_hits'] += 1
+                return self.model.model_validate_json(cached)
+            generation = await cache.get(generation_key(key)) or ''
+            identity_metrics['mongo_loads'] += 1
+            if (document := await self.model.find_one({self.field: value})) is not None:
+                if not await cache.eval(
+                        IDENTITY_FILL_SCRIPT, 2, key, generation_key(key), generation, document.model_dump_json(),
+                        get_settings().IDENTITY_REDIS_CACHE_TTL
+                ):
+                    identity_metrics['stale_fills_skipped'] += 1
+        return document
+
+
+def generation_key(key: str) -> str:
+    return f'{key}:gen'
+
+
+async def invalidate_identity(document: Document):
+    """
+    删除文档对应的全部身份缓存并通知其他 worker, 不属于任何 IdentityCache 的模型直接返回\n
+    按文档当前的字段值计算 key; 唯一字段本身被修改时, 旧值对应的缓存由 TTL 兜底
+    """
+    await invalidate_identity_keys([
+        cache.key_of(getattr(document, cache.field)) for cache in identity_caches if isinstance(document, cache.model)
+    ])
+
+
+def identity_fields(model: type[Document]) -> list[str]:
+    return [cache.field for cache in identity_caches if issubclass(model, cache.model)]
+
+
+async def invalidate_identity_values(model: type[Document], values: Iterable[dict]):
+    """批量写入不经过文档事件, 按原始文档 (或写入的字段) 中的身份字段失效, 不含身份字段的条目忽略"""
+    values = list(values)
+    await invalidate_identity_keys(list({
+        cache.key_of(value[cache.field])
+        for cache in identity_caches if issubclass(model, cache.model)
+        for value in values if value.get(cache.field) is not None
+    }))
+
+
+async def invalidate_identity_keys(keys: list[str]):
+    """删除缓存并递增每个 key 的代数, 正在进行的查询 (本进程或其他 worker) 不会再把旧文档写回缓存"""
+    if not keys:
+        return
+    pop_local_keys(keys)
+    async with RedisCacheController() as cache:
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.delete(*keys)
+            for key in keys:
+                pipe.incr(generation_key(key))
+                pipe.expire(generation_key(key), IDENTITY_GENERATION_TTL)
+            await pipe.execute()
+        await cache.publish(IDENTITY_INVALIDATION_CHANNEL, ' '.join(keys))
+
+
+def pop_local_keys(keys: Iterable[str]):
+    global identity_local_generation
+    identity_local_generation += 1
+    for key in keys:
+        identity_local_cache.pop(key)
+
+
+async def listen_identity_invalidation():
+    """订阅失效广播并清理进程内缓存, 由 lifespan 以后台任务方式启动"""
+    while True:
+        try:
+            async with RedisCacheController() as cache:
+                async with cache.pubsub() as pubsub:
+                    await pubsub.subscribe(IDENTITY_INVALIDATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message.get('type') == 'message':
+                            pop_local_keys(message.get('data').split(' '))
+        except RedisError as e:
+            print(f'Identity invalidation listener disconnected: {e}, retrying...')
+            # 断线期间无法收到广播, 清空本地缓存以免返回已修改的用户
+            pop_local_keys(())
+            identity_local_cache.clear()
+            await asyncio.sleep(1)
+
+
+def get_identity_cache_metrics() -> dict:
+    return identity_metrics | {
+        'coalesced': identity_single_flight.coalesced,
+        'fresh': identity_single_flight.fresh,
+        'local_cache': identity_local_cache.metrics,
+    }
+
+
+registry.register_collector('identity_cache', get_identity_cache_metrics)
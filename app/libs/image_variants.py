@@ -0,0 +1,220 @@
+"""
+图片衍生图: 按 IMAGE_VARIANT_WIDTHS 与 IMAGE_VARIANT_FORMATS 生成缩略图, 与原图存放在同一目录\n
+上传请求只写入原图, 衍生图在后台任务中从存储读回原图后生成, 不延长上传的响应时间\n
+解码与编码在进程池中完成, 不占用事件循环与 GIL; Pillow 为可选依赖, 未安装时只保存原图\n
+已生成的衍生图记录在进程内索引中, 只返回确实存在的衍生图地址, 不存在时回退到原图
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+from app.config import get_settings
+from app.libs.cache import LocalTTLCache
+from app.libs.ctrl.storage import ObjectStore
+from app.libs.ctrl.storage.cas import is_content_addressed_path
+from app.libs.custom import cus_print
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 为可选依赖
+    Image = ImageOps = None
+
+__all__ = (
+    'IMAGE_VARIANT_FORMATS',
+    'variant_widths',
+    'variant_formats',
+    'image_variants_enabled',
+    'variant_path',
+    'pick_variant_width',
+    'select_variant_path',
+    'record_variants',
+    'check_variants',
+    'render_variants',
+    'generate_image_variants',
+    'generate_stored_image_variants',
+    'schedule_image_variants',
+    'shutdown_image_executor',
+)
+
+# 格式名 -> (Pillow 编码器名称, 扩展名, Content-Type)
+IMAGE_VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'avif': ('AVIF', 'avif', 'image/avif'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+# 矢量图不需要缩略图
+SKIPPED_CONTENT_TYPES = {'image/svg+xml'}
+SKIPPED_EXTENSIONS = ('.svg', '.svg+xml')
+
+# 索引的条目数与有效期, 过期后重新检查, 之后补生成的衍生图也能被发现
+VARIANT_INDEX_SIZE = 4096
+VARIANT_INDEX_TTL = 60 * 60
+
+_executor: ProcessPoolExecutor | None = None
+_pillow_warned = False
+# 原图路径 -> 已存在的 (宽度, 格式); 本进程上传时直接写入, 其余由后台检查补全
+_variant_index: LocalTTLCache[frozenset] = LocalTTLCache(max_size=VARIANT_INDEX_SIZE, ttl=VARIANT_INDEX_TTL)
+_variant_checks: dict[str, asyncio.Task] = {}
+# 正在后台生成衍生图的任务, 保留引用避免被回收, 关闭时取消
+_variant_tasks: set[asyncio.Task] = set()
+
+
+def variant_widths() -> tuple[int, ...]:
+    return tuple(sorted({int(w) for w in get_settings().IMAGE_VARIANT_WIDTHS.split(',') if w.strip()}))
+
+
+def variant_formats() -> tuple[str, ...]:
+    formats = [f.strip().lower() for f in get_settings().IMAGE_VARIANT_FORMATS.split(',') if f.strip()]
+    return tuple(f for f in formats if f in IMAGE_VARIANT_FORMATS)
+
+
+def image_variants_enabled() -> bool:
+    global _pillow_warned
+    if not variant_widths() or not variant_formats():
+        return False
+    if Image is None and not _pillow_warned:
+        _pillow_warned = True
+        print('Pillow is not installed, image variants are disabled')
+    return Image is not None
+
+
+def variant_path(file_path: str, width: int, image_format: str) -> str:
+    """websites/a/b.png -> websites/a/b@480w.webp"""
+    base, _ = os.path.splitext(file_path)
+    return f'{base}@{width}w.{IMAGE_VARIANT_FORMATS[image_format][1]}'
+
+
+def pick_variant_width(width: int) -> int:
+    """选出不小于所需宽度的最小衍生图宽度, 都小于所需宽度时取最大的一档"""
+    widths = variant_widths()
+    return next((w for w in widths if w >= width), widths[-1])
+
+
+def select_variant_path(store: ObjectStore, file_path: str, width: int, image_format: str = None) -> str:
+    """
+    返回适合 width 的衍生图路径; 未启用衍生图、原图为矢量图或该衍生图不存在时返回原图路径\n
+    索引中还没有该图片时先返回原图, 同时在后台检查衍生图是否存在, 之后的调用即可拿到衍生图
+    """
+    if not image_variants_enabled() or file_path.endswith(SKIPPED_EXTENSIONS):
+        return file_path
+    formats = variant_formats()
+    variant = (pick_variant_width(width), image_format if image_format in formats else formats[0])
+    if (available := _variant_index.get(file_path)) is None:
+        schedule_variant_check(store, file_path)
+        return file_path
+    return variant_path(file_path, *variant) if variant in available else file_path
+
+
+def record_variants(file_path: str, variants: Iterable[tuple[int, str]]):
+    _variant_index.set(file_path, frozenset(variants))
+
+
+async def check_variants(store: ObjectStore, file_path: str) -> frozenset:
+    """逐个检查当前配置的衍生图是否存在并写入索引, 例如配置衍生图之前上传的图片, 或生成失败的图片"""
+    variants = [(width, image_format) for width in variant_widths() for image_format in variant_formats()]
+    exists = await asyncio.gather(*(store.exists(variant_path(file_path, *variant)) for variant in variants))
+    available = frozenset(variant for variant, found in zip(variants, exists) if found)
+    record_variants(file_path, available)
+    return available
+
+
+def schedule_variant_check(store: ObjectStore, file_path: str):
+    if file_path in _variant_checks:
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(check_variants(store, file_path))
+    except RuntimeError:  # 不在事件循环中调用时无法检查, 只返回原图
+        return
+    _variant_checks[file_path] = task
+    task.add_done_callback(lambda t: _on_variant_check_done(file_path, t))
+
+
+def _on_variant_check_done(file_path: str, task: asyncio.Task):
+    _variant_checks.pop(file_path, None)
+    if not task.cancelled() and (error := task.exception()) is not None:
+        cus_print(f'Failed to check variants for {file_path}: {error}', 'w')
+
+
+def render_variants(data: bytes, widths: tuple[int, ...], formats: tuple[str, ...], quality: int) -> dict:
+    """
+    在子进程中执行, 返回 {(宽度, 格式): 编码后的字节}\n
+    原图比目标宽度窄时不放大, 只转换格式, 保证每一档衍生图都存在
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    results = {}
+    for width in widths:
+        resized = image.copy()
+        resized.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+        for image_format in formats:
+            encoder = IMAGE_VARIANT_FORMATS[image_format][0]
+            target = resized.convert('RGB') if encoder == 'JPEG' and resized.mode != 'RGB' else resized
+            output = io.BytesIO()
+            target.save(output, format=encoder, quality=quality)
+            results[(width, image_format)] = output.getvalue()
+    return results
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=get_settings().IMAGE_VARIANT_WORKERS)
+    return _executor
+
+
+def shutdown_image_executor():
+    """由 lifespan 在关闭对象存储之前调用, 取消尚未完成的衍生图任务"""
+    global _executor
+    for task in _variant_tasks:
+        task.cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def generate_image_variants(
+        store: ObjectStore, file_path: str, data: bytes, content_type: str = None
+) -> list[str]:
+    """生成并上传 file_path 的全部衍生图, 与原图写入同一后端, 返回写入的路径"""
+    if content_type in SKIPPED_CONTENT_TYPES or not image_variants_enabled():
+        return []
+    rendered = await asyncio.get_running_loop().run_in_executor(
+        get_image_executor(), render_variants, data, variant_widths(), variant_formats(),
+        get_settings().IMAGE_VARIANT_QUALITY
+    )
+    paths = [variant_path(file_path, width, image_format) for width, image_format in rendered]
+    await asyncio.gather(*(
+        store.put(path, body, IMAGE_VARIANT_FORMATS[image_format][2])
+        for path, ((_, image_format), body) in zip(paths, rendered.items())
+    ))
+    record_variants(file_path, rendered)
+    return paths
+
+
+async def generate_stored_image_variants(store: ObjectStore, file_path: str, content_type: str = None) -> list[str]:
+    """从存储中读回原图并生成衍生图, 失败时只记录日志, 不影响原图; 内容寻址的图片已有衍生图时跳过"""
+    try:
+        first_variant = variant_path(file_path, variant_widths()[0], variant_formats()[0])
+        if is_content_addressed_path(file_path) and await store.exists(first_variant):
+            await check_variants(store, file_path)
+            return []
+        # 解码需要完整的图片内容, 只在后台任务中读入内存
+        if (data := await store.get(file_path)) is None:
+            return []
+        return await generate_image_variants(store, file_path, data, content_type)
+    except Exception as e:
+        cus_print(f'Failed to generate variants for {file_path}: {e}', 'w')
+        return []
+
+
+def schedule_image_variants(store: ObjectStore, file_path: str, content_type: str = None) -> asyncio.Task | None:
+    """在后台生成衍生图, 调用方不必等待; 生成完成前 select_variant_path 返回原图"""
+    if content_type in SKIPPED_CONTENT_TYPES or not image_variants_enabled():
+        return None
+    task = asyncio.create_task(generate_stored_image_variants(store, file_path, content_type))
+    _variant_tasks.add(task)
+    task.add_done_callback(_variant_tasks.discard)
+    return task
@@ -0,0 +1,233 @@
+"""
+请求日志文件: 按 worker 分区写入, 按大小与时间轮转, 轮转后的分段在后台压缩\n
+同时提供离线读取工具, 可直接流式扫描压缩后的 JSON Lines 日志:\n
+python -m app.libs.log_sink --path /account --min-latency 200
+"""
+import argparse
+import ctypes
+import glob
+import gzip
+import io
+import json
+import os
+import pathlib
+import re
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Iterator, TextIO
+
+try:
+    import zstandard
+except ImportError:  # zstd 压缩为可选依赖, 未安装时回退到 gzip
+    zstandard = None
+
+__all__ = (
+    'PartitionedRotatingFileHandler',
+    'default_log_dir',
+    'open_log_segment',
+    'iter_request_logs',
+)
+
+LOG_SEGMENT_SUFFIXES = ('.log', '.log.gz', '.log.zst')
+WIN32_PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+WIN32_ERROR_ACCESS_DENIED = 5
+WIN32_STILL_ACTIVE = 259
+
+
+def default_log_dir() -> str:
+    """日志默认写到项目根目录的 logs 下, 不再放在对外挂载的 statics 目录中"""
+    return f'{pathlib.Path(__file__).resolve().parent.parent.parent}/logs'
+
+
+class PartitionedRotatingFileHandler(RotatingFileHandler):
+    """
+    每个 worker 写入自己的文件 {name}.{hostname}-{pid}.log, 多个 uvicorn worker 之间不会争用同一个文件\n
+    文件超过 max_bytes 或距上次轮转超过 rotate_interval 秒时轮转, 轮转出的分段交给后台线程压缩,
+    每个分区最多保留 backup_count 个分段\n
+    重启或 worker 重建后 pid 改变, 同一主机上进程已退出的分区由存活的 worker 接管: 压缩遗留的文件,
+    所有已退出分区合计最多保留 backup_count 个分段
+    """
+
+    def __init__(
+            self, log_dir: str, name: str, max_bytes: int = 0, rotate_interval: int = 0, backup_count: int = 0,
+            compression: str = 'gzip'
+    ):
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_dir = log_dir
+        self.host_prefix = f'{name}.{socket.gethostname()}-'
+        self.partition = f'{self.host_prefix}{os.getpid()}'
+        self.partition_prefix = os.path.join(log_dir, self.partition)
+        # {name}.{hostname}-{pid}.log 或 {name}.{hostname}-{pid}.{timestamp}.log[.gz|.zst], 主机名中可能含有 '.'
+        self.file_pattern = re.compile(
+            rf'{re.escape(self.host_prefix)}(\d+)(?:\.(\d{{8}}-\d{{6}}-\d{{6}}))?\.log(\.gz|\.zst)?'
+        )
+        super().__init__(
+            f'{self.partition_prefix}.log', mode='a', maxBytes=max_bytes, backupCount=backup_count,
+            encoding='utf-8', delay=True
+        )
+        self.rotate_interval = rotate_interval
+        self.rollover_at = time.time() + rotate_interval if rotate_interval else 0
+        self.compression = compression if compression != 'zstd' or zstandard else 'gzip'
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compressor')
+        self._compressor.submit(self.sweep_stale_partitions)
+
+    def shouldRollover(self, record) -> bool:
+        if self.rollover_at and time.time() >= self.rollover_at and os.path.exists(self.baseFilename):
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename):
+            segment = f'{self.partition_prefix}.{datetime.now().strftime("%Y%m%d-%H%M%S-%f")}.log'
+            os.rename(self.baseFilename, segment)
+            # 压缩与清理放到独立线程, 不阻塞日志写入线程
+            self._compressor.submit(self.compress_segment, segment)
+        if self.rotate_interval:
+            self.rollover_at = time.time() + self.rotate_interval
+        if not self.delay:
+            self.stream = self._open()
+
+    def compress_segment(self, segment: str, target: str = None):
+        """压缩结果写入 {target}.gz / {target}.zst, target 默认为 segment 本身"""
+        target = target or segment
+        match self.compression:
+            case 'gzip':
+                with open(segment, 'rb') as src, gzip.open(f'{target}.gz', 'wb') as dst:
+                    while chunk := src.read(1024 * 1024):
+                        dst.write(chunk)
+                os.remove(segment)
+            case 'zstd':
+                with open(segment, 'rb') as src, open(f'{target}.zst', 'wb') as dst:
+                    zstandard.ZstdCompressor().copy_stream(src, dst)
+                os.remove(segment)
+            case _ if segment != target:
+                os.rename(segment, target)
+        self.prune_segments()
+
+    def iter_host_files(self) -> Iterator[tuple[int, str, str | None, str | None]]:
+        """本主机上该日志所有分区的文件, 返回 (pid, 路径, 分段时间戳, 压缩后缀), 当前文件的时间戳为 None"""
+        for path in glob.glob(os.path.join(glob.escape(self.log_dir), f'{glob.escape(self.host_prefix)}*')):
+            if match := self.file_pattern.fullmatch(os.path.basename(path)):
+                yield int(match.group(1)), path, match.group(2), match.group(3)
+
+    def sweep_stale_partitions(self):
+        """接管已退出进程遗留的未压缩文件, 先改名认领再压缩, 多个 worker 同时启动时只有一个能认领成功"""
+        for pid, path, timestamp, suffix in list(self.iter_host_files()):
+            if suffix or pid == os.getpid() or _pid_alive(pid):
+                continue
+            timestamp = timestamp or datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+            segment = os.path.join(self.log_dir, f'{self.host_prefix}{pid}.{timestamp}.log')
+            claimed = f'{segment}.{os.getpid()}.claim'
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            self.compress_segment(claimed, target=segment)
+        self.prune_segments()
+
+    def prune_segments(self):
+        if self.backupCount <= 0:
+            return
+        # 当前分区与所有已退出的分区各自最多保留 backup_count 个分段, 其他存活 worker 的分区由其自身清理
+        groups: dict[str, list[tuple[str, str]]] = {'current': [], 'stale': []}
+        for pid, path, timestamp, _ in self.iter_host_files():
+            if timestamp is None:
+                continue
+            if pid == os.getpid():
+                groups['current'].append((timestamp, path))
+            elif not _pid_alive(pid):
+                groups['stale'].append((timestamp, path))
+        for segments in groups.values():
+            # 按分段时间戳排序, 不同 pid 的分段之间也能比较先后
+            for _, path in sorted(segments)[:-self.backupCount]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        super().close()
+        self._compressor.shutdown(wait=True)
+
+
+def _pid_alive(pid: int) -> bool:
+    if sys.platform == 'win32':
+        return _win32_pid_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # 进程存在但属于其他用户
+        pass
+    return True
+
+
+def _win32_pid_alive(pid: int) -> bool:
+    """Windows 上 os.kill(pid, 0) 会直接结束目标进程, 改为查询进程退出码"""
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    handle = kernel32.OpenProcess(WIN32_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # 无权限打开说明进程仍存在, 其余错误 (ERROR_INVALID_PARAMETER) 视为已退出
+        return ctypes.get_last_error() == WIN32_ERROR_ACCESS_DENIED
+    try:
+        exit_code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == WIN32_STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def open_log_segment(path: str) -> TextIO:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f'zstandard is required to read {path}')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_request_logs(
+        log_dir: str = None, name: str = 'api-requests', path: str = None, min_latency_ms: float = None
+) -> Iterator[dict]:
+    """
+    逐行扫描所有分区与分段 (含压缩分段), 只在内存中保留当前一行\n
+    :param log_dir: 日志目录
+    :param name: 日志名称
+    :param path: 只返回以该前缀开头的请求路径
+    :param min_latency_ms: 只返回处理时间不低于该阈值的请求
+    """
+    log_dir = log_dir or default_log_dir()
+    for segment in sorted(glob.glob(os.path.join(glob.escape(log_dir), f'{name}.*'))):
+        if not segment.endswith(LOG_SEGMENT_SUFFIXES):
+            continue
+        with open_log_segment(segment) as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if path and not str(item.get('path', '')).startswith(path):
+                    continue
+                if min_latency_ms is not None and item.get('process_time_ms', 0) < min_latency_ms:
+                    continue
+                yield item
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scan request log segments')
+    parser.add_argument('--dir', default=None, help='log directory')
+    parser.add_argument('--name', default='api-requests', help='log name')
+    parser.add_argument('--path', default=None, help='request path prefix')
+    parser.add_argument('--min-latency', type=float, default=None, help='minimum process time in ms')
+    args = parser.parse_args()
+    for log_item in iter_request_logs(args.dir, args.name, args.path, args.min_latency):
+        print(json.dumps(log_item, ensure_ascii=False))
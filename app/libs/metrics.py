@@ -0,0 +1,321 @@
+"""
+进程内指标注册表与 Prometheus 文本格式输出\n
+指标只在事件循环线程内更新, 不加锁; 多 worker 部署时每个 worker 定期把快照写入 METRICS_DIR,
+/metrics 接口读取所有 worker 的快照合并后输出, 计数器与直方图相加, gauge 带 worker 标签分别输出
+"""
+import asyncio
+import bisect
+import glob
+import json
+import os
+import socket
+import tempfile
+import time
+from typing import Callable, Iterable
+
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+from app.config import get_settings
+
+__all__ = (
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'MetricsRegistry',
+    'MetricsMiddleware',
+    'registry',
+    'http_requests_in_flight',
+    'http_request_duration_seconds',
+    'business_responses_total',
+    'metrics_dir',
+    'flush_metrics_periodically',
+    'remove_metrics_snapshot',
+    'render_metrics',
+    'collect_all_workers',
+)
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10)
+LABEL_SEPARATOR = '\x1f'
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples: dict[tuple, float | list] = {}
+
+    def snapshot(self) -> dict:
+        return {
+            'type': self.type, 'help': self.documentation, 'labelnames': list(self.labelnames),
+            # 直方图的桶计数列表会被请求原地更新, 快照需要复制一份, 写盘线程读取时才不会与之并发
+            'samples': {
+                LABEL_SEPARATOR.join(labels): list(value) if isinstance(value, list) else value
+                for labels, value in self.samples.items()
+            },
+        }
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.samples[labels] = self.samples.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.samples[labels] = self.samples.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.samples[labels] = self.samples.get(labels, 0) - amount
+
+    def set(self, *labels: str, value: float):
+        self.samples[labels] = value
+
+
+class Histogram(_Metric):
+    """每组标签对应 [各桶计数..., +Inf 桶计数, sum, count], 桶计数非累计, 输出时再累加"""
+    type = 'histogram'
+
+    def __init__(
+            self, name: str, documentation: str, labelnames: Iterable[str] = (),
+            buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels: str, value: float):
+        if (sample := self.samples.get(labels)) is None:
+            sample = self.samples[labels] = [0] * (len(self.buckets) + 3)
+        sample[bisect.bisect_left(self.buckets, value)] += 1
+        sample[-2] += value
+        sample[-1] += 1
+
+    def snapshot(self) -> dict:
+        return super().snapshot() | {'buckets': list(self.buckets)}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = {}
+        self.collectors: dict[str, Callable[[], dict]] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+            self, name: str, documentation: str, labelnames: Iterable[str] = (),
+            buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, prefix: str, collect: Callable[[], dict]):
+        """
+        注册一个返回 dict 的采集函数, 采集时其中的数值 (含嵌套 dict) 展开为 {prefix}_{key} 形式的 gauge\n
+        用于接入连接池、缓存等已有的统计数据
+        """
+        self.collectors[prefix] = collect
+
+    def _register(self, metric: _Metric):
+        if metric.name in self.metrics:
+            return self.metrics[metric.name]
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> dict:
+        result = {name: metric.snapshot() for name, metric in self.metrics.items()}
+        for prefix, collect in self.collectors.items():
+            try:
+                values = collect()
+            except Exception as e:
+                print(f'Metrics collector {prefix} failed: {e}')
+                continue
+            for name, value in _flatten(prefix, values):
+                result[name] = {'type': 'gauge', 'help': '', 'labelnames': [], 'samples': {'': value}}
+        return result
+
+
+def _flatten(prefix: str, values: dict) -> Iterable[tuple[str, float]]:
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(f'{prefix}_{key}', value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}_{key}', value
+
+
+def merge_snapshots(snapshots: dict[str, dict]) -> dict:
+    """
+    合并 {worker: 快照}, 计数器按标签逐项相加, 直方图逐桶相加\n
+    gauge 是各进程自身的状态 (就绪、连接池大小等), 相加没有意义, 增加 worker 标签后分别输出
+    """
+    merged: dict = {}
+    for worker, snapshot in snapshots.items():
+        for name, metric in snapshot.items():
+            if metric['type'] == 'gauge':
+                metric = metric | {
+                    'labelnames': ['worker', *metric['labelnames']],
+                    'samples': {
+                        LABEL_SEPARATOR.join((worker, labels)) if metric['labelnames'] else worker: value
+                        for labels, value in metric['samples'].items()
+                    },
+                }
+            if name not in merged:
+                merged[name] = metric | {'samples': dict(metric['samples'])}
+                continue
+            samples = merged[name]['samples']
+            for labels, value in metric['samples'].items():
+                if labels not in samples:
+                    samples[labels] = value
+                elif isinstance(value, list):
+                    samples[labels] = [a + b for a, b in zip(samples[labels], value)]
+                else:
+                    samples[labels] = samples[labels] + value
+    return merged
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: list[str], labels: str, extra: str = '') -> str:
+    pairs = [
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in zip(labelnames, labels.split(LABEL_SEPARATOR) if labelnames else [])
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render_metrics(snapshot: dict) -> str:
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        if metric['help']:
+            lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        for labels, value in metric['samples'].items():
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{_format_labels(metric["labelnames"], labels)} {value}')
+                continue
+            cumulative = 0
+            for upper, count in zip([*metric['buckets'], '+Inf'], value[:-2]):
+                cumulative += count
+                le = _format_labels(metric['labelnames'], labels, f'le="{upper}"')
+                lines.append(f'{name}_bucket{le} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(metric["labelnames"], labels)} {value[-2]}')
+            lines.append(f'{name}_count{_format_labels(metric["labelnames"], labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+http_requests_in_flight = registry.gauge(
+    'http_requests_in_flight', 'HTTP requests currently being processed', ['method']
+)
+http_request_duration_seconds = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template', ['method', 'route', 'status']
+)
+business_responses_total = registry.counter(
+    'business_responses_total', 'ResponseModel business status codes returned by view models', ['view_model', 'code']
+)
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件, 记录进行中的请求数与按路由模板、方法、状态码划分的延迟直方图\n
+    路由取自路由匹配后写入 scope 的 route, 未匹配的请求统一记为 <unmatched>, 避免原始 URL 造成标签爆炸
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        method = scope['method']
+        status_code = 500
+        start_time = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        http_requests_in_flight.inc(method)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec(method)
+            route = scope.get('route')
+            http_request_duration_seconds.observe(
+                method, getattr(route, 'path_format', None) or getattr(route, 'path', '<unmatched>'),
+                str(status_code), value=time.perf_counter() - start_time
+            )
+
+
+def metrics_dir() -> str:
+    return get_settings().METRICS_DIR or os.path.join(tempfile.gettempdir(), f'{get_settings().APP_NAME}-metrics')
+
+
+def _worker_id() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def _snapshot_path() -> str:
+    return os.path.join(metrics_dir(), f'{_worker_id()}.json')
+
+
+def _write_snapshot(snapshot: dict):
+    os.makedirs(metrics_dir(), exist_ok=True)
+    path = _snapshot_path()
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _read_snapshots(max_age: float) -> dict[str, dict]:
+    """返回 {worker: 快照}, worker 取自快照文件名"""
+    snapshots = {}
+    own_path = _snapshot_path()
+    for path in glob.glob(os.path.join(glob.escape(metrics_dir()), '*.json')):
+        try:
+            if path == own_path or time.time() - os.path.getmtime(path) > max_age:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshots[os.path.basename(path)[:-len('.json')]] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+async def flush_metrics_periodically():
+    """由 lifespan 启动, 定期把本 worker 的快照写入共享目录供其他 worker 聚合"""
+    while True:
+        await asyncio.sleep(get_settings().METRICS_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(_write_snapshot, registry.snapshot())
+        except OSError as e:
+            print(f'Failed to flush metrics snapshot: {e}')
+
+
+def remove_metrics_snapshot():
+    try:
+        os.remove(_snapshot_path())
+    except OSError:
+        pass
+
+
+async def collect_all_workers() -> str:
+    """本 worker 使用实时数据, 其他 worker 使用最近一次写入的快照, 超过 3 个刷新周期未更新的快照视为已退出"""
+    max_age = get_settings().METRICS_FLUSH_INTERVAL * 3
+    others = await asyncio.to_thread(_read_snapshots, max_age)
+    return render_metrics(merge_snapshots({_worker_id(): registry.snapshot(), **others}))
@@ -0,0 +1,217 @@
+"""
+请求日志: 事件循环内只负责组装日志并投递到内存队列, 由后台线程完成格式化与写盘
+"""
+import json
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import parse_qsl
+
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+from app.config import get_settings
+from app.libs.metrics import registry
+
+__all__ = (
+    'JsonFormatter',
+    'DropOldestQueueHandler',
+    'DropOldestQueueListener',
+    'RequestLogSampler',
+    'RequestLogMiddleware',
+    'build_request_log',
+    'start_request_log_listener',
+    'stop_request_log_listener',
+    'get_request_log_metrics',
+)
+
+_listener: QueueListener | None = None
+_queue_handler: 'DropOldestQueueHandler | None' = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        # 如果传入的是 dict，会自动 dump 成 JSON 字符串
+        if isinstance(record.msg, dict):
+            record.msg = json.dumps(record.msg, ensure_ascii=False)
+        return super().format(record)
+
+
+class DropOldestQueueHandler(QueueHandler):
+    """
+    有界队列处理器, 队列满时丢弃最旧的一条日志而不是阻塞调用方\n
+    格式化推迟到 QueueListener 所在线程执行, 事件循环内只做一次入队
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__(queue.Queue(maxsize=max_size))
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        self.dropped += put_drop_oldest(self.queue, record)
+
+
+class DropOldestQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # 默认实现在队列满时会抛出 queue.Full, 导致后台线程无法停止
+        put_drop_oldest(self.queue, self._sentinel)
+
+
+def put_drop_oldest(target: queue.Queue, item) -> int:
+    """非阻塞入队, 队列满时丢弃最旧的元素, 返回丢弃的数量"""
+    dropped = 0
+    while True:
+        try:
+            target.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                target.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+class RequestLogSampler:
+    """
+    按路径前缀配置采样率, 例如 "/status=0,/account/users=0.1", 最长前缀优先, 未匹配的路径使用默认采样率
+    """
+
+    def __init__(self, default_rate: float = 1.0, path_rates: str | None = None):
+        self.default_rate = default_rate
+        self.path_rates: list[tuple[str, float]] = []
+        for item in (path_rates or '').split(','):
+            if '=' not in item:
+                continue
+            prefix, rate = item.split('=', 1)
+            self.path_rates.append((prefix.strip(), float(rate)))
+        self.path_rates.sort(key=lambda x: len(x[0]), reverse=True)
+
+    def rate_of(self, path: str) -> float:
+        for prefix, rate in self.path_rates:
+            if path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def should_log(self, path: str) -> bool:
+        rate = self.rate_of(path)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+# 只有文本类请求体才会被记录, multipart 上传与二进制内容直接透传
+LOGGABLE_CONTENT_TYPES = (
+    'application/json', 'application/x-www-form-urlencoded', 'application/xml', 'text/',
+)
+
+
+def is_loggable_content_type(content_type: str) -> bool:
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return not media_type or media_type.endswith('+json') or media_type.startswith(LOGGABLE_CONTENT_TYPES)
+
+
+class RequestLogMiddleware:
+    """
+    纯 ASGI 请求日志中间件
+
+    不预先读取请求体, 只在请求体流经时截取前 REQUEST_LOG_BODY_MAX_BYTES 字节, 上传等大请求以恒定内存透传
+    """
+
+    def __init__(self, app: ASGIApp, logger: logging.Logger, sampler: RequestLogSampler = None):
+        self.app = app
+        self.logger = logger
+        self.sampler = sampler or RequestLogSampler()
+        self.max_bytes = get_settings().REQUEST_LOG_BODY_MAX_BYTES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not self.sampler.should_log(scope['path']):
+            return await self.app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        headers = {key.decode('latin-1'): val.decode('latin-1') for key, val in scope['headers']}
+        capture_body = is_loggable_content_type(headers.get('content-type', ''))
+        body = bytearray()
+        body_truncated = False
+        status_code = 500
+
+        async def receive_with_tee() -> Message:
+            nonlocal body_truncated
+            message = await receive()
+            if capture_body and message['type'] == 'http.request':
+                chunk = message.get('body', b'')
+                remaining = self.max_bytes - len(body)
+                if remaining > 0:
+                    body.extend(chunk[:remaining])
+                body_truncated = body_truncated or len(chunk) > remaining
+            return message
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive_with_tee, send_with_status)
+        finally:
+            self.logger.info(build_request_log(
+                scope['path'], scope['method'], dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'))),
+                headers, bytes(body), status_code, (time.perf_counter() - start_time) * 1000,
+                body_truncated=body_truncated, body_skipped=not capture_body
+            ))
+
+
+def build_request_log(
+        path: str, method: str, query_params: dict, headers: dict, body: bytes, status_code: int,
+        process_time_ms: float, body_truncated: bool = False, body_skipped: bool = False
+) -> dict:
+    """只保留白名单内的请求头, 请求体按配置截断"""
+    allowed_headers = {h.strip().lower() for h in get_settings().REQUEST_LOG_HEADERS.split(',') if h.strip()}
+    max_bytes = get_settings().REQUEST_LOG_BODY_MAX_BYTES
+    return {
+        "path": path, "method": method,
+        "query_params": query_params,
+        "request_body": body[:max_bytes].decode("utf-8", errors="ignore"),
+        "request_body_truncated": body_truncated or len(body) > max_bytes,
+        "request_body_skipped": body_skipped,
+        "request_headers": {key: val for key, val in headers.items() if key.lower() in allowed_headers},
+        "status_code": status_code,
+        "process_time_ms": process_time_ms,
+    }
+
+
+def start_request_log_listener(logger: logging.Logger, *handlers: logging.Handler) -> QueueListener:
+    """为 logger 挂载队列处理器, 真正写盘的 handlers 交给后台 QueueListener 线程"""
+    global _listener, _queue_handler
+    stop_request_log_listener()
+    if _queue_handler is not None:
+        logger.removeHandler(_queue_handler)
+    _queue_handler = DropOldestQueueHandler(get_settings().REQUEST_LOG_QUEUE_SIZE)
+    logger.addHandler(_queue_handler)
+    _listener = DropOldestQueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_request_log_listener():
+    """停止后台线程, 队列中剩余的日志会在停止前写完"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_request_log_metrics() -> dict:
+    if _queue_handler is None:
+        return {}
+    return {
+        'queue_size': _queue_handler.queue.qsize(),
+        'queue_max_size': _queue_handler.queue.maxsize,
+        'dropped': _queue_handler.dropped,
+    }
+
+
+registry.register_collector('request_log', get_request_log_metrics)
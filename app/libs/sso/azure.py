@@ -1,17 +1,28 @@
+import asyncio
+import hashlib
+import time
 import uuid
 from datetime import datetime
 from typing import Optional
 from urllib.parse import urlencode
 
-import httpx
 from fastapi import Depends, HTTPException
 from httpx import HTTPStatusError
 from pydantic import BaseModel, ValidationError, Field, EmailStr
+from redis.exceptions import RedisError, LockError
 
 from app.config import get_settings
+from app.libs.cache import LocalTTLCache, SingleFlight
 from app.libs.ctrl.db import RedisCacheController
+from app.libs.http_with_retry import get_http_client
+from app.libs.metrics import registry
 from app.libs.sso import OptionalOAuth2AuthorizationCodeBearer
 
+PROFILE_CACHE_KEY_PREFIX = 'sso:azure:profile:'
+PROFILE_INVALIDATION_CHANNEL = 'sso:azure:profile:invalidate'
+PROFILE_FETCH_LOCK_PREFIX = 'sso:azure:profile-lock:'
+GRAPH_ME_URL = 'https://graph.microsoft.com/v1.0/me'
+
 oauth2_scheme = OptionalOAuth2AuthorizationCodeBearer(
     authorizationUrl=f"{get_settings().SSO_AZURE_BASE_URL}/oauth2/v2.0/authorize",
     tokenUrl=f"{get_settings().SSO_AZURE_BASE_URL}/oauth2/v2.0/token",
@@ -109,6 +120,15 @@ class AzureSSOUser(BaseModel):
         }
 
 
+profile_local_cache: LocalTTLCache[AzureSSOUser] = LocalTTLCache(
+    max_size=get_settings().SSO_PROFILE_LOCAL_CACHE_SIZE, ttl=get_settings().SSO_PROFILE_LOCAL_CACHE_TTL
+)
+
+profile_single_flight: SingleFlight[AzureSSOUser] = SingleFlight()
+# graph_fetches: 实际请求 Graph 的次数, remote_coalesced: 等待其他 worker 写回缓存而省去的请求次数
+profile_fetch_metrics = {'graph_fetches': 0, 'remote_coalesced': 0}
+
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
@@ -133,23 +153,107 @@ async def generate_sso_login_url() -> str:
     return f"{get_settings().SSO_AZURE_BASE_URL}/oauth2/v2.0/authorize?{urlencode(auth_params)}"
 
 
+def hash_access_token(access_token: str) -> str:
+    """缓存键使用 token 的摘要, 避免 token 明文出现在 Redis 与内存字典中"""
+    return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+
 async def get_user_profile(access_token: Optional[str] = Depends(oauth2_scheme)) -> AzureSSOUser | None:
     if not access_token:
         return None
+    token_digest = hash_access_token(access_token)
+    # 第一层: 进程内缓存, 直接返回已校验的模型, 不经过网络与 pydantic 解析
+    if admin_profile := profile_local_cache.get(token_digest):
+        return admin_profile
     try:
-        async with RedisCacheController() as cache:
-            if admin_profile_json := await cache.get(access_token):
-                return AzureSSOUser.model_validate_json(admin_profile_json)
-            async with httpx.AsyncClient() as client:
-                response = await client.get("https://graph.microsoft.com/v1.0/me", headers={
-                    "Authorization": f"Bearer {access_token}"
-                })
-                admin_profile = AzureSSOUser.model_validate(response.raise_for_status().json())
-                await cache.set(access_token, admin_profile.model_dump_json(), ex=60 * 60 * 12)
-                return admin_profile
+        # 同一 token 的并发未命中合并为一次加载
+        admin_profile = await profile_single_flight.do(
+            token_digest, lambda: load_user_profile(access_token, token_digest)
+        )
+        profile_local_cache.set(token_digest, admin_profile)
+        return admin_profile
     except HTTPException:
         return None
     except HTTPStatusError:
         return None
     except ValidationError:
         return None
+
+
+async def load_user_profile(access_token: str, token_digest: str) -> AzureSSOUser:
+    """
+    第二层: Redis 缓存, 未命中时再请求 Graph /me\n
+    跨 worker 通过短租约的 Redis 锁保证同一 token 只有一个 worker 请求 Graph, 其余 worker 轮询等待其写回缓存
+    """
+    profile_key = f'{PROFILE_CACHE_KEY_PREFIX}{token_digest}'
+    lease = get_settings().SSO_PROFILE_FETCH_LOCK_LEASE_MS / 1000
+    async with RedisCacheController() as cache:
+        if admin_profile_json := await cache.get(profile_key):
+            return AzureSSOUser.model_validate_json(admin_profile_json)
+
+        lock = cache.lock(f'{PROFILE_FETCH_LOCK_PREFIX}{token_digest}', timeout=lease, blocking=False)
+        if not await lock.acquire():
+            deadline = time.monotonic() + lease
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                if admin_profile_json := await cache.get(profile_key):
+                    profile_fetch_metrics['remote_coalesced'] += 1
+                    return AzureSSOUser.model_validate_json(admin_profile_json)
+            # 租约到期仍未写回, 说明持锁 worker 失败, 自行请求
+            return await fetch_user_profile(cache, access_token, profile_key)
+        try:
+            return await fetch_user_profile(cache, access_token, profile_key)
+        finally:
+            try:
+                await lock.release()
+            except LockError:
+                pass
+
+
+async def fetch_user_profile(cache: RedisCacheController, access_token: str, profile_key: str) -> AzureSSOUser:
+    profile_fetch_metrics['graph_fetches'] += 1
+    response = await get_http_client(GRAPH_ME_URL).get(GRAPH_ME_URL, headers={
+        "Authorization": f"Bearer {access_token}"
+    })
+    admin_profile = AzureSSOUser.model_validate(response.raise_for_status().json())
+    await cache.set(profile_key, admin_profile.model_dump_json(), ex=60 * 60 * 12)
+    return admin_profile
+
+
+def get_user_profile_fetch_metrics() -> dict:
+    return profile_fetch_metrics | {
+        'coalesced': profile_single_flight.coalesced,
+        'fresh': profile_single_flight.fresh,
+        'local_cache': profile_local_cache.metrics,
+    }
+
+
+registry.register_collector('sso_profile', get_user_profile_fetch_metrics)
+
+
+async def invalidate_user_profile(access_token: str):
+    """删除 token 对应的用户信息缓存, 并通知其他 worker 清理各自的进程内缓存"""
+    if not access_token:
+        return
+    token_digest = hash_access_token(access_token)
+    profile_local_cache.pop(token_digest)
+    async with RedisCacheController() as cache:
+        await cache.delete(f'{PROFILE_CACHE_KEY_PREFIX}{token_digest}')
+        await cache.publish(PROFILE_INVALIDATION_CHANNEL, token_digest)
+
+
+async def listen_user_profile_invalidation():
+    """订阅失效广播并清理进程内缓存, 由 lifespan 以后台任务方式启动"""
+    while True:
+        try:
+            async with RedisCacheController() as cache:
+                async with cache.pubsub() as pubsub:
+                    await pubsub.subscribe(PROFILE_INVALIDATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message.get('type') == 'message':
+                            profile_local_cache.pop(message.get('data'))
+        except RedisError as e:
+            print(f'Profile invalidation listener disconnected: {e}, retrying...')
+            # 断线期间无法收到广播, 清空本地缓存以免返回已注销的用户信息
+            profile_local_cache.clear()
+            await asyncio.sleep(1)
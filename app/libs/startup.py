@@ -0,0 +1,143 @@
+"""
+启动编排: 相互独立的初始化步骤并发执行, 记录每个阶段的耗时\n
+关键步骤失败时启动失败; 非关键的预热可以推迟到第一个请求之后, 不拖慢就绪时间
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import get_settings
+from app.libs.custom import cus_print
+from app.libs.metrics import registry
+
+__all__ = (
+    'StartupPhase',
+    'StartupOrchestrator',
+    'FirstRequestMiddleware',
+    'startup',
+)
+
+# 探针与指标采集不算真正的业务请求, 不触发推迟的预热
+PROBE_PATHS = ('/ready', '/status', '/metrics')
+
+
+class StartupPhase:
+    __slots__ = ('name', 'critical', 'status', 'duration_ms', 'error')
+
+    def __init__(self, name: str, critical: bool = True):
+        self.name = name
+        self.critical = critical
+        self.status = 'pending'
+        self.duration_ms: float | None = None
+        self.error: str | None = None
+
+    def to_dict(self) -> dict:
+        return {'status': self.status, 'critical': self.critical, 'duration_ms': self.duration_ms, 'error': self.error}
+
+
+class StartupOrchestrator:
+    """
+    进程内唯一的启动状态, lifespan 负责驱动, /ready 与 /metrics 负责对外展示\n
+    ready 只在所有关键步骤完成后为 True, 关闭开始时重新置为 False, 负载均衡可以据此摘除实例
+    """
+
+    def __init__(self):
+        self.phases: dict[str, StartupPhase] = {}
+        self.ready = False
+        self.started_at = time.perf_counter()
+        self.ready_ms: float | None = None
+        self._deferred: list[tuple[str, Callable[[], Awaitable]]] = []
+        self._deferred_task: asyncio.Task | None = None
+        self._first_request: asyncio.Event | None = None
+
+    async def run_phase(self, name: str, func: Callable[[], Awaitable], critical: bool = True):
+        phase = self.phases[name] = StartupPhase(name, critical)
+        phase.status = 'running'
+        start = time.perf_counter()
+        try:
+            result = await func()
+            phase.status = 'done'
+            return result
+        except asyncio.CancelledError:
+            phase.status = 'cancelled'
+            raise
+        except Exception as e:
+            phase.status, phase.error = 'failed', f'{type(e).__name__}: {e}'
+            if critical:
+                raise
+            cus_print(f'Startup phase {name} failed: {phase.error}', 'w')
+        finally:
+            phase.duration_ms = (time.perf_counter() - start) * 1000
+
+    async def run_concurrently(self, *steps: tuple[str, Callable[[], Awaitable]]) -> list:
+        """并发执行相互独立的关键步骤, 任一失败时取消其余步骤并抛出该异常, 返回值按传入顺序排列"""
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(self.run_phase(name, func)) for name, func in steps]
+        except* Exception as e:
+            raise e.exceptions[0]
+        return [task.result() for task in tasks]
+
+    def defer(self, name: str, func: Callable[[], Awaitable]):
+        """登记非关键的预热步骤, 失败只记录日志; 由 start_deferred 决定立即执行还是等到第一个请求之后"""
+        self.phases[name] = StartupPhase(name, critical=False)
+        self.phases[name].status = 'deferred'
+        self._deferred.append((name, func))
+
+    def start_deferred(self):
+        self._first_request = asyncio.Event()
+        if not get_settings().STARTUP_DEFER_WARMUPS:
+            self._first_request.set()
+        self._deferred_task = asyncio.create_task(self._run_deferred())
+
+    async def _run_deferred(self):
+        await self._first_request.wait()
+        steps, self._deferred = self._deferred, []
+        await asyncio.gather(*(self.run_phase(name, func, critical=False) for name, func in steps))
+
+    def notify_request(self):
+        if self._first_request is not None and not self._first_request.is_set():
+            self._first_request.set()
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_ms = (time.perf_counter() - self.started_at) * 1000
+        timings = ', '.join(f'{p.name}={p.duration_ms:.0f}ms' for p in self.phases.values() if p.duration_ms is not None)
+        print(f'Startup ready in {self.ready_ms:.0f}ms ({timings})')
+
+    def mark_stopping(self):
+        self.ready = False
+        if self._deferred_task is not None:
+            self._deferred_task.cancel()
+
+    @property
+    def report(self) -> dict:
+        return {
+            'ready': self.ready, 'ready_ms': self.ready_ms,
+            'phases': {name: phase.to_dict() for name, phase in self.phases.items()},
+        }
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            'ready': int(self.ready), 'ready_ms': self.ready_ms or 0.0,
+            **{f'{name}_ms': phase.duration_ms for name, phase in self.phases.items() if phase.duration_ms is not None},
+        }
+
+
+startup = StartupOrchestrator()
+registry.register_collector('startup', lambda: startup.metrics)
+
+
+class FirstRequestMiddleware:
+    """纯 ASGI 中间件, 在第一个业务请求到达时触发推迟的预热, 之后只是一次属性判断"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'http' and not scope['path'].startswith(PROBE_PATHS):
+            startup.notify_request()
+        await self.app(scope, receive, send)
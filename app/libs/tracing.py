@@ -0,0 +1,245 @@
+"""
+轻量链路追踪: 基于 contextvars 的 span, 可插拔导出器, 以及按请求汇总的 Server-Timing 响应头\n
+TRACING_EXPORTER=none 且未开启 TRACING_SERVER_TIMING 时, span 退化为空操作
+"""
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+from app.config import get_settings
+from app.libs.log_sink import PartitionedRotatingFileHandler, default_log_dir
+from app.libs.request_log import JsonFormatter, DropOldestQueueHandler, DropOldestQueueListener
+
+__all__ = (
+    'Span',
+    'SpanExporter',
+    'NoopSpanExporter',
+    'FileSpanExporter',
+    'TracingMiddleware',
+    'get_span_exporter',
+    'shutdown_tracing',
+    'tracing_enabled',
+    'current_span',
+    'start_span',
+    'span',
+    'traced',
+    'format_server_timing',
+)
+
+_current_span: ContextVar['Span | None'] = ContextVar('current_span', default=None)
+# 当前请求内已结束的 span, 由 TracingMiddleware 在请求开始时创建, 用于生成 Server-Timing
+_request_spans: ContextVar['list[Span] | None'] = ContextVar('request_spans', default=None)
+_exporter: 'SpanExporter | None' = None
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'error', 'start_time', '_start', 'duration')
+
+    def __init__(self, name: str, parent: 'Span | None' = None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.error: str | None = None
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: float | None = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.duration if self.duration is not None else time.perf_counter() - self._start) * 1000
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.error = f'{type(exc).__name__}: {exc}'
+
+    def end(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if (spans := _request_spans.get()) is not None:
+            spans.append(self)
+        get_span_exporter().export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name, 'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+            'start_time': self.start_time, 'duration_ms': self.duration_ms,
+            'attributes': self.attributes, 'error': self.error,
+        }
+
+
+class SpanExporter:
+    enabled = True
+
+    def export(self, finished_span: Span):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class NoopSpanExporter(SpanExporter):
+    enabled = False
+
+    def export(self, finished_span: Span):
+        pass
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    span 以 JSON Lines 写入 {log_dir}/spans.{hostname}-{pid}.log, 轮转与压缩沿用请求日志的配置\n
+    与请求日志一样先进入有界内存队列, 由后台线程写盘
+    """
+
+    def __init__(self, log_dir: str = None):
+        handler = PartitionedRotatingFileHandler(
+            log_dir=log_dir or get_settings().REQUEST_LOG_DIR or default_log_dir(), name='spans',
+            max_bytes=get_settings().REQUEST_LOG_MAX_BYTES,
+            rotate_interval=get_settings().REQUEST_LOG_ROTATE_INTERVAL,
+            backup_count=get_settings().REQUEST_LOG_BACKUP_COUNT,
+            compression=get_settings().REQUEST_LOG_COMPRESSION
+        )
+        handler.setFormatter(JsonFormatter('%(message)s'))
+        self.queue_handler = DropOldestQueueHandler(get_settings().REQUEST_LOG_QUEUE_SIZE)
+        self.listener = DropOldestQueueListener(self.queue_handler.queue, handler)
+        self.listener.start()
+
+    def export(self, finished_span: Span):
+        self.queue_handler.enqueue(logging.makeLogRecord({'msg': finished_span.to_dict(), 'levelno': logging.INFO}))
+
+    def shutdown(self):
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+def get_span_exporter() -> SpanExporter:
+    global _exporter
+    if _exporter is None:
+        match get_settings().TRACING_EXPORTER:
+            case 'file':
+                _exporter = FileSpanExporter()
+            case _:
+                _exporter = NoopSpanExporter()
+    return _exporter
+
+
+def shutdown_tracing():
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+
+def tracing_enabled() -> bool:
+    """当前上下文是否需要记录 span: 导出器已启用, 或当前请求需要生成 Server-Timing"""
+    return get_span_exporter().enabled or _request_spans.get() is not None
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def start_span(name: str, **attributes) -> Span | None:
+    """
+    创建一个不切换当前上下文的 span, 由调用方负责 end()\n
+    用于开始与结束位于不同回调中的场景, 例如 pymongo 的 CommandListener
+    """
+    if not tracing_enabled():
+        return None
+    return Span(name, _current_span.get(), **attributes)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span | None]:
+    """
+    with span('redis', command='GET'): ...\n
+    在 with 块内该 span 成为当前 span, 块内创建的 span 自动成为其子 span
+    """
+    if not tracing_enabled():
+        yield None
+        return
+    current = Span(name, _current_span.get(), **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name: str) -> Callable:
+    """异步函数装饰器, 整个调用包在名为 name 的 span 中"""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def format_server_timing(spans: list[Span], total_ms: float) -> str:
+    """同名 span 合并为一项, dur 为累计耗时, desc 记录调用次数"""
+    summary: dict[str, list] = {}
+    for item in spans:
+        entry = summary.setdefault(item.name, [0.0, 0])
+        entry[0] += item.duration_ms
+        entry[1] += 1
+    parts = [f'{name};dur={duration:.1f};desc="x{count}"' for name, (duration, count) in summary.items()]
+    parts.append(f'total;dur={total_ms:.1f}')
+    return ', '.join(parts)
+
+
+class TracingMiddleware:
+    """
+    纯 ASGI 中间件, 为每个请求创建根 span\n
+    开启 TRACING_SERVER_TIMING 时, 把请求内各 span 的耗时汇总写入 Server-Timing 响应头, 便于在浏览器开发者工具中查看
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.server_timing = get_settings().TRACING_SERVER_TIMING
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not (self.server_timing or get_span_exporter().enabled):
+            return await self.app(scope, receive, send)
+
+        spans_token = _request_spans.set([]) if self.server_timing else None
+
+        async def send_with_timing(message: Message):
+            if message['type'] == 'http.response.start':
+                route = scope.get('route')
+                root.set_attribute('route', getattr(route, 'path_format', None) or getattr(route, 'path', None))
+                root.set_attribute('status', message['status'])
+                if self.server_timing:
+                    timing = format_server_timing(_request_spans.get(), root.duration_ms)
+                    message['headers'] = [
+                        *message.get('headers', []),
+                        (b'server-timing', timing.encode('latin-1')),
+                        (b'timing-allow-origin', get_settings().FRONTEND_DOMAIN.encode('latin-1')),
+                    ]
+            await send(message)
+
+        try:
+            with span('http.request', method=scope['method'], path=scope['path']) as root:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            if spans_token is not None:
+                _request_spans.reset(spans_token)
@@ -3,13 +3,17 @@ from typing import Annotated, Optional
 
 from beanie import Indexed
 from pydantic import Field, EmailStr, HttpUrl, BaseModel
-from pymongo import ASCENDING
+from pymongo import ASCENDING, IndexModel
 
-from app.libs.ctrl.db.mongodb import BaseDatabaseModel
+from app.libs.ctrl.db.indexes import QueryShape
+from app.libs.ctrl.db.mongodb import BaseDatabaseModel, ProjectionView
+from app.libs.identity import IdentityCache
 from app.models import SupportImageMIMEType
 
 __all__ = (
     'UserModel',
+    'UserSummary',
+    'UserListItemView',
     'UserProfile',
     'TokenEndpointAuthMethodsSupported',
     'ResponseTypesSupported',
@@ -27,6 +31,9 @@ __all__ = (
     'AdminModel',
     'AdminRoleEnum',
     'AdminProfile',
+    'user_by_sso_uid',
+    'user_by_email',
+    'admin_by_email',
 )
 
 
@@ -255,6 +262,16 @@ class UserModel(BaseDatabaseModel):
     status: UserStatusEnum = Field(default=UserStatusEnum.NEEDS_APPROVAL, description='User status')
     company: Optional[IPCompanyDataType | None] = Field(None, description='User payment gateway configuration')
 
+    __query_indexes__ = [
+        # 按单位分页列出用户: affiliation 等值匹配后按 _id 范围扫描
+        IndexModel([('affiliation', ASCENDING), ('_id', ASCENDING)], name='affiliation_id'),
+    ]
+    __query_shapes__ = {
+        'list_by_affiliation': QueryShape(filter={'affiliation': 'example.com'}, sort=[('_id', ASCENDING)]),
+        'find_by_sso_uid': QueryShape(filter={'ssoUid': 'example'}),
+        'find_by_email_and_affiliation': QueryShape(filter={'email': 'user@example.com', 'affiliation': 'example.com'}),
+    }
+
     class Settings:
         name = 'users'
         strict = False
@@ -273,13 +290,51 @@ class UserModel(BaseDatabaseModel):
         return result
 
 
+class UserSummary(ProjectionView):
+    """只需要判断用户是否存在、类型与状态时使用, 不读取与校验 company 等大字段"""
+    __model__ = UserModel
+
+    email: str
+    userType: UserTypeEnum = UserTypeEnum.BUYER
+    status: UserStatusEnum = UserStatusEnum.NEEDS_APPROVAL
+
+
+class UserListItemView(ProjectionView):
+    """用户列表使用的投影, 只读取 information 需要的字段"""
+    __model__ = UserModel
+
+    email: str
+    name: str
+    username: str
+    userType: UserTypeEnum = UserTypeEnum.BUYER
+
+    @property
+    def information(self):
+        return {
+            'email': self.email,
+            'name': self.name,
+            'username': self.username,
+            'userType': self.userType.name.title(),
+        }
+
+
 class AdminModel(BaseDatabaseModel):
     email: Annotated[EmailStr, Indexed(EmailStr, unique=True)] = Field(..., description='User email')
     role: AdminRoleEnum = Field(default=AdminRoleEnum.GENERAL, description='Admin role')
 
+    __query_shapes__ = {
+        'find_by_email': QueryShape(filter={'email': 'admin@example.com'}),
+    }
+
     class Settings:
         name = 'administrators'
         strict = False
         indexes = [
             [('_id', ASCENDING)],
         ]
+
+
+# 每个请求都要按身份读取当前用户, 经由身份缓存读取, 文档更新时自动失效
+user_by_sso_uid: IdentityCache[UserModel] = IdentityCache(UserModel, 'ssoUid')
+user_by_email: IdentityCache[UserModel] = IdentityCache(UserModel, 'email')
+admin_by_email: IdentityCache[AdminModel] = IdentityCache(AdminModel, 'email')
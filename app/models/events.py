@@ -3,8 +3,9 @@ from enum import IntEnum, Enum
 from typing import Optional
 
 from pydantic import Field, BaseModel, EmailStr
-from pymongo import HASHED
+from pymongo import ASCENDING, HASHED, IndexModel
 
+from app.libs.ctrl.db.indexes import QueryShape
 from app.libs.ctrl.db.mongodb import BaseDatabaseModel
 from app.models import SupportImageMIMEType
 from app.models.account import CertificationItemFileType
@@ -221,6 +222,24 @@ class EventModel(BaseDatabaseModel):
         None, description='User business registration certificate'
     )
 
+    __query_indexes__ = [
+        # 等值 (status) -> 排序 (startTime) -> 范围 (endTime), 同时覆盖按状态列出、进行中与已过期的查询
+        IndexModel(
+            [('status', ASCENDING), ('startTime', ASCENDING), ('endTime', ASCENDING)], name='status_startTime_endTime'
+        ),
+    ]
+    __query_shapes__ = {
+        'list_by_status': QueryShape(filter={'status': EventStatusEnum.ONGOING.value}, sort=[('startTime', ASCENDING)]),
+        'ongoing_now': QueryShape(filter={
+            'status': EventStatusEnum.ONGOING.value, 'startTime': {'$lte': datetime.now()},
+            'endTime': {'$gte': datetime.now()},
+        }),
+        'expired': QueryShape(filter={
+            'status': {'$in': [EventStatusEnum.ONGOING.value, EventStatusEnum.CLOSED.value]},
+            'endTime': {'$lt': datetime.now()},
+        }),
+    }
+
     class Settings:
         name = 'events'
         strict = False
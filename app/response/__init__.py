@@ -1,23 +1,37 @@
+import re
 from asyncio import sleep
-from typing import Generic
+from typing import AsyncIterator, Callable, Generic
 from typing import TypeVar
+from urllib.parse import quote
 
 from pydantic import Field, BaseModel
-from starlette.responses import StreamingResponse
+from starlette.responses import Response, StreamingResponse
 
 from app.config import get_settings
 from app.libs.constants import ResponseStatusCodeEnum, get_response_message
+from app.libs.custom import serialize
+from app.libs.metrics import business_responses_total
+from app.libs.tracing import span
 
 T = TypeVar('T')
 
 __all__ = (
     'ResponseModel',
+    'BaseCursorPaginationResponseDataType',
     'IllegalParametersResponseModel',
     'InternalServerErrorResponseModel',
     'create_response',
     'create_event_stream_response',
+    'create_ndjson_stream_response',
+    'RangeNotSatisfiableError',
+    'parse_range_header',
+    'content_disposition',
+    'create_range_stream_response',
 )
 
+RANGE_HEADER_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+CONTENT_DISPOSITION_UNSAFE_PATTERN = re.compile(r'[^\x20-\x7e]|["\\]')
+
 VMT = TypeVar("VMT", bound="BaseViewModel")
 PGItemT = TypeVar('PGItemT')
 
@@ -41,6 +55,16 @@ class BasePaginationResponseDataType(BaseModel, Generic[PGItemT]):
     items: list[PGItemT] = Field(..., description='List of items on the current page')
 
 
+class BaseCursorPaginationResponseDataType(BaseModel, Generic[PGItemT]):
+    pageSize: int = Field(..., description='Number of items per page')
+    nextCursor: str | None = Field(
+        None, description='Cursor of the next page, null when there is no next page',
+        examples=['665f1c2e8b3a4d0012ab34cd']
+    )
+    hasMore: bool = Field(..., description='Whether there is a next page')
+    items: list[PGItemT] = Field(..., description='List of items on the current page')
+
+
 class IllegalParametersResponseModel(ResponseModel[list[str]]):
     data: list[str] = Field(..., description='Response data', examples=[["query → errorFieldName: Error message"]])
 
@@ -74,8 +98,76 @@ class InternalServerErrorResponseModel(ResponseModel[str]):
 
 
 async def create_response(view_model: VMT, *args, response_handler: callable = None, **kwargs) -> ResponseModel:
-    async with view_model(*args, **kwargs) as response:
-        return response_handler(response) if response_handler else response
+    with span('view_model', view_model=view_model.__name__):
+        async with view_model(*args, **kwargs) as response:
+            business_responses_total.inc(view_model.__name__, str(getattr(response.code, 'value', response.code)))
+            return response_handler(response) if response_handler else response
+
+
+class RangeNotSatisfiableError(ValueError):
+    pass
+
+
+def parse_range_header(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    解析单个 Range 请求头, 返回 (起始位置, 长度)
+
+    没有 Range、格式不支持 (例如多段 Range) 时返回 None, 按完整内容返回; 范围超出对象长度时抛出 RangeNotSatisfiableError
+    """
+    if not range_header or not (match := RANGE_HEADER_PATTERN.match(range_header.strip())):
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N 表示最后 N 个字节
+        length = min(int(end), size)
+        if length == 0:
+            raise RangeNotSatisfiableError(range_header)
+        return size - length, length
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiableError(range_header)
+    return start, end - start + 1
+
+
+def content_disposition(filename: str, disposition: str = 'inline') -> str:
+    """
+    filename 只保留可打印 ASCII 作为兼容旧客户端的回退, 完整文件名按 RFC 5987 放在 filename* 中\n
+    引号、反斜杠、CR/LF 等字符不会原样进入响应头
+    """
+    fallback = CONTENT_DISPOSITION_UNSAFE_PATTERN.sub('_', filename)
+    return f'{disposition}; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+
+def create_range_stream_response(
+        open_stream: Callable[[int, int], AsyncIterator[bytes]], size: int, range_header: str = None,
+        media_type: str = None, etag: str = None, filename: str = None
+) -> Response:
+    """
+    以固定内存透传对象内容, 支持 Range 请求
+
+    :param open_stream: 按 (起始位置, 长度) 打开对象流的函数, 只会调用一次
+    :param size: 对象总长度
+    :param range_header: 请求头中的 Range
+    """
+    headers = {'Accept-Ranges': 'bytes'}
+    if etag:
+        headers['ETag'] = etag
+    if filename:
+        headers['Content-Disposition'] = content_disposition(filename)
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except RangeNotSatisfiableError:
+        return Response(status_code=416, headers=headers | {'Content-Range': f'bytes */{size}'})
+    start, length = byte_range or (0, size)
+    headers['Content-Length'] = str(length)
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    return StreamingResponse(
+        open_stream(start, length), status_code=206 if byte_range else 200, headers=headers, media_type=media_type
+    )
 
 
 async def create_event_stream_response(view_model: VMT, *args, **kwargs) -> StreamingResponse:
@@ -86,3 +178,18 @@ async def create_event_stream_response(view_model: VMT, *args, **kwargs) -> Stre
             await sleep(5)
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+def create_ndjson_stream_response(response: ResponseModel) -> Response:
+    """
+    作为 create_response 的 response_handler 使用: 成功时 data 为异步迭代器, 逐条输出为一行 JSON\n
+    失败时 (例如无权限) 仍返回普通的 ResponseModel
+    """
+    if response.code != ResponseStatusCodeEnum.OPERATING_SUCCESSFULLY:
+        return response
+
+    async def lines():
+        async for item in response.data:
+            yield serialize(item) + b'\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
@@ -36,4 +36,4 @@ class UserInfoListQueryResponseDataItem(BaseModel):
     email: EmailStr = Field(..., description='Account email address 邮箱地址', examples=['example@example.com'])
     name: str = Field(..., description='Account name 姓名', examples=['Example'])
     username: str = Field(..., description='Account username 用户名', examples=['example'])
-    userType: UserTypeEnum = Field(..., description='Account title 用户头衔', examples=[UserTypeEnum.SELLER])
+    userType: str = Field(..., description='Account title 用户头衔', examples=[UserTypeEnum.SELLER.name.title()])
@@ -11,3 +11,4 @@ class StatusResponseData(BaseModel):
     database: bool = Field(..., description='Event start time')
     redis: bool = Field(..., description='Event end time')
     kafka: bool = Field(..., description='Event end time')
+    redisPool: dict = Field({}, description='Redis shared connection pool metrics')
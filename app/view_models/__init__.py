@@ -1,21 +1,30 @@
 import abc
-πimport json
+import csv
+import json
 from datetime import datetime
 from io import StringIO
+from typing import AsyncIterable, BinaryIO
 
 from dateutil.relativedelta import relativedelta
 from faker.proxy import Faker
 from fastapi import Request, BackgroundTasks, UploadFile
+from fastapi.responses import Response
 from httpx import TimeoutException
 
 from app.config import get_settings
 from app.libs.constants import ResponseStatusCodeEnum, get_response_message
-from app.libs.ctrl.cloud import AzureBlobController, AzureBlobUploadResult
+from app.libs.ctrl.cloud import AliCloudOssBucketController
 from app.libs.ctrl.db import RedisCacheController
+from app.libs.ctrl.storage import ObjectPutResult, get_object_store
+from app.libs.ctrl.storage.cas import is_content_addressed_path, put_content_addressed
 from app.libs.custom import cus_print
+from app.libs.image_variants import select_variant_path, schedule_image_variants
+from app.libs.tracing import span
 from app.models import SupportImageMIMEType
-from app.models.account import UserModel, UserProfile, AdminRoleEnum, AdminProfile, AdminModel, UserTypeEnum
-from app.response import ResponseModel
+from app.models.account import (
+    UserModel, UserProfile, AdminRoleEnum, AdminProfile, AdminModel, UserTypeEnum, user_by_sso_uid, admin_by_email
+)
+from app.response import ResponseModel, create_range_stream_response
 
 __all__ = (
     'ViewModelException',
@@ -60,7 +69,8 @@ class BaseViewModel:
         try:
             async with RedisCacheController() as cache:
                 self.redis = cache
-                await self.before()
+                with span('vm.before'):
+                    await self.before()
         except TimeoutException as e:
             self.request_timeout(str(e))
         except ViewModelRequestException:
@@ -73,7 +83,8 @@ class BaseViewModel:
         )
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.after()
+        with span('vm.after'):
+            await self.after()
         if exc_type:
             cus_print(f'{exc_type}: {exc_val}', )
         return True
@@ -81,7 +92,7 @@ class BaseViewModel:
     @abc.abstractmethod
     async def before(self):
         if self.user_profile:
-            self.user_instance = await UserModel.find_one(UserModel.ssoUid == self.user_profile.ssouid)
+            self.user_instance = await user_by_sso_uid.get(self.user_profile.ssouid)
         if self.access_title:
             if not self.user_instance:
                 self.forbidden('User not have access')
@@ -227,7 +238,7 @@ class BaseAdminViewModel(BaseViewModel):
     @abc.abstractmethod
     async def before(self):
         if self.user_profile:
-            self.user_instance = await AdminModel.find_one(AdminModel.email == self.user_profile.email)
+            self.user_instance = await admin_by_email.get(self.user_profile.email)
         if not self.user_instance:
             self.forbidden('User not found')
         if self.access_title and self.user_instance.role not in self.access_title:
@@ -235,34 +246,78 @@ class BaseAdminViewModel(BaseViewModel):
 
 
 class BaseOssViewModel:
+    """对象读写经由 get_object_store(), 具体后端由 OBJECT_STORAGE_BACKEND 决定"""
 
     def __init__(self):
         self.root = ''
 
     @staticmethod
-    async def generate_access_url(file_path: str | list[str]) -> list[str] | str:
-        async with AzureBlobController() as ab_c:
-            if isinstance(file_path, str):
-                return ab_c.generate_access_url(file_path)
-            return [ab_c.generate_access_url(path) for path in file_path]
+    def generate_access_url(
+            file_path: str | list[str], width: int = None, image_format: str = None
+    ) -> list[str] | str:
+        """
+        指定 width 时返回不小于该宽度的衍生图地址, 列表等只需要缩略图的场景不再下发原图;
+        衍生图不存在 (配置衍生图之前上传、生成失败) 时返回原图地址\n
+        :param image_format: webp / avif / jpeg, 未配置该格式时使用 IMAGE_VARIANT_FORMATS 中的第一个
+        """
+        store = get_object_store()
+        paths = [file_path] if isinstance(file_path, str) else file_path
+        if width:
+            paths = [select_variant_path(store, path, width, image_format) for path in paths]
+        urls = [store.access_url(path) for path in paths]
+        return urls[0] if isinstance(file_path, str) else urls
+
+    @staticmethod
+    async def upload_file(file_path: str, data: bytes | str, overwrite: bool = True) -> ObjectPutResult:
+        if isinstance(data, str):
+            data = data.encode()
+        return await get_object_store().put(file_path, data, overwrite=overwrite)
 
     @staticmethod
-    async def upload_file(file_path: str, data: bytes | str, overwrite: bool = True) -> AzureBlobUploadResult:
-        async with AzureBlobController() as ab_c:
-            return await ab_c.upload_file(file_path, data, overwrite)
+    async def upload_stream(
+            file_path: str, source: AsyncIterable[bytes] | BinaryIO, overwrite: bool = True, content_type: str = None
+    ) -> ObjectPutResult:
+        return await get_object_store().put(file_path, source, content_type, overwrite)
 
     @staticmethod
     async def delete_file(file_path: str):
-        async with AzureBlobController() as ab_c:
-            return await ab_c.delete_file(file_path)
+        # 内容寻址的对象可能被多条记录引用, 不随单条记录删除
+        if is_content_addressed_path(file_path):
+            return False
+        return await get_object_store().delete(file_path)
+
+    @staticmethod
+    async def stream_file(file_path: str, range_header: str = None, filename: str = None) -> Response:
+        """把对象内容以流的形式透传给客户端, 支持 Range 请求"""
+        return await get_object_store().stream_response(file_path, range_header, filename)
+
+    @staticmethod
+    async def stream_ali_oss_object(file_path: str, range_header: str = None, filename: str = None) -> Response:
+        """把阿里云 OSS 对象以流的形式透传给客户端, 支持 Range 请求"""
+        async with AliCloudOssBucketController() as oss_c:
+            if not (stat := await oss_c.get_object_stat_async(file_path)):
+                return Response(status_code=404)
+            return create_range_stream_response(
+                lambda offset, length: oss_c.iter_object_async(file_path, offset, length), stat.size, range_header,
+                media_type=stat.content_type, etag=stat.etag, filename=filename
+            )
 
     async def upload_image(
             self, parent: str, img_id: str, file: UploadFile, file_type: SupportImageMIMEType
-    ) -> tuple[str, AzureBlobUploadResult | None]:
+    ) -> tuple[str, ObjectPutResult | None]:
         *_, file_extension = file_type.value.split('/')
-        file_body = await file.read()
-        file_path = f'{self.root}/{parent}/{img_id}.{file_extension}'
-        upload_result = await self.upload_file(file_path, file_body)
+        if get_settings().UPLOAD_CONTENT_ADDRESSED:
+            # 路径由内容摘要决定, 与 parent / img_id 无关, 重复内容不会再次上传
+            async with RedisCacheController() as cache:
+                file_path, upload_result = await put_content_addressed(
+                    get_object_store(), cache, self.root, file, file_extension, file_type.value
+                )
+        else:
+            file_path = f'{self.root}/{parent}/{img_id}.{file_extension}'
+            # 直接从 UploadFile 分块读取上传, 不把整个文件读入内存
+            upload_result = await self.upload_stream(file_path, file, content_type=file_type.value)
+        # 衍生图在后台生成, 响应在原图写入后即返回
+        schedule_image_variants(get_object_store(), file_path, file_type.value)
         if upload_result and upload_result:
             return file_path, upload_result
         return file_path, None
@@ -282,12 +337,9 @@ class BaseWebsiteOssViewModel(BaseAdminViewModel, BaseOssViewModel):
 
     @staticmethod
     async def get_website_puck_render_pages(pages_render_path) -> dict:
-        async with AzureBlobController() as ab_c:
-            render_resource = await ab_c.get_object_async(pages_render_path)
-            resource_content: bytes = render_resource.read()
-            return json.loads(resource_content.decode('utf-8'))
+        resource_content: bytes = await get_object_store().get(pages_render_path)
+        return json.loads(resource_content.decode('utf-8'))
 
     @staticmethod
     async def update_website_puck_render_pages(pages_render_path: str, page_render: dict):
-        async with AzureBlobController() as ab_c:
-            return await ab_c.put_object_async(pages_render_path, json.dumps(page_render).encode())
+        return await get_object_store().put(pages_render_path, json.dumps(page_render).encode())
@@ -1,8 +1,12 @@
 import httpx
+from bson import ObjectId
 from fastapi import Request, HTTPException
+from fastapi.security.utils import get_authorization_scheme_param
 
 from app.libs.sso import generate_un_auth_exception, SSOProviderEnum
-from app.models.account import UserTypeEnum, UserStatusEnum, UserModel, UserProfile
+from app.libs.sso.azure import invalidate_user_profile
+from app.models.account import UserTypeEnum, UserStatusEnum, UserModel, UserProfile, UserListItemView
+from app.response import BaseCursorPaginationResponseDataType
 from app.view_models import BaseViewModel
 
 __all__ = (
@@ -10,6 +14,7 @@ __all__ = (
     'AccountAuthCallbackViewModel',
     'UserInfoQueryViewModel',
     'UserInfoListQueryViewModel',
+    'UserInfoListStreamViewModel',
     'ChangeUserStatusViewModel',
     'VerificationCodeSendViewModel',
 )
@@ -22,9 +27,11 @@ class UserLogoutViewModel(BaseViewModel):
 
     async def before(self):
         await super().before()
-        self.logout()
+        await self.logout()
 
-    def logout(self):
+    async def logout(self):
+        _, access_token = get_authorization_scheme_param(self.request.headers.get('Authorization'))
+        await invalidate_user_profile(access_token)
         self.operating_successfully('logged out successfully')
 
 
@@ -63,14 +70,46 @@ class UserInfoQueryViewModel(BaseViewModel):
 
 
 class UserInfoListQueryViewModel(BaseViewModel):
-    def __init__(self, request: Request):
-        super().__init__(request=request, access_title=[UserTypeEnum.BUYER, UserTypeEnum.SELLER])
+    """按 (affiliation, _id) 做 keyset 分页, 每页耗时与内存不随单位人数增长"""
+
+    def __init__(self, request: Request, user_profile: UserProfile, cursor: str = None, page_size: int = 50):
+        super().__init__(
+            request=request, user_profile=user_profile, access_title=[UserTypeEnum.BUYER, UserTypeEnum.SELLER]
+        )
+        self.cursor = cursor
+        self.page_size = page_size
+
+    async def before(self):
+        await super().before()
+        if self.cursor is not None and not ObjectId.is_valid(self.cursor):
+            self.illegal_parameters('invalid cursor')
+        users, next_cursor = await UserListItemView.find_page(
+            UserModel.affiliation == self.user_email, after=self.cursor, limit=self.page_size
+        )
+        self.operating_successfully(BaseCursorPaginationResponseDataType(
+            pageSize=self.page_size, nextCursor=next_cursor, hasMore=next_cursor is not None,
+            items=[user.information for user in users]
+        ))
+
+
+class UserInfoListStreamViewModel(BaseViewModel):
+    """以 NDJSON 输出单位下的全部用户, 服务端逐页读取, 内存占用只与 batch_size 有关"""
+
+    def __init__(self, request: Request, user_profile: UserProfile, batch_size: int = 500):
+        super().__init__(
+            request=request, user_profile=user_profile, access_title=[UserTypeEnum.BUYER, UserTypeEnum.SELLER]
+        )
+        self.batch_size = batch_size
 
     async def before(self):
         await super().before()
-        self.operating_successfully([user.information async for user in UserModel.find(
-            UserModel.affiliation == self.user_email
-        )])
+        self.operating_successfully(self.iter_information(self.user_email))
+
+    async def iter_information(self, affiliation: str):
+        async for user in UserModel.iter_pages(
+                UserModel.affiliation == affiliation, batch_size=self.batch_size, projection_model=UserListItemView
+        ):
+            yield user.information
 
 
 class ChangeUserStatusViewModel(BaseViewModel):
@@ -0,0 +1,80 @@
+"""
+离线校验 AzureBlobController.upload_stream 在读取不足时不会截断: 数据源的每次 read 只返回随机长度的一小段,
+检查单块上传或提交的块列表拼接后与原始数据逐字节一致\n
+使用内存中的假 Blob 客户端, 不需要 Azure 账号; 需要项目根目录下存在 .env 配置\n
+python -m benchmarks.azure_upload_check
+"""
+import asyncio
+import random
+
+from app.config import get_settings
+from app.libs.ctrl.cloud.azure import AzureBlobController
+
+
+class ShortReadFile:
+    """模拟 socket / 管道: EOF 之前 read 也可能只返回一部分数据"""
+
+    def __init__(self, body: bytes, asynchronous: bool):
+        self.body = body
+        self.position = 0
+        self.asynchronous = asynchronous
+
+    def _read(self, size: int) -> bytes:
+        size = random.randint(1, max(1, min(size, 64 * 1024)))
+        chunk = self.body[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def read(self, size: int = -1):
+        if not self.asynchronous:
+            return self._read(size)
+
+        async def read():
+            return self._read(size)
+
+        return read()
+
+
+class MemoryBlobClient:
+    def __init__(self):
+        self.staged: dict[str, bytes] = {}
+        self.committed: bytes | None = None
+
+    async def upload_blob(self, data: bytes, **kwargs) -> dict:
+        self.committed = data
+        return {'etag': 'single'}
+
+    async def stage_block(self, block_id: str, data: bytes, length: int):
+        assert len(data) == length
+        self.staged[block_id] = data
+
+    async def commit_block_list(self, blocks: list, **kwargs) -> dict:
+        self.committed = b''.join(self.staged[block.id] for block in blocks)
+        return {'etag': 'blocks'}
+
+
+class MemoryContainerClient:
+    def __init__(self):
+        self.blobs: dict[str, MemoryBlobClient] = {}
+
+    def get_blob_client(self, name: str) -> MemoryBlobClient:
+        return self.blobs.setdefault(name, MemoryBlobClient())
+
+
+async def main():
+    block_size = get_settings().AZURE_BLOB_BLOCK_SIZE
+    controller = AzureBlobController.__new__(AzureBlobController)
+    controller.container_client = MemoryContainerClient()
+    sizes = (0, 1, block_size - 1, block_size, block_size + 1, 3 * block_size + 7)
+    for size in sizes:
+        body = random.randbytes(size)
+        for asynchronous in (False, True):
+            name = f'check/{size}-{"async" if asynchronous else "sync"}'
+            await controller.upload_stream(name, ShortReadFile(body, asynchronous))
+            committed = controller.container_client.blobs[name].committed
+            assert committed == body, f'{name}: committed {len(committed or b"")} of {size} bytes'
+            print(f'{name:<32} {size:>10} bytes committed')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
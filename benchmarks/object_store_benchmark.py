@@ -0,0 +1,78 @@
+"""
+离线压测完整的上传路径: UploadFile -> BaseOssViewModel.upload_image -> ObjectStore, 以及整读与 Range 读\n
+使用 memory / local 后端, 不需要云账号; 需要项目根目录下存在 .env 配置\n
+--on-disk 时 UploadFile 已落盘, local 后端走 sendfile 复制\n
+python -m benchmarks.object_store_benchmark --requests 500 --size 1048576 --on-disk
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+from tempfile import SpooledTemporaryFile
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from app.libs.ctrl.storage import ObjectStore, LocalObjectStore, MemoryObjectStore, set_object_store
+from app.models import SupportImageMIMEType
+from app.view_models import BaseOssViewModel
+from benchmarks.oss_client_benchmark import run_concurrently, report
+
+RANGE_LENGTH = 64 * 1024
+
+
+def make_upload_files(total: int, body: bytes, on_disk: bool) -> list[UploadFile]:
+    """在计时之前准备好所有 UploadFile, max_size=1 时内容写入即落盘"""
+    files = []
+    for _ in range(total):
+        file = SpooledTemporaryFile(max_size=1 if on_disk else len(body) + 1)
+        file.write(body)
+        file.seek(0)
+        files.append(UploadFile(file=file, size=len(body), headers=Headers({'content-type': 'image/png'})))
+    return files
+
+
+async def bench_store(store: ObjectStore, total: int, body: bytes, on_disk: bool):
+    set_object_store(store)
+    await store.initialize()
+    view_model = BaseOssViewModel()
+    view_model.root = 'benchmark'
+    image_type = SupportImageMIMEType('image/png')
+    for concurrency in (1, 10, 100):
+        files = make_upload_files(total, body, on_disk)
+        report(f'{store.name} upload_image', concurrency, total, *await run_concurrently(
+            lambda i: view_model.upload_image(str(concurrency), str(i), files[i], image_type), total, concurrency
+        ))
+        for file in files:
+            await file.close()
+    keys = [key async for key in store.list_keys('benchmark/1/')]
+    cases = {
+        f'{store.name} get': lambda i: store.get(keys[i % len(keys)]),
+        f'{store.name} range 64KiB': lambda i: consume(store, keys[i % len(keys)], len(body)),
+    }
+    for name, func in cases.items():
+        for concurrency in (1, 10, 100):
+            report(name, concurrency, total, *await run_concurrently(func, total, concurrency))
+    await store.close()
+
+
+async def consume(store: ObjectStore, key: str, size: int):
+    offset = random.randrange(max(1, size - RANGE_LENGTH))
+    async for _ in store.stream(key, offset, RANGE_LENGTH):
+        pass
+
+
+async def main(total: int, size: int, on_disk: bool):
+    body = random.randbytes(size)
+    await bench_store(MemoryObjectStore(), total, body, on_disk)
+    with tempfile.TemporaryDirectory() as root:
+        await bench_store(LocalObjectStore(root), total, body, on_disk)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the upload path against the memory and local backends')
+    parser.add_argument('--requests', type=int, default=300, help='requests per case')
+    parser.add_argument('--size', type=int, default=512 * 1024, help='upload body size in bytes')
+    parser.add_argument('--on-disk', action='store_true', help='spool UploadFile bodies to disk before uploading')
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.size, args.on_disk))
@@ -0,0 +1,96 @@
+"""
+对比阿里云 OSS 两种调用路径的吞吐与延迟:\n
+threadpool: oss2 同步客户端 + run_in_threadpool (改造前的实现)\n
+native: AsyncOssBucket 本地签名 + 共享 httpx 连接池\n
+上传请求发往子进程中的本地 HTTP 服务, 不需要真实的 OSS 账号; 需要项目根目录下存在 .env 配置\n
+python -m benchmarks.oss_client_benchmark --requests 1000 --size 65536
+"""
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable
+
+import oss2
+from starlette.concurrency import run_in_threadpool
+
+from app.libs.ctrl.cloud.oss import AsyncOssBucket
+from app.libs.http_with_retry import close_http_clients
+
+ACCESS_KEY, ACCESS_SECRET, BUCKET_NAME = 'benchmark-key', 'benchmark-secret', 'benchmark'
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('ETag', '"benchmark"')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int):
+    ThreadingHTTPServer(('127.0.0.1', port), UploadHandler).serve_forever()
+
+
+async def run_concurrently(func: Callable[[int], Awaitable], total: int, concurrency: int) -> tuple[float, list]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await func(index)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start, latencies
+
+
+def report(name: str, concurrency: int, total: int, elapsed: float, latencies: list):
+    latencies.sort()
+    print(
+        f'{name:<22} c={concurrency:<4} {total / elapsed:>10.1f} ops/s  '
+        f'p50={statistics.median(latencies):>8.2f}ms  p99={latencies[int(len(latencies) * 0.99) - 1]:>8.2f}ms'
+    )
+
+
+async def main(total: int, size: int, port: int):
+    base_url = f'http://127.0.0.1:{port}'
+    sync_bucket = oss2.Bucket(oss2.Auth(ACCESS_KEY, ACCESS_SECRET), base_url, BUCKET_NAME, is_cname=True)
+    async_bucket = AsyncOssBucket(ACCESS_KEY, ACCESS_SECRET, BUCKET_NAME, '', base_url=base_url)
+    body = b'x' * size
+
+    cases = {
+        'sign_url threadpool': lambda i: run_in_threadpool(sync_bucket.sign_url, 'GET', f'bench/{i}.png', 60),
+        'sign_url native': lambda i: asyncio.sleep(0, async_bucket.sign_url('GET', f'bench/{i}.png', 60)),
+        'put_object threadpool': lambda i: run_in_threadpool(sync_bucket.put_object, f'bench/{i}.bin', body),
+        'put_object native': lambda i: async_bucket.put_object(f'bench/{i}.bin', body),
+    }
+    for name, func in cases.items():
+        for concurrency in (1, 10, 100):
+            report(name, concurrency, total, *await run_concurrently(func, total, concurrency))
+    await close_http_clients()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark OSS threadpool path against the native async client')
+    parser.add_argument('--requests', type=int, default=500, help='requests per case')
+    parser.add_argument('--size', type=int, default=64 * 1024, help='upload body size in bytes')
+    parser.add_argument('--port', type=int, default=18765, help='local mock server port')
+    args = parser.parse_args()
+    server = multiprocessing.Process(target=serve, args=(args.port,), daemon=True)
+    server.start()
+    time.sleep(0.5)
+    try:
+        asyncio.run(main(args.requests, args.size, args.port))
+    finally:
+        server.terminate()
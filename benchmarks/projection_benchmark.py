@@ -0,0 +1,94 @@
+"""
+对比完整读取与投影视图读取的每条文档开销:\n
+validation: 本地 BSON 解码 + pydantic 校验, 不经过网络, 只衡量客户端 CPU\n
+find: 带网络的 find().to_list(), 包含服务端投影减少的传输量\n
+测试数据写入 {MONGODB_DB}_benchmark 库, 结束后删除; 需要项目根目录下存在 .env 配置与可连接的 MongoDB\n
+python -m benchmarks.projection_benchmark --documents 5000 --rounds 5
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+import bson
+from beanie import init_beanie
+from beanie.odm.utils.projection import get_projection
+from pymongo import AsyncMongoClient
+
+from app.config import get_settings
+from app.models.account import UserModel, UserSummary, UserListItemView, UserTypeEnum, UserStatusEnum
+
+VIEWS = (UserModel, UserListItemView, UserSummary)
+
+
+def make_user(index: int) -> dict:
+    """与线上文档结构一致, company 中带一段较长的公司介绍"""
+    return {
+        '_id': bson.ObjectId(), 'ssoUid': f'sso-{index}', 'email': f'user{index}@example.com',
+        'name': f'User {index}', 'username': f'user{index}', 'userType': UserTypeEnum.SELLER.value,
+        'affiliation': 'benchmark', 'status': UserStatusEnum.ACTIVE.value,
+        'createdAt': datetime.now(), 'updatedAt': datetime.now(),
+        'company': {
+            'companyName': {'en': f'Company {index}', 'tc': f'公司 {index}', 'sc': f'公司 {index}'},
+            'companyLogo': f'https://example.com/logo/{index}.png',
+            'companyProfile': 'Lorem ipsum dolor sit amet. ' * 80,
+            'companyCountry': 'HK', 'companyWebsite': f'https://company{index}.example.com',
+            'companyBoothNo': f'1A-{index:04d}',
+        },
+    }
+
+
+def project(document: dict, model) -> dict:
+    if model is UserModel:
+        return document
+    return {key: value for key, value in document.items() if key in get_projection(model)}
+
+
+def bench_validation(model, documents: list[dict], rounds: int) -> tuple[int, float]:
+    """返回每条文档的 BSON 大小与最快一轮的解码加校验耗时 (微秒)"""
+    encoded = [bson.encode(project(document, model)) for document in documents]
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for data in encoded:
+            model.model_validate(bson.decode(data))
+        best = min(best, time.perf_counter() - start)
+    return sum(map(len, encoded)) // len(encoded), best / len(encoded) * 1e6
+
+
+async def bench_find(model, total: int, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await model.find().to_list()
+        best = min(best, time.perf_counter() - start)
+    return best / total * 1e6
+
+
+async def main(total: int, rounds: int):
+    settings = get_settings()
+    client = AsyncMongoClient(
+        host=settings.MONGODB_URI, port=settings.MONGODB_PORT, username=settings.MONGODB_USERNAME,
+        password=settings.MONGODB_PASSWORD, authSource=settings.MONGODB_AUTHENTICATION_SOURCE
+    )
+    database = client[f'{settings.MONGODB_DB}_benchmark']
+    await init_beanie(database=database, document_models=[UserModel], skip_indexes=True)
+    documents = [make_user(i) for i in range(total)]
+    try:
+        for model in VIEWS:
+            size, cost = bench_validation(model, documents, rounds)
+            print(f'validation {model.__name__:<18} {size:>6} B/doc  {cost:>8.2f} us/doc')
+        await UserModel.get_pymongo_collection().insert_many(documents)
+        for model in VIEWS:
+            print(f'find       {model.__name__:<18} {await bench_find(model, total, rounds):>8.2f} us/doc')
+    finally:
+        await client.drop_database(database.name)
+        await client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark full document reads against projection views')
+    parser.add_argument('--documents', type=int, default=5000, help='documents per case')
+    parser.add_argument('--rounds', type=int, default=5, help='rounds per case, the fastest one is reported')
+    args = parser.parse_args()
+    asyncio.run(main(args.documents, args.rounds))